@@ -0,0 +1,190 @@
+"""
+Correctness checks of the inference optimizations on small synthetic inputs, which need neither a dataset nor trained
+weights:
+
+  python -m benchmarks.checks                    # run all the checks, exits with 1 if one fails
+  python -m benchmarks.checks --filter quant     # run the checks matching a regular expression
+
+A check raises an AssertionError when it fails. Checks whose optional dependencies are missing, e.g.
+torch.ao.quantization on older PyTorch versions, are skipped.
+"""
+import argparse
+import re
+import sys
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+from config import get_cfg
+
+CHECKS = OrderedDict()
+
+
+class SkipCheck(Exception):
+  pass
+
+
+def check(name):
+  """
+  Registers a check, a function without arguments that raises an AssertionError on failure or SkipCheck.
+  """
+  def register(fn):
+    CHECKS[name] = fn
+    return fn
+  return register
+
+
+def small_network(tw=8, seed=0):
+  """
+  :return: SaliencyNetwork with a resnet10 backbone and random weights in eval mode
+  """
+  from network.models import SaliencyNetwork
+  cfg = get_cfg()
+  cfg.MODEL.BACKBONE.NAME = 'resnet10'
+  cfg.MODEL.DECODER.MDIM = 32
+  cfg.INPUT.TW = tw
+  torch.manual_seed(seed)
+  model = SaliencyNetwork(cfg)
+  # random BatchNorm statistics, so that the folded and quantized convolutions are not trivial
+  for m in model.modules():
+    if isinstance(m, torch.nn.BatchNorm3d):
+      m.running_mean.uniform_(-0.1, 0.1)
+      m.running_var.uniform_(0.5, 1.5)
+  return model.eval()
+
+
+@check('quantize_network')
+def check_quantize_network():
+  try:
+    from network.quantization import quantize_network
+  except ImportError as e:
+    raise SkipCheck(str(e))
+  model = small_network()
+  torch.manual_seed(1)
+  inputs = [torch.rand(1, 3, 8, 128, 128) for _ in range(3)]
+  with torch.no_grad():
+    expected = [F.softmax(model(x)[0].float(), dim=1) for x in inputs]
+  model = quantize_network(model, inputs[:2])
+  with torch.no_grad():
+    actual = [F.softmax(model(x)[0].float(), dim=1) for x in inputs]
+  for e, a in zip(expected, actual):
+    assert e.shape == a.shape, "Quantized output {} instead of {}".format(tuple(a.shape), tuple(e.shape))
+    assert torch.isfinite(a).all(), "Quantized output is not finite"
+  diff = max([float((e - a).abs().mean()) for e, a in zip(expected, actual)])
+  assert diff < 0.1, "Mean probability difference {:.4f} of the quantized network".format(diff)
+  return 'mean probability difference {:.4f}'.format(diff)
+
+
+class FirstClipUniform(nn.Module):
+  """
+  Prediction head whose logits are confidently uniform for the first clip of the batch and returned in bf16, as a coarse
+  head under autocast can return them.
+  """
+
+  def __init__(self, head):
+    super(FirstClipUniform, self).__init__()
+    self.head = head
+
+  def forward(self, x):
+    p = self.head(x).clone()
+    p[:1] = 0
+    p[:1, 0] = 20
+    return p.to(torch.bfloat16)
+
+
+@check('early_exit_mixed_dtypes')
+def check_early_exit_mixed_dtypes():
+  from network.early_exit import decode_early_exit
+  model = small_network()
+  decoder = model.decoders[0]
+  torch.manual_seed(1)
+  with torch.no_grad():
+    r5, r4, r3, r2 = model.encoder(torch.rand(2, 3, 8, 128, 128))
+    expected = decoder.forward(r5, r4, r3, r2, None)
+    decoder.pred5 = FirstClipUniform(decoder.pred5)
+    output, levels = decode_early_exit(decoder, r5, r4, r3, r2, threshold=0.99, heads=(5,))
+  assert levels.tolist() == [5, 2], "Exit levels {} instead of [5, 2]".format(levels.tolist())
+  assert output.dtype == torch.float32, "Logits in {} instead of float32".format(output.dtype)
+  assert (output[0].argmax(dim=0) == 0).all(), "The clip that exited early is not uniform background"
+  diff = float((output[1] - expected[1]).abs().max())
+  assert diff < 1e-4, "The clip that ran the full decoder differs by {:.2e}".format(diff)
+  return 'full decoder difference {:.2e}'.format(diff)
+
+
+def sklearn_f_max(scores, targets):
+  """
+  :return: F-max on the raw scores as computed by the evaluation before HistogramEvaluator
+  """
+  from sklearn.metrics import precision_recall_curve
+  precision, recall, _ = precision_recall_curve(targets, scores)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    f = 2 * (precision * recall) / (precision + recall)
+  return np.nanmax(f)
+
+
+@check('histogram_evaluator')
+def check_histogram_evaluator():
+  from inference_handlers.infer_utils.evaluator import HistogramEvaluator
+  rng = np.random.RandomState(0)
+  # frames with a foreground blob, scored by noisy probabilities and by their binary argmax
+  targets = np.zeros((8, 64, 96), dtype=np.uint8)
+  targets[:, 16:48, 24:64] = 1
+  probs = np.clip(0.6 * targets + 0.4 * rng.rand(*targets.shape) + 0.1 * rng.randn(*targets.shape), 0, 1)
+  results = []
+  for num_bins in [256, get_cfg().INFERENCE.EVAL_BINS]:
+    for name, scores in [('probabilities', probs), ('argmax', (probs > 0.5).astype(np.float64))]:
+      evaluator = HistogramEvaluator(num_bins)
+      # per frame updates, merged as for the videos of the engine
+      for t in range(len(scores)):
+        frame_evaluator = HistogramEvaluator(num_bins)
+        frame_evaluator.update(scores[t], targets[t])
+        evaluator.merge(frame_evaluator)
+      expected_f = sklearn_f_max(scores.flatten(), targets.flatten())
+      expected_mae = np.abs(scores - targets).mean()
+      f_error = expected_f - evaluator.f_max()
+      bound = 0.0 if name == 'argmax' else evaluator.f_max_error_bound()
+      assert -1e-9 <= f_error <= bound + 1e-9, "{} bins, {}: F-max {:.6f} instead of {:.6f}, bound {:.6f}".format(
+        num_bins, name, evaluator.f_max(), expected_f, bound)
+      assert abs(evaluator.mae() - expected_mae) < 1e-9, "{} bins, {}: MAE {:.6f} instead of {:.6f}".format(
+        num_bins, name, evaluator.mae(), expected_mae)
+      results += ['{} bins {}: F error {:.2e} (bound {:.2e})'.format(num_bins, name, f_error, bound)]
+  return ', '.join(results)
+
+
+def run_checks(pattern=None):
+  """
+  :return: list of the names of the failed checks
+  """
+  failed = []
+  for name, fn in CHECKS.items():
+    if pattern is not None and re.search(pattern, name) is None:
+      continue
+    np.random.seed(0)
+    torch.manual_seed(0)
+    try:
+      result = fn()
+      print("PASS {}{}".format(name, ': {}'.format(result) if result else ''), flush=True)
+    except SkipCheck as e:
+      print("SKIP {}: {}".format(name, e), flush=True)
+    except Exception:
+      print("FAIL {}\n{}".format(name, traceback.format_exc()), flush=True)
+      failed += [name]
+  return failed
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Correctness checks of the inference optimizations')
+  parser.add_argument('--filter', default=None, type=str, help='regular expression of the checks to run')
+  args = parser.parse_args()
+  failed = run_checks(args.filter)
+  if len(failed) > 0:
+    print("{} checks failed: {}".format(len(failed), ', '.join(failed)))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
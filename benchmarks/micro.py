@@ -0,0 +1,275 @@
+"""
+Micro-benchmarks of the helpers on the hot path of data loading and training, on fixed synthetic inputs:
+
+  python -m benchmarks.micro run                 # print the timings
+  python -m benchmarks.micro save                # store them as the baseline
+  python -m benchmarks.micro compare             # compare with the baseline, exits with 1 on a regression
+
+Every benchmark reseeds random, numpy, imgaug and torch before it is timed, so that the random crops and
+augmentations do the same work in every run. The median time per call over --repeat rounds is compared against the
+baseline, and a benchmark is flagged as a regression if it is slower by more than --threshold (a fraction). Baselines
+are only comparable on the same machine and library versions, which are stored with them.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+from collections import OrderedDict
+
+import cv2
+import imgaug
+import numpy as np
+import torch
+
+from benchmarks.synthetic import make_frame
+from config import get_cfg
+from datasets.BaseDataset import VideoDataset
+from datasets.utils.OclussionAug import occlude_with_objects
+from datasets.utils.Util import generate_clip_from_image
+from loss.loss_utils import bootstrapped_ce_loss, calc_iou, compute_loss
+from utils.Constants import PRED_LOGITS
+from utils.Resize import ResizeMode, resize
+from utils.util import iou_fixed, iou_fixed_torch
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'micro.json')
+# DAVIS 480p frames, 8 frame clips and the training crop of run_configs/bmvc_final.yaml
+FRAME_SHAPE = (480, 854)
+TW = 8
+RESIZE_SHAPE = (480, 854)
+# modes implemented by utils.Resize.resize, the others fail with an assertion
+RESIZE_MODES = [ResizeMode.UNCHANGED, ResizeMode.FIXED_SIZE, ResizeMode.RANDOM_RESIZE_AND_CROP,
+                ResizeMode.RANDOM_RESIZE_AND_OBJECT_CROP, ResizeMode.RESIZE_AND_OBJECT_CROP,
+                ResizeMode.RESIZE_SHORT_EDGE, ResizeMode.RESIZE_SHORT_EDGE_AND_CROP]
+# batch of the loss benchmarks: B x C x T x H x W
+LOSS_SHAPE = (2, 2, TW, 256, 448)
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+  """
+  Registers a benchmark. The decorated function creates the inputs and returns the function that is timed.
+  """
+  def register(setup):
+    BENCHMARKS[name] = setup
+    return setup
+  return register
+
+
+def seed_all(seed):
+  random.seed(seed)
+  np.random.seed(seed)
+  imgaug.seed(seed)
+  torch.manual_seed(seed)
+
+
+def make_clip(shape=FRAME_SHAPE, tw=TW, seed=0):
+  """
+  :return: frames (tw x h x w x 3) and masks (tw x h x w) of a synthetic clip, see benchmarks.synthetic
+  """
+  rng = np.random.RandomState(seed)
+  background = rng.randint(0, 256, shape + (3,)).astype(np.uint8)
+  rng_state = (background, rng.uniform(-4, 4, 2), rng.uniform(0.1, 0.3, 2) * np.array(shape))
+  frames, masks = zip(*[make_frame(shape, t, rng_state) for t in range(tw)])
+  return np.stack(frames), np.stack(masks)
+
+
+def make_logits(shape=LOSS_SHAPE, seed=0):
+  """
+  :return: logits (B x C x T x H x W) that roughly agree with the returned binary masks (B x 1 x T x H x W)
+  """
+  generator = torch.Generator().manual_seed(seed)
+  masks = (torch.rand((shape[0], 1) + shape[2:], generator=generator) > 0.7).float()
+  logits = torch.randn(shape, generator=generator)
+  logits[:, -1:] += 4 * masks - 2
+  return logits, masks
+
+
+for _mode in RESIZE_MODES:
+  @benchmark('resize/{}'.format(_mode.value))
+  def bench_resize(mode=_mode):
+    frames, masks = make_clip(tw=1)
+    return lambda: resize({'image': frames[0], 'mask': masks[0]}, mode, RESIZE_SHAPE)
+
+
+@benchmark('VideoDataset.pad_tensors')
+def bench_pad_tensors():
+  frames, masks = make_clip()
+  # pad_tensors and normalise do not depend on the state of the dataset
+  return lambda: VideoDataset.pad_tensors(None, {'images': frames, 'targets': masks, 'info': [{}]})
+
+
+@benchmark('VideoDataset.normalise')
+def bench_normalise():
+  frames, masks = make_clip()
+  return lambda: VideoDataset.normalise(None, {'images': frames, 'targets': masks})
+
+
+@benchmark('generate_clip_from_image')
+def bench_generate_clip_from_image():
+  frames, masks = make_clip(tw=1)
+  return lambda: generate_clip_from_image(frames[0], masks[0][..., None], TW)
+
+
+@benchmark('occlude_with_objects')
+def bench_occlude_with_objects():
+  frames, masks = make_clip(tw=1)
+  # RGBA occluders with a soft border, as returned by load_occluders
+  occluders = []
+  for i, size in enumerate([(60, 90), (120, 80), (100, 140)]):
+    image, mask = make_clip(size, tw=1, seed=i + 1)
+    alpha = mask[0] * 255
+    alpha[cv2.erode(alpha, np.ones((8, 8), np.uint8)) < alpha] = 192
+    occluders += [np.concatenate([image[0], alpha[..., None]], axis=-1)]
+  # the images are modified in place
+  return lambda: occlude_with_objects([frames[0].copy(), masks[0].copy()], occluders)
+
+
+@benchmark('calc_iou')
+def bench_calc_iou():
+  logits, masks = make_logits()
+  probs = torch.softmax(logits, dim=1)
+  return lambda: calc_iou(probs, masks.squeeze(1))
+
+
+@benchmark('iou_fixed')
+def bench_iou_fixed():
+  logits, masks = make_logits()
+  # T x C x H x W as in the evaluation of a single clip
+  probs = torch.softmax(logits[0], dim=0).transpose(0, 1).numpy()
+  return lambda: iou_fixed(probs, masks[0, 0].numpy())
+
+
+@benchmark('iou_fixed_torch')
+def bench_iou_fixed_torch():
+  logits, masks = make_logits()
+  probs = torch.softmax(logits, dim=1)
+  return lambda: iou_fixed_torch(probs, masks.squeeze(1))
+
+
+@benchmark('bootstrapped_ce_loss')
+def bench_bootstrapped_ce_loss():
+  logits, masks = make_logits()
+  raw_ce = torch.nn.functional.binary_cross_entropy_with_logits(logits[:, -1], masks.squeeze(1), reduction='none')
+  return lambda: bootstrapped_ce_loss(raw_ce)
+
+
+for _bootstrap in [False, True]:
+  @benchmark('compute_loss' + ('/bootstrap' if _bootstrap else ''))
+  def bench_compute_loss(bootstrap=_bootstrap):
+    cfg = get_cfg()
+    cfg.TRAINING.LOSSES.BOOTSTRAP = bootstrap
+    cfg.freeze()
+    logits, masks = make_logits()
+    return lambda: compute_loss({'input': logits}, {PRED_LOGITS: logits}, {'mask': masks}, cfg)
+
+
+def time_function(function, repeat=5, min_time=0.2):
+  """
+  Times function in repeat rounds, each of which calls it often enough to take at least min_time seconds.
+
+  :return: median and minimum time per call in seconds, and the number of calls per round
+  """
+  # warm up and calibrate the number of calls per round
+  start = time.perf_counter()
+  function()
+  number = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    for _ in range(number):
+      function()
+    times += [(time.perf_counter() - start) / number]
+  return float(np.median(times)), float(np.min(times)), number
+
+
+def run_benchmarks(pattern=None, repeat=5, min_time=0.2, seed=0):
+  results = OrderedDict()
+  for name, setup in BENCHMARKS.items():
+    if pattern is not None and re.search(pattern, name) is None:
+      continue
+    seed_all(seed)
+    function = setup()
+    seed_all(seed)
+    median, minimum, number = time_function(function, repeat, min_time)
+    results[name] = {'median_ms': 1000 * median, 'min_ms': 1000 * minimum, 'number': number, 'repeat': repeat}
+    print('{:<40} {:>10.3f} ms'.format(name, 1000 * median), flush=True)
+  return results
+
+
+def environment():
+  return {'python': platform.python_version(), 'numpy': np.__version__, 'torch': torch.__version__,
+          'machine': platform.machine(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+          'torch_threads': torch.get_num_threads()}
+
+
+def compare(results, baseline, threshold):
+  """
+  :return: report lines of the benchmarks in results, and the names of the benchmarks that are slower than in the
+           baseline by more than threshold
+  """
+  lines = ['{:<40} {:>12} {:>12} {:>8}'.format('benchmark', 'baseline ms', 'current ms', 'ratio')]
+  regressions = []
+  for name, result in results.items():
+    if name not in baseline['benchmarks']:
+      lines += ['{:<40} {:>12} {:>12.3f} {:>8}'.format(name, '-', result['median_ms'], 'new')]
+      continue
+    reference = baseline['benchmarks'][name]['median_ms']
+    ratio = result['median_ms'] / max(reference, 1e-9)
+    flag = ''
+    if ratio > 1 + threshold:
+      regressions += [name]
+      flag = '  REGRESSION'
+    lines += ['{:<40} {:>12.3f} {:>12.3f} {:>7.2f}x{}'.format(name, reference, result['median_ms'], ratio, flag)]
+  return lines, regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Micro-benchmarks of the data loading and loss helpers')
+  parser.add_argument('mode', choices=['run', 'save', 'compare'])
+  parser.add_argument('--baseline', default=DEFAULT_BASELINE, type=str, help='JSON file of the baseline')
+  parser.add_argument('--threshold', default=0.1, type=float,
+                      help='slowdown relative to the baseline that is flagged as a regression')
+  parser.add_argument('--filter', default=None, type=str, help='regular expression of the benchmarks to run')
+  parser.add_argument('--repeat', default=5, type=int)
+  parser.add_argument('--min_time', default=0.2, type=float, help='minimum time of a round in seconds')
+  parser.add_argument('--num_threads', default=1, type=int, help='torch threads, 0 keeps the default')
+  parser.add_argument('--seed', default=0, type=int)
+  args = parser.parse_args()
+
+  if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+  if args.mode == 'compare' and not os.path.exists(args.baseline):
+    parser.error("No baseline at {}, create one with the save mode".format(args.baseline))
+  results = run_benchmarks(args.filter, args.repeat, args.min_time, args.seed)
+
+  if args.mode == 'save':
+    baseline = {'environment': environment(), 'benchmarks': results}
+    # keep the benchmarks that were filtered out
+    if args.filter is not None and os.path.exists(args.baseline):
+      with open(args.baseline) as f:
+        previous = json.load(f)['benchmarks']
+      baseline['benchmarks'] = OrderedDict(list(previous.items()) + list(results.items()))
+    if os.path.dirname(args.baseline) and not os.path.exists(os.path.dirname(args.baseline)):
+      os.makedirs(os.path.dirname(args.baseline))
+    with open(args.baseline, 'w') as f:
+      json.dump(baseline, f, indent=2)
+    print("Saved the baseline of {} benchmarks to {}".format(len(results), args.baseline))
+  elif args.mode == 'compare':
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline['environment'] != environment():
+      print("WARNING: the baseline was recorded in a different environment {}".format(baseline['environment']))
+    lines, regressions = compare(results, baseline, args.threshold)
+    print('\n'.join(lines))
+    if len(regressions) > 0:
+      print("{} regressions beyond {:.0%}: {}".format(len(regressions), args.threshold, ', '.join(regressions)))
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
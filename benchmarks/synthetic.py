@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from util import color_map
+
+
+def make_frame(shape, t, rng_state):
+  """
+  :return: RGB frame with a textured background and an ellipse moving over it, and the binary mask of the ellipse
+  """
+  h, w = shape
+  background, velocity, radius = rng_state
+  y, x = np.mgrid[0:h, 0:w]
+  cy = (h / 2 + velocity[0] * t) % h
+  cx = (w / 2 + velocity[1] * t) % w
+  mask = ((y - cy) / radius[0]) ** 2 + ((x - cx) / radius[1]) ** 2 <= 1
+  image = np.roll(background, (t, 2 * t), axis=(0, 1)).copy()
+  image[mask] = (255 - image[mask]) // 2 + 64
+  return image, mask.astype(np.uint8)
+
+
+def make_davis_dataset(root, num_videos=4, num_frames=24, shape=(128, 224), seed=0, imset='2017/val.txt'):
+  """
+  Writes a synthetic dataset in the DAVIS layout that the Davis dataset class can read:
+
+    root/JPEGImages/480p/<video>/<frame>.jpg
+    root/Annotations_unsupervised/480p/<video>/<frame>.png
+    root/ImageSets/<imset>
+
+  Every video shows an ellipse moving over a textured background, which is the foreground of the masks.
+
+  :return: list of the video names
+  """
+  rng = np.random.RandomState(seed)
+  palette = color_map().flatten().tolist()
+  videos = ['synthetic-{:03d}'.format(i) for i in range(num_videos)]
+  for video in videos:
+    image_dir = os.path.join(root, 'JPEGImages', '480p', video)
+    mask_dir = os.path.join(root, 'Annotations_unsupervised', '480p', video)
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(mask_dir, exist_ok=True)
+    # low frequency texture, so that the JPEGs are about as expensive to decode as natural images
+    noise = rng.randint(0, 256, (shape[0] // 8 + 1, shape[1] // 8 + 1, 3)).astype(np.uint8)
+    background = np.array(Image.fromarray(noise).resize((shape[1], shape[0]), Image.BILINEAR))
+    rng_state = (background, rng.uniform(-4, 4, 2), rng.uniform(0.1, 0.3, 2) * np.array(shape))
+    for t in range(num_frames):
+      image, mask = make_frame(shape, t, rng_state)
+      Image.fromarray(image).save(os.path.join(image_dir, '{:05d}.jpg'.format(t)), quality=90)
+      mask = Image.fromarray(mask, mode='P')
+      mask.putpalette(palette)
+      mask.save(os.path.join(mask_dir, '{:05d}.png'.format(t)))
+
+  imset_file = os.path.join(root, 'ImageSets', imset)
+  os.makedirs(os.path.dirname(imset_file), exist_ok=True)
+  with open(imset_file, 'w') as f:
+    f.write('\n'.join(videos) + '\n')
+  return videos
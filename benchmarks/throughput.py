@@ -0,0 +1,145 @@
+"""
+End-to-end inference throughput on a synthetic DAVIS-layout dataset, without the real datasets or a GPU:
+
+  python -m benchmarks.throughput --num_videos 4 --num_frames 24 --height 128 --width 224
+
+The synthetic dataset is read by the Davis dataset class through the DataLoader of SaliencyInferenceEngine, and the
+network is built from the config (by default the tiny CPU-sized network of run_configs/benchmark_tiny.yaml, with
+random weights unless --wts is given). Frames/s, clips/s, the peak RSS and the time spent in every stage of the
+pipeline (from the trace of INFERENCE.TRACE) are printed and optionally written to a JSON file.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+import torch
+
+from benchmarks.synthetic import make_davis_dataset
+from config import get_cfg
+from inference_handlers.Engine import SaliencyInferenceEngine
+from utils.Saver import load_weightsV2
+from utils.util import get_model, get_test_dataset
+
+
+def stage_times(trace_path):
+  """
+  :return: dict of (process, stage) -> (total seconds, number of spans) from a trace written by utils.tracing, where
+           process is 'main' for the inference process and its threads and 'workers' for the DataLoader workers
+  """
+  with open(trace_path) as f:
+    events = json.load(f)['traceEvents']
+  process_names = dict([(e['pid'], e['args']['name']) for e in events if e['ph'] == 'M'])
+  stages = defaultdict(lambda: [0.0, 0])
+  for e in events:
+    if e['ph'] != 'X':
+      continue
+    process = 'main' if process_names.get(e['pid']) == 'MainProcess' else 'workers'
+    stages[(process, e['name'])][0] += e['dur'] / 1e6
+    stages[(process, e['name'])][1] += 1
+  return dict([(k, tuple(v)) for k, v in stages.items()])
+
+
+def peak_rss_mb():
+  """
+  :return: peak resident set size of this process and of its largest child process (the DataLoader workers) in MB
+  """
+  # ru_maxrss is in KB on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, \
+         resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+
+
+def run_benchmark(cfg, root, wts=None):
+  cfg.defrost()
+  cfg.DATASETS.TEST = "Davis"
+  cfg.DATASETS.TEST_ROOT = root
+  cfg.INFERENCE.TRACE = True
+  cfg.freeze()
+
+  dataset = get_test_dataset(cfg)
+  model = get_model(cfg)
+  if wts is not None:
+    model, _, _, _ = load_weightsV2(model, None, wts, None, map_location='cpu')
+  num_params = sum([p.numel() for p in model.parameters()])
+
+  results_dir = os.path.join(root, 'results')
+  engine = SaliencyInferenceEngine(cfg, results_dir=results_dir)
+  start = time.time()
+  engine.infer(dataset, model)
+  elapsed = time.time() - start
+
+  num_frames = sum([dataset.num_frames[video] for video in dataset.get_video_ids()])
+  rss, workers_rss = peak_rss_mb()
+  stages = stage_times(os.path.join(results_dir, 'trace.json'))
+  return {'network': cfg.MODEL.NETWORK, 'backbone': cfg.MODEL.BACKBONE.NAME, 'num_params': num_params,
+          'device': cfg.INFERENCE.DEVICE, 'num_workers': cfg.DATALOADER.NUM_WORKERS,
+          'batch_size': cfg.INFERENCE.BATCH_SIZE, 'num_videos': len(dataset.get_video_ids()),
+          'num_frames': num_frames, 'num_clips': engine.num_clips, 'seconds': elapsed,
+          'frames_per_second': num_frames / elapsed, 'clips_per_second': engine.num_clips / elapsed,
+          'peak_rss_mb': rss, 'peak_worker_rss_mb': workers_rss,
+          'stages': [{'process': process, 'stage': stage, 'seconds': seconds, 'count': count,
+                      'ms_per_clip': 1000 * seconds / max(engine.num_clips, 1)}
+                     for (process, stage), (seconds, count) in sorted(stages.items(), key=lambda s: -s[1][0])]}
+
+
+def format_report(report):
+  lines = ['{network} ({backbone}, {num_params} parameters) on {device}, {num_workers} workers, batch size '
+           '{batch_size}'.format(**report),
+           '{num_videos} videos, {num_frames} frames, {num_clips} clips in {seconds:.2f}s'.format(**report),
+           'frames/s: {frames_per_second:.2f}  clips/s: {clips_per_second:.2f}'.format(**report),
+           'peak RSS: {peak_rss_mb:.0f} MB (largest worker {peak_worker_rss_mb:.0f} MB)'.format(**report),
+           '', '{:<8} {:<14} {:>10} {:>8} {:>12}'.format('process', 'stage', 'seconds', 'count', 'ms/clip')]
+  lines += ['{process:<8} {stage:<14} {seconds:>10.3f} {count:>8} {ms_per_clip:>12.2f}'.format(**s)
+            for s in report['stages']]
+  return '\n'.join(lines)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='End-to-end inference throughput on a synthetic dataset')
+  parser.add_argument('--config', '-c', default='run_configs/benchmark_tiny.yaml', type=str)
+  parser.add_argument('--wts', '-w', default=None, type=str, help='weights of the network, random if not given')
+  parser.add_argument('--device', default=None, type=str, help='overrides INFERENCE.DEVICE')
+  parser.add_argument('--num_workers', default=None, type=int, help='overrides DATALOADER.NUM_WORKERS')
+  parser.add_argument('--batch_size', default=None, type=int, help='overrides INFERENCE.BATCH_SIZE')
+  parser.add_argument('--num_videos', default=4, type=int)
+  parser.add_argument('--num_frames', default=24, type=int)
+  parser.add_argument('--height', default=128, type=int)
+  parser.add_argument('--width', default=224, type=int)
+  parser.add_argument('--seed', default=0, type=int)
+  parser.add_argument('--root', default=None, type=str,
+                      help='directory of the synthetic dataset and the results, a temporary directory by default')
+  parser.add_argument('--output', default=None, type=str, help='JSON file the report is written to')
+  args = parser.parse_args()
+
+  cfg = get_cfg()
+  cfg.merge_from_file(args.config)
+  if args.device is not None:
+    cfg.INFERENCE.DEVICE = args.device
+  if args.num_workers is not None:
+    cfg.DATALOADER.NUM_WORKERS = args.num_workers
+  if args.batch_size is not None:
+    cfg.INFERENCE.BATCH_SIZE = args.batch_size
+  if torch.device(cfg.INFERENCE.DEVICE).type == 'cpu' and cfg.INFERENCE.NUM_THREADS > 0:
+    torch.set_num_threads(cfg.INFERENCE.NUM_THREADS)
+
+  root = tempfile.mkdtemp(prefix='benchmark_') if args.root is None else args.root
+  try:
+    make_davis_dataset(root, args.num_videos, args.num_frames, (args.height, args.width), args.seed,
+                       imset=cfg.DATASETS.IMSET)
+    report = run_benchmark(cfg, root, args.wts)
+  finally:
+    if args.root is None:
+      shutil.rmtree(root, ignore_errors=True)
+  report['frame_shape'] = [args.height, args.width]
+  print(format_report(report))
+  if args.output is not None:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -19,6 +19,8 @@ _C.MODEL.WEIGHTS = ""
 _C.MODEL.DECODER = CN()
 _C.MODEL.DECODER.INTER_BLOCK = "GC3d"
 _C.MODEL.DECODER.REFINE_BLOCK = "Refine3d"
+# number of channels of the decoder
+_C.MODEL.DECODER.MDIM = 256
 
 # Values to be used for image normalization (RGB order, since INPUT.FORMAT defaults to RGB).
 # ImageNet: [103.530, 116.280, 123.675]
@@ -89,6 +91,15 @@ _C.DATASETS.TEST_ROOT = ""
 _C.DATASETS.RANDOM_INSTANCE = False
 # max temporal gap to use while sampling input frames
 _C.DATASETS.MAX_TEMPORAL_GAP = 8
+# budget in MB of the LRU cache of decoded frames of every process reading a dataset, 0 disables it. Overlapping
+# clips share their frames, which are then decoded (and for the deterministic resize modes resized) only once.
+_C.DATASETS.FRAME_CACHE_MB = 0
+# frame stores written by datasets.utils.FrameStore, from which the frames are read instead of decoding the files
+_C.DATASETS.TRAIN_FRAME_STORE = ""
+_C.DATASETS.TEST_FRAME_STORE = ""
+# directory of the cached sample indices of the datasets, which are rebuilt when the dataset directories change. Empty
+# to scan the dataset on every start
+_C.DATASETS.INDEX_CACHE_DIR = ""
 
 # DAVIS parameters
 _C.DATASETS.IMSET = "2017/val.txt"
@@ -102,6 +113,110 @@ _C.INFERENCE.ENGINE = ""
 _C.INFERENCE.EXHAUSTIVE = False
 _C.INFERENCE.CLIP_OVERLAP = 3
 _C.INFERENCE.SAVE_LOGITS = False
+# number of clips stacked into a single forward pass. Only clips with the same padded shape are batched together.
+_C.INFERENCE.BATCH_SIZE = 1
+# number of background threads writing the predicted masks to disk. Set to 0 to write them in the inference thread.
+_C.INFERENCE.NUM_WRITERS = 2
+# maximum number of finished frames waiting to be written before the inference blocks
+_C.INFERENCE.WRITER_QUEUE_SIZE = 32
+# number of score bins used to compute the F measure and MAE incrementally
+_C.INFERENCE.EVAL_BINS = 1000
+# device used for inference, e.g. "cuda" or "cpu". Can be overridden with --device
+_C.INFERENCE.DEVICE = "cuda"
+# number of intra-op / inter-op threads used on CPU. 0 keeps the PyTorch defaults
+_C.INFERENCE.NUM_THREADS = 0
+_C.INFERENCE.NUM_INTEROP_THREADS = 0
+# backend of the process group for CPU inference launched with torch.distributed.launch, the videos are sharded
+# between the processes
+_C.INFERENCE.DIST_BACKEND = "gloo"
+# use the channels last (NDHWC) memory layout for the model and its inputs
+_C.INFERENCE.CHANNELS_LAST = False
+# optimization pass run before the inference: BatchNorm folding, removal of the unused prediction heads and merging
+# of the input normalisation. The optimized network is checked against the original one on a random clip.
+_C.INFERENCE.OPTIMIZE = CN()
+_C.INFERENCE.OPTIMIZE.ENABLED = False
+# maximum absolute difference of the logits allowed between the optimized and the original network
+_C.INFERENCE.OPTIMIZE.TOLERANCE = 1e-3
+# input size (H, W) of the clip used for the check and the speedup measurement
+_C.INFERENCE.OPTIMIZE.INPUT_SIZE = (256, 448)
+_C.INFERENCE.OPTIMIZE.NUM_RUNS = 3
+# options: fp32, bf16. bf16 runs the forward pass under autocast
+_C.INFERENCE.PRECISION = "fp32"
+# motion-aware keyclip scheduling: clips that barely differ from the last forwarded clip of their video reuse its
+# predictions instead of being forwarded
+_C.INFERENCE.KEYCLIP = CN()
+_C.INFERENCE.KEYCLIP.ENABLED = False
+# mean absolute frame difference, in [0, 1] intensity units, below which a clip is redundant
+_C.INFERENCE.KEYCLIP.MOTION_THRESHOLD = 0.01
+_C.INFERENCE.KEYCLIP.DOWNSAMPLE = 8
+_C.INFERENCE.KEYCLIP.MAX_SKIPPED = 4
+# forward the redundant clips anyway and log how much the propagated masks differ from the forwarded ones
+_C.INFERENCE.KEYCLIP.VALIDATE = False
+# early exits at the coarse prediction heads of the decoders: the clips whose coarse prediction is confidently
+# uniform (e.g. empty frames) skip the rest of the refinement cascade
+_C.INFERENCE.EARLY_EXIT = CN()
+_C.INFERENCE.EARLY_EXIT.ENABLED = False
+# minimum probability of the predicted class, over all the pixels of the clip, needed to exit
+_C.INFERENCE.EARLY_EXIT.THRESHOLD = 0.99
+# coarse heads checked in order: 5 (1/32), 4 (1/16), 3 (1/8)
+_C.INFERENCE.EARLY_EXIT.HEADS = [5]
+# thresholds and number of test clips used by EarlyExitBenchmarkEngine
+_C.INFERENCE.EARLY_EXIT.BENCHMARK_THRESHOLDS = [0.9, 0.95, 0.99, 0.999]
+_C.INFERENCE.EARLY_EXIT.NUM_CLIPS = 32
+# per module profile of the forward pass, written to results/<NAME>/profile.json. Set with --profile <clips>.
+_C.INFERENCE.PROFILE = CN()
+# number of clips profiled at the start of the inference, 0 disables the profiler
+_C.INFERENCE.PROFILE.NUM_CLIPS = 0
+# names of the profiled modules as in model.named_modules(), e.g. encoder.layer1. Defaults to the children of the
+# encoder and of the decoders
+_C.INFERENCE.PROFILE.MODULES = []
+# record the stages of the inference pipeline (decode, resize, pad, collate, host to device copy, forward, softmax,
+# accumulation, saving, metrics) to results/<NAME>/trace.json in the Chrome trace format. Set with --trace.
+_C.INFERENCE.TRACE = False
+# spatially tiled inference: the clips are split into overlapping tiles that are forwarded separately and blended,
+# so that the memory used by the network does not depend on the input resolution
+_C.INFERENCE.TILING = CN()
+_C.INFERENCE.TILING.ENABLED = False
+# memory budget of a tile in pixels per frame, the tile sides are multiples of 32
+_C.INFERENCE.TILING.MAX_TILE_PIXELS = 480 * 864
+# minimum overlap in pixels between neighbouring tiles, the logits are feathered over the overlap
+_C.INFERENCE.TILING.OVERLAP = 64
+# number of tiles forwarded at once
+_C.INFERENCE.TILING.BATCH_SIZE = 1
+# blend the logits of the tiles in host memory, so that only the tiles and not the full resolution logits are kept on
+# the device
+_C.INFERENCE.TILING.ACCUMULATE_ON_CPU = True
+# post-training int8 quantization, used by QuantizedSaliencyInferenceEngine
+_C.INFERENCE.QUANTIZATION = CN()
+# fbgemm for x86, qnnpack for ARM
+_C.INFERENCE.QUANTIZATION.BACKEND = "fbgemm"
+# path of the quantized TorchScript model. Defaults to results/<NAME>/quantized.pt
+_C.INFERENCE.QUANTIZATION.ARTIFACT = ""
+# root of the Davis dataset used for the calibration. Defaults to DATASETS.TEST_ROOT
+_C.INFERENCE.QUANTIZATION.CALIBRATION_ROOT = ""
+_C.INFERENCE.QUANTIZATION.NUM_CALIBRATION_CLIPS = 16
+# number of clips used to compare the latency and accuracy of the quantized model against fp32
+_C.INFERENCE.QUANTIZATION.NUM_EVAL_CLIPS = 8
+# TorchScript export (--task export), loaded by ScriptedSaliencyInferenceEngine
+_C.INFERENCE.EXPORT = CN()
+# options: torchscript, onnx
+_C.INFERENCE.EXPORT.FORMAT = "torchscript"
+# path of the exported model. Defaults to saved_models/<NAME>/exported.pt (or .onnx)
+_C.INFERENCE.EXPORT.ARTIFACT = ""
+# ONNX opset, trilinear resizing needs at least 11
+_C.INFERENCE.EXPORT.OPSET = 11
+# padded (H, W) of the input clips the model is traced for
+_C.INFERENCE.EXPORT.INPUT_SIZE = (480, 864)
+# onnxruntime settings of OnnxSaliencyInferenceEngine. Graph optimization: disable, basic, extended or all
+_C.INFERENCE.ONNX = CN()
+_C.INFERENCE.ONNX.GRAPH_OPTIMIZATION = "all"
+# if set, the graph optimized by onnxruntime is saved to this path
+_C.INFERENCE.ONNX.OPTIMIZED_MODEL = ""
+# resident inference server (--task serve), listening on localhost
+_C.INFERENCE.SERVER = CN()
+_C.INFERENCE.SERVER.PORT = 8090
+# number of jobs whose clips are batched together, the other jobs wait in the queue
+_C.INFERENCE.SERVER.MAX_ACTIVE_JOBS = 4
 
 
 # -----------------------------------------------------------------------------
@@ -1,12 +1,22 @@
+import hashlib
+import json
+import os
 import random
 from abc import abstractmethod
+from collections import OrderedDict
 
 import cv2
 import numpy as np
+import torch
 from PIL import Image
 from imageio import imread
-from utils.Resize import resize, ResizeMode
-from torch.utils.data import Dataset
+from utils.Resize import resize, ResizeMode, DETERMINISTIC_RESIZE_MODES
+from torch.utils.data import Dataset, get_worker_info
+
+from datasets.utils.FrameCache import FrameCache
+from datasets.utils.FrameStore import FrameStore, frame_key
+from datasets.utils.SampleTable import SampleTable
+from utils import tracing
 
 
 TARGETS = 'targets'
@@ -25,14 +35,29 @@ def list_to_dict(list):
 
 
 class BaseDataset(Dataset):
+  # False if the frames of a sample cannot be read one at a time, e.g. when a clip is generated from a single image
+  FRAME_CACHE = True
+
   def __init__(self, root, mode='train', resize_mode=None, resize_shape=None):
     self.resize_mode = ResizeMode(resize_mode)
     self.resize_shape = resize_shape
     self.mode = mode
     self.root = root
     self.samples = []
+    self.frame_cache = None
     self.create_sample_list()
 
+  def enable_frame_cache(self, max_bytes):
+    """
+    Caches the decoded frames and masks, see read_cached_frames.
+
+    :param max_bytes: budget of the cache of every process reading the dataset
+    """
+    if not self.FRAME_CACHE:
+      print("Dataset {} does not support the frame cache.".format(self.__class__.__name__))
+      return
+    self.frame_cache = FrameCache(max_bytes)
+
   # Override in case tensors have to be normalised
   def normalise(self, tensors):
     tensors['images'] = tensors['images'].astype(np.float32) / 255.0
@@ -60,10 +85,7 @@ class BaseDataset(Dataset):
 
     return padded_tensors
 
-  def read_sample(self, sample):
-    images = self.read_image(sample)
-    targets = self.read_target(sample)
-
+  def resize_frames(self, images, targets):
     images_resized = []
     targets_resized = []
     for im, t in zip(images, targets):
@@ -72,6 +94,62 @@ class BaseDataset(Dataset):
       data = resize(data, self.resize_mode, self.resize_shape)
       images_resized += [data['image']]
       targets_resized += [data['mask']]
+    return images_resized, targets_resized
+
+  def decode_frames(self, sample):
+    """
+    :return: lists of the decoded frames and masks of the sample
+    """
+    return list(self.read_image(sample)), list(self.read_target(sample))
+
+  def read_frame(self, sample, i):
+    """
+    :return: the decoded i-th frame of the sample and its mask
+    """
+    frame_sample = dict(sample)
+    frame_sample[IMAGES_] = sample[IMAGES_][i:i + 1]
+    frame_sample[TARGETS] = sample[TARGETS][i:i + 1]
+    images, targets = self.decode_frames(frame_sample)
+    return images[0], targets[0]
+
+  def read_cached_frames(self, sample):
+    """
+    Reads the frames of a sample through the frame cache. For the deterministic resize modes the resized frames are
+    cached, for the random ones only the decoded frames, which are resized again for every sample.
+
+    :return: lists of the resized images and masks
+    """
+    cache_resized = self.resize_mode in DETERMINISTIC_RESIZE_MODES
+    resize_key = (self.resize_mode.value, tuple(self.resize_shape or ())) if cache_resized else None
+    video = sample[INFO].get('video') if INFO in sample else None
+
+    def load(i):
+      with tracing.span('decode'):
+        image, target = self.read_frame(sample, i)
+      if cache_resized:
+        with tracing.span('resize'):
+          image, target = [x[0] for x in self.resize_frames([image], [target])]
+      return image, target
+
+    frames = [self.frame_cache.get((video, sample[IMAGES_][i], sample[TARGETS][i], resize_key),
+                                   lambda i=i: load(i)) for i in range(len(sample[IMAGES_]))]
+    images, targets = [list(x) for x in zip(*frames)]
+    tracing.counter('frame_cache', hits=self.frame_cache.hits, misses=self.frame_cache.misses,
+                    mb=self.frame_cache.num_bytes / 2 ** 20)
+    if not cache_resized:
+      with tracing.span('resize'):
+        images, targets = self.resize_frames(images, targets)
+    return images, targets
+
+  def read_sample(self, sample):
+    if self.frame_cache is not None:
+      images_resized, targets_resized = self.read_cached_frames(sample)
+    else:
+      with tracing.span('decode'):
+        images, targets = self.decode_frames(sample)
+
+      with tracing.span('resize'):
+        images_resized, targets_resized = self.resize_frames(images, targets)
 
     images = np.stack(images_resized)
     targets = np.stack(targets_resized)
@@ -113,10 +191,19 @@ class BaseDataset(Dataset):
 
 
 class VideoDataset(BaseDataset):
-  def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2):
+  # True if the clips of a video have to be read in order by a single process, e.g. when decoding a video file
+  SEQUENTIAL_ACCESS = False
+
+  def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2,
+               index_cache_dir=None):
     self.tw = tw
     self.max_temporal_gap = max_temporal_gap
     self.num_classes = num_classes
+    # only the datasets that scan their videos with scan_videos can cache the index
+    if index_cache_dir and type(self).scan_videos is VideoDataset.scan_videos:
+      print("{} does not implement scan_videos, its index is not cached".format(self.__class__.__name__))
+      index_cache_dir = None
+    self.index_cache_dir = index_cache_dir
 
     self.videos = []
     self.num_frames = {}
@@ -125,8 +212,58 @@ class VideoDataset(BaseDataset):
 
     self.current_video = None
     self.start_index = None
+    self.frame_store = None
+    # generator of the support frames of the samples and the seed it was created with, see get_rng
+    self.rng = None
+    self.rng_seed = None
     super(VideoDataset, self).__init__(root, mode, resize_mode, resize_shape)
 
+  def get_rng(self):
+    """
+    :return: random generator for sampling the support frames. In a DataLoader worker it is seeded with the seed of
+             the worker, which changes with every epoch, in the main process with the initial torch seed.
+    """
+    if not self.is_train():
+      # the support frames of a test sample must be the same on every access, e.g. the inference engine reads them
+      # before the DataLoader workers load the sample. The generator is reset instead of being created again.
+      if self.rng is None:
+        self.rng = np.random.RandomState(0)
+      else:
+        self.rng.seed(0)
+      return self.rng
+    worker_info = get_worker_info()
+    seed = (worker_info.seed if worker_info is not None else torch.initial_seed()) % 2 ** 32
+    if self.rng is None or self.rng_seed != seed:
+      self.rng = np.random.RandomState(seed)
+      self.rng_seed = seed
+    return self.rng
+
+  def sample_frames(self, frames, num):
+    """
+    :return: min(num, len(frames)) distinct frames drawn from frames with get_rng. If all of them are drawn, e.g. for
+             the test clips that span at most tw frames, they are returned without using the generator.
+    """
+    if len(frames) <= num:
+      return np.array(frames)
+    return self.get_rng().choice(frames, num, replace=False)
+
+  def enable_frame_store(self, store_dir):
+    """
+    Reads the frames and masks from a store written by datasets.utils.FrameStore instead of decoding them. Frames that
+    are not in the store are still decoded.
+    """
+    self.frame_store = FrameStore(store_dir)
+    missing = [video for video in self.videos if video not in self.frame_store]
+    if len(missing) > 0:
+      print("{} videos are not in the frame store {} and are decoded: {}".format(len(missing), store_dir, missing))
+
+  def decode_frames(self, sample):
+    if self.frame_store is not None:
+      frames = self.frame_store.read(sample[INFO]['video'], [frame_key(path, self.root) for path in sample[IMAGES_]])
+      if frames is not None:
+        return frames
+    return super(VideoDataset, self).decode_frames(sample)
+
   def set_video_id(self, video):
     self.current_video = video
     self.start_index = self.get_start_index(video)
@@ -139,6 +276,70 @@ class VideoDataset(BaseDataset):
     start_frame = 0
     return start_frame
 
+  @abstractmethod
+  def scan_videos(self):
+    """
+    Scans the dataset on disk. Override together with index_paths to cache the result, see load_index. Datasets that do
+    not override it build their samples without load_index and ignore index_cache_dir.
+
+    :return: OrderedDict of video -> JSON serialisable entry with everything create_sample_list needs to know about
+             the video, e.g. its frame ids, shape and number of objects
+    """
+    raise NotImplementedError
+
+  def index_paths(self):
+    """
+    :return: files and directories scanned by scan_videos. The cached index is rebuilt when the modification time of
+             one of them or of a sub directory of one of them changes, e.g. when a file is added to a video.
+    """
+    return []
+
+  def get_index_key(self):
+    mtimes = []
+    for path in self.index_paths():
+      if not os.path.exists(path):
+        mtimes += [(path, None)]
+        continue
+      mtimes += [(path, os.stat(path).st_mtime)]
+      if os.path.isdir(path):
+        mtimes += sorted([(e.path, e.stat().st_mtime) for e in os.scandir(path) if e.is_dir()])
+    key = [self.__class__.__name__, os.path.abspath(self.root), self.mode, mtimes]
+    return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+  def load_index(self):
+    """
+    :return: the index of scan_videos. With an index_cache_dir, it is read from a cache file keyed by the class, the
+             root, the split and the modification times of index_paths, and written there after a scan.
+    """
+    if not self.index_cache_dir:
+      return self.scan_videos()
+    cache_file = os.path.join(self.index_cache_dir, '{}_{}.json'.format(self.__class__.__name__,
+                                                                        self.get_index_key()))
+    if os.path.exists(cache_file):
+      with open(cache_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+    index = self.scan_videos()
+    if not os.path.exists(self.index_cache_dir):
+      os.makedirs(self.index_cache_dir, exist_ok=True)
+    # written under a temporary name, since several processes can build the same index
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    with open(tmp_file, 'w') as f:
+      json.dump(index, f)
+    os.replace(tmp_file, cache_file)
+    return index
+
+  def get_clips_per_video(self):
+    """
+    :return: dict of video -> indices of the samples that belong to the video
+    """
+    if isinstance(self.samples, SampleTable):
+      return self.samples.get_clips_per_video()
+    clips = OrderedDict([(video, []) for video in self.videos])
+    for i, sample in enumerate(self.samples):
+      clips[sample[INFO]['video']] += [i]
+    return clips
+
   def pad_tensors(self, tensors_resized):
     h, w = tensors_resized["images"].shape[1:3]
     new_h = h + 32 - h % 32 if h % 32 > 0 else h
@@ -165,15 +366,18 @@ class VideoDataset(BaseDataset):
 
   def __getitem__(self, idx):
     sample = self.samples[idx]
-    tensors_resized = self.read_sample(sample)
+    with tracing.span('load_clip', index=int(idx)):
+      tensors_resized = self.read_sample(sample)
 
-    padded_tensors = self.pad_tensors(tensors_resized)
+      with tracing.span('pad'):
+        padded_tensors = self.pad_tensors(tensors_resized)
 
-    padded_tensors = self.normalise(padded_tensors)
+      with tracing.span('normalise'):
+        padded_tensors = self.normalise(padded_tensors)
 
-    return {"images": np.transpose(padded_tensors['images'], (3, 0, 1, 2)).astype(np.float32),
-            "target": {"mask": np.transpose(padded_tensors['targets'], (3, 0, 1, 2)).astype(np.float32)},
-            'info': padded_tensors['info']}
+        return {"images": np.transpose(padded_tensors['images'], (3, 0, 1, 2)).astype(np.float32),
+                "target": {"mask": np.transpose(padded_tensors['targets'], (3, 0, 1, 2)).astype(np.float32)},
+                'info': padded_tensors['info']}
 
   @abstractmethod
   def get_support_indices(self, index, sequence):
@@ -2,4 +2,5 @@ from datasets.davis import Davis
 from datasets.coco import COCOv2
 from datasets.yvos import YoutubeVOS
 from datasets.fbms import Fbms
-from datasets.visal import visal
\ No newline at end of file
+from datasets.visal import visal
+from datasets.video import VideoFile
\ No newline at end of file
@@ -10,6 +10,9 @@ from utils.Resize import ResizeMode
 
 
 class COCOv2(VideoDataset):
+  # the clips are generated from a single image
+  FRAME_CACHE = False
+
   def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2,
                restricted_image_category_list = None, exclude_image_category_list = None):
     subset = "train" if mode == "train" else "valid"
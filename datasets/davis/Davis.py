@@ -1,27 +1,30 @@
 import glob
 import os
 import random
+from collections import OrderedDict
+
 import numpy as np
 from PIL import Image
 
-from datasets.BaseDataset import VideoDataset, INFO, IMAGES_, TARGETS
+from datasets.BaseDataset import VideoDataset
+from datasets.utils.SampleTable import SampleTable
 from utils.Resize import ResizeMode
 
 
 class Davis(VideoDataset):
   def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2,
-               imset=None):
+               imset=None, index_cache_dir=None):
     self.imset = imset
     self.videos = []
     self.num_frames = {}
     self.num_objects = {}
     self.shape = {}
     self.raw_samples = []
-    super(Davis, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes)
+    super(Davis, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes,
+                                index_cache_dir=index_cache_dir)
 
   def filter_samples(self, video):
-    filtered_samples = [s for s in self.raw_samples if s[INFO]['video'] == video]
-    self.samples = filtered_samples
+    self.samples = self.raw_samples.filter(video)
 
   def set_video_id(self, video):
     self.current_video = video
@@ -41,57 +44,58 @@ class Davis(VideoDataset):
       index_range = np.arange(index,
                               min(self.num_frames[sequence], (index + self.tw)))
 
-    support_indices = np.random.choice(index_range, min(self.tw, len(index_range)), replace=False)
+    support_indices = self.sample_frames(index_range, self.tw)
     support_indices = np.sort(np.append(support_indices, np.repeat([index],
                                                                    self.tw - len(support_indices))))
 
     # print(support_indices)
     return support_indices
 
-  def create_sample_list(self):
-    image_dir = os.path.join(self.root, 'JPEGImages', '480p')
-    mask_dir = os.path.join(self.root, 'Annotations_unsupervised', '480p')
+  def get_imset_file(self):
     if self.is_train():
       _imset_f = '2017/train.txt'
     elif self.imset:
       _imset_f = self.imset
     else:
       _imset_f = '2017/val.txt'
+    return os.path.join(self.root, "ImageSets", _imset_f)
 
-    with open(os.path.join(self.root, "ImageSets",_imset_f), "r") as lines:
+  def index_paths(self):
+    return [self.get_imset_file(), os.path.join(self.root, 'JPEGImages', '480p'),
+            os.path.join(self.root, 'Annotations_unsupervised', '480p')]
+
+  def scan_videos(self):
+    image_dir = os.path.join(self.root, 'JPEGImages', '480p')
+    mask_dir = os.path.join(self.root, 'Annotations_unsupervised', '480p')
+    index = OrderedDict()
+    with open(self.get_imset_file(), "r") as lines:
       for line in lines:
         _video = line.rstrip('\n')
-        self.videos += [_video]
-        img_list = list(glob.glob(os.path.join(image_dir, _video, '*.jpg')))
-        img_list.sort()
-        # self.videos.append(_video)
-
         num_frames = len(glob.glob(os.path.join(image_dir, _video, '*.jpg')))
-        self.num_frames[_video] = num_frames
-
-        _mask_file = os.path.join(mask_dir, _video, '00000.png')
         _mask = np.array(Image.open(os.path.join(mask_dir, _video, '00000.png')).convert("P"))
-        num_objects = np.max(_mask)
-        self.num_objects[_video] = num_objects
-        self.shape[_video] = np.shape(_mask)
-
-        for i, img in enumerate(img_list):
-          sample = {INFO: {}, IMAGES_: [], TARGETS: []}
-          support_indices = self.get_support_indices(i, _video)
-          sample[INFO]['support_indices'] = support_indices
-          images = [os.path.join(image_dir, _video, '{:05d}.jpg'.format(s)) for s in np.sort(support_indices)]
-          targets = [os.path.join(mask_dir, _video, '{:05d}.png'.format(s)) for s in np.sort(support_indices)]
-          sample[IMAGES_] = images
-          sample[TARGETS] = targets
-
-          sample[INFO]['video'] = _video
-          sample[INFO]['num_frames'] = num_frames
-          sample[INFO]['num_objects'] = num_objects
-          sample[INFO]['shape'] = np.shape(_mask)
-
-          self.samples+=[sample]
-    self.raw_samples = self.samples
+        index[_video] = {'num_frames': num_frames, 'num_objects': int(np.max(_mask)), 'shape': list(np.shape(_mask))}
+    return index
 
+  def create_sample_list(self):
+    image_dir = os.path.join(self.root, 'JPEGImages', '480p')
+    mask_dir = os.path.join(self.root, 'Annotations_unsupervised', '480p')
+
+    images, targets, infos, anchors = [], [], [], []
+    for _video, entry in self.load_index().items():
+      self.videos += [_video]
+      num_frames = entry['num_frames']
+      self.num_frames[_video] = num_frames
+      num_objects = entry['num_objects']
+      self.num_objects[_video] = num_objects
+      shape = tuple(entry['shape'])
+      self.shape[_video] = shape
+
+      images += [os.path.join(image_dir, _video, '{:05d}.jpg')]
+      targets += [os.path.join(mask_dir, _video, '{:05d}.png')]
+      infos += [{'num_frames': num_frames, 'num_objects': num_objects, 'shape': shape}]
+      anchors += [np.arange(num_frames)]
+    self.samples = SampleTable(self.videos, images, targets, infos, anchors, self.get_support_indices)
+    self.raw_samples = self.samples
 
 if __name__ == '__main__':
     davis = Davis(root="/globalwork/data/DAVIS-Unsupervised/DAVIS/",
@@ -1,5 +1,6 @@
 import glob
 import os
+from collections import OrderedDict
 
 import numpy as np
 from PIL import Image
@@ -7,17 +8,20 @@ from imageio import imread
 
 from datasets.BaseDataset import INFO, IMAGES_, TARGETS
 from datasets.davis.Davis import Davis
+from datasets.utils.SampleTable import SampleTable
 from utils.Constants import FBMS_ROOT
 from utils.Resize import ResizeMode
 
 
 class FBMSDataset(Davis):
-  def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2):
+  def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2,
+               index_cache_dir=None):
     # maintain a dict to store the index length for videos. They are different for fbms
     self.index_length = {}
     self.gt_frames = {}
     self.video_frames = {}
-    super(FBMSDataset, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes)
+    super(FBMSDataset, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes,
+                                      index_cache_dir=index_cache_dir)
 
   def get_support_indices(self, index, sequence):
     # index should be start index of the clip
@@ -28,7 +32,7 @@ class FBMSDataset(Davis):
       index_range = np.arange(index,
                               min(max(self.video_frames[sequence]) + 1, (index + self.tw)))
 
-    support_indices = np.random.choice(index_range, min(self.tw, len(index_range)), replace=False)
+    support_indices = self.sample_frames(index_range, self.tw)
     support_indices = np.sort(np.append(support_indices, np.repeat([index],
                                                                    self.tw - len(support_indices))))
 
@@ -50,51 +54,50 @@ class FBMSDataset(Davis):
 
     return masks
 
-  def create_sample_list(self):
+  def get_dirs(self):
     subset = "train" if self.is_train() else "test"
     mask_dir = os.path.join(self.root, 'inst', subset)
     subset = "Trainingset" if self.is_train() else "Testset"
     image_dir = os.path.join(self.root, subset)
+    return image_dir, mask_dir
+
+  def index_paths(self):
+    return list(self.get_dirs())
 
+  def scan_videos(self):
+    image_dir, mask_dir = self.get_dirs()
+    index = OrderedDict()
     videos = glob.glob(image_dir + "/*")
     for _video in videos:
       sequence = _video.split("/")[-1]
-      self.videos.append(sequence)
-      vid_files = glob.glob(os.path.join(image_dir, sequence, '*.jpg'))
-      shape = imread(vid_files[0]).shape[:2]
-      self.index_length[sequence] = len(vid_files[0].split("/")[-1].split(".")[0].split("_")[-1])
-      self.gt_frames[sequence] = [int(f.split("/")[-1].split("_")[-1].split(".")[0])
-                                  for f in glob.glob(os.path.join(mask_dir, sequence, '*.png'))]
-      self.num_frames[sequence] = len(vid_files)
-      self.video_frames[sequence] = [int(f.split("/")[-1].split("_")[-1].split(".")[0])
-                                     for f in vid_files]
-
-      for _f in vid_files:
-        sample = {INFO: {}, IMAGES_: [], TARGETS: []}
-        index = int(os.path.splitext(os.path.basename(_f))[0].split("_")[-1])
-        support_indices = self.get_support_indices(index, sequence)
-        sample[INFO]['support_indices'] = support_indices
-        l = self.index_length[sequence]
-        images = [os.path.join(image_dir, sequence, sequence + ('_{:0' + str(l) + 'd}.jpg').format(s))
-                  for s in np.sort(support_indices)]
-        targets = [os.path.join(mask_dir, sequence, sequence + ('_{:0' + str(l) + 'd}.png').format(s))
-                     for s in np.sort(support_indices)]
-
-        # images = [os.path.join(image_dir, _video, '{:05d}.jpg'.format(s)) for s in np.sort(support_indices)]
-        # targets = [os.path.join(mask_dir, _video, '{:05d}.png'.format(s)) for s in np.sort(support_indices)]
-        sample[IMAGES_] = images
-        sample[TARGETS] = targets
-
-        sample[INFO]['video'] = sequence
-        sample[INFO]['num_frames'] = len(vid_files)
-        sample[INFO]['num_objects'] = 1
-        sample[INFO]['shape'] = shape
-        sample[INFO]['gt_frames'] = self.gt_frames[sequence]
-
-        self.samples += [sample]
-
-      self.raw_samples = self.samples
+      vid_files = sorted(glob.glob(os.path.join(image_dir, sequence, '*.jpg')))
+      index[sequence] = {
+        'shape': list(imread(vid_files[0]).shape[:2]),
+        'index_length': len(vid_files[0].split("/")[-1].split(".")[0].split("_")[-1]),
+        'gt_frames': [int(f.split("/")[-1].split("_")[-1].split(".")[0])
+                      for f in glob.glob(os.path.join(mask_dir, sequence, '*.png'))],
+        'frames': [int(f.split("/")[-1].split("_")[-1].split(".")[0]) for f in vid_files]}
+    return index
 
+  def create_sample_list(self):
+    image_dir, mask_dir = self.get_dirs()
+
+    images, targets, infos, anchors = [], [], [], []
+    for sequence, entry in self.load_index().items():
+      self.videos.append(sequence)
+      self.index_length[sequence] = entry['index_length']
+      self.gt_frames[sequence] = entry['gt_frames']
+      self.num_frames[sequence] = len(entry['frames'])
+      self.video_frames[sequence] = entry['frames']
+
+      l = self.index_length[sequence]
+      images += [os.path.join(image_dir, sequence, sequence + ('_{:0' + str(l) + 'd}.jpg'))]
+      targets += [os.path.join(mask_dir, sequence, sequence + ('_{:0' + str(l) + 'd}.png'))]
+      infos += [{'num_frames': self.num_frames[sequence], 'num_objects': 1, 'shape': tuple(entry['shape']),
+                 'gt_frames': self.gt_frames[sequence]}]
+      anchors += [self.video_frames[sequence]]
+    self.samples = SampleTable(self.videos, images, targets, infos, anchors, self.get_support_indices)
+    self.raw_samples = self.samples
 
 if __name__ == '__main__':
   fbms = FBMSDataset(root=FBMS_ROOT,
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class FrameCache():
+  """
+  LRU cache of decoded frames with a budget in bytes. Overlapping clips share most of their frames, so a frame that
+  is still in the cache is not decoded (and resized) again. Every DataLoader worker gets its own copy of the dataset
+  and hence its own cache.
+  """
+
+  def __init__(self, max_bytes):
+    """
+    :param max_bytes: maximum total size of the cached arrays, the least recently used entries are evicted first
+    """
+    self.max_bytes = max_bytes
+    self.entries = OrderedDict()
+    self.num_bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key, load):
+    """
+    :param key: hashable key of the entry, e.g. the paths of the frame and its mask and the resize parameters
+    :param load: function returning the tuple of arrays of the entry, called on a miss
+    :return: the cached tuple of arrays, which are read only
+    """
+    if key in self.entries:
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return self.entries[key][0]
+
+    self.misses += 1
+    value = tuple(load())
+    size = sum([v.nbytes for v in value])
+    if size > self.max_bytes:
+      return value
+    for v in value:
+      # the entries are shared by all the samples containing the frame
+      v.setflags(write=False)
+    while self.num_bytes + size > self.max_bytes:
+      _, (_, evicted_size) = self.entries.popitem(last=False)
+      self.num_bytes -= evicted_size
+      self.evictions += 1
+    self.entries[key] = (value, size)
+    self.num_bytes += size
+    return value
+
+  def clear(self):
+    self.entries.clear()
+    self.num_bytes = 0
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            'hit_rate': self.hits / float(lookups) if lookups > 0 else 0.0, 'entries': len(self.entries),
+            'mb': self.num_bytes / 2 ** 20, 'max_mb': self.max_bytes / 2 ** 20}
@@ -0,0 +1,148 @@
+"""
+Pre-decoded frame store of a video dataset. Every video is packed into two uint8 .npy files, one with the frames
+(N x H x W x 3) and one with the masks (N x H x W), and index.json maps the frames of a sample to their rows:
+
+  <store>/index.json
+  <store>/<i>.images.npy
+  <store>/<i>.masks.npy
+
+The files are memory mapped by the dataset, so reading a frame is a zero copy slice and the DataLoader workers share
+the pages through the OS page cache instead of each decoding the JPEGs. A store is written once per dataset and split:
+
+  python -m datasets.utils.FrameStore -c run_configs/bmvc_final.yaml --split test --out <store>
+
+and used by setting DATASETS.TEST_FRAME_STORE (or DATASETS.TRAIN_FRAME_STORE) to <store>.
+"""
+import argparse
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+INDEX_FILE = 'index.json'
+
+
+def frame_key(path, root):
+  """
+  :return: key of a frame in the index: the path relative to the dataset root, or the frame number for datasets that
+           do not read frames from files
+  """
+  return os.path.relpath(path, root) if isinstance(path, str) else str(int(path))
+
+
+class FrameStore():
+  def __init__(self, store_dir):
+    self.store_dir = store_dir
+    with open(os.path.join(store_dir, INDEX_FILE)) as f:
+      index = json.load(f)
+    self.files = {}
+    self.rows = {}
+    for video, entry in index['videos'].items():
+      self.files[video] = (entry['images'], entry['masks'])
+      self.rows[video] = dict([(key, row) for row, key in enumerate(entry['frames'])])
+    # opened lazily, so that every process maps the files itself
+    self.arrays = {}
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['arrays'] = {}
+    return state
+
+  def __contains__(self, video):
+    return video in self.rows
+
+  def get_arrays(self, video):
+    if video not in self.arrays:
+      self.arrays[video] = tuple([np.load(os.path.join(self.store_dir, f), mmap_mode='r') for f in self.files[video]])
+    return self.arrays[video]
+
+  def read(self, video, keys):
+    """
+    :param keys: frame keys of a sample, see frame_key
+    :return: lists of the read only frames and masks, or None if a frame is not in the store
+    """
+    rows = self.rows.get(video, {})
+    if not all([key in rows for key in keys]):
+      return None
+    images, masks = self.get_arrays(video)
+    return [images[rows[key]] for key in keys], [masks[rows[key]] for key in keys]
+
+
+def write_frame_store(dataset, store_dir):
+  """
+  Decodes every frame of the videos of a VideoDataset with its read_image and read_target and packs the frames of
+  each video into the store. The frames are stored as decoded, they are resized when they are read.
+
+  The frames of a video are the anchor frames of its samples, which cover the whole video in every dataset. The
+  support frames of a sample are not used to list them, since in training they are drawn anew on every access and
+  would only give one draw of them.
+
+  :return: number of frames written
+  """
+  if not os.path.exists(store_dir):
+    os.makedirs(store_dir)
+  index = {'dataset': dataset.__class__.__name__, 'root': dataset.root, 'mode': dataset.mode,
+           'videos': OrderedDict()}
+  num_frames = 0
+  for i, (video, sample_indices) in enumerate(dataset.get_clips_per_video().items()):
+    # single frame sample of every frame of the video, in the order of the samples so that sequentially decoded videos
+    # are read front to back
+    frames = OrderedDict()
+    for s in sample_indices:
+      sample = dataset.samples.get_anchor(s)
+      frames.setdefault(frame_key(sample['images'][0], dataset.root), (sample, 0))
+    if len(frames) == 0:
+      continue
+    keys = list(frames.keys())
+
+    files = ('{}.images.npy'.format(i), '{}.masks.npy'.format(i))
+    images, masks = None, None
+    for row, key in enumerate(keys):
+      image, mask = dataset.read_frame(*frames[key])
+      if images is None:
+        images = np.lib.format.open_memmap(os.path.join(store_dir, files[0]), mode='w+', dtype=np.uint8,
+                                           shape=(len(keys),) + image.shape)
+        masks = np.lib.format.open_memmap(os.path.join(store_dir, files[1]), mode='w+', dtype=np.uint8,
+                                          shape=(len(keys),) + mask.shape)
+      if image.shape != images.shape[1:] or mask.shape != masks.shape[1:]:
+        raise ValueError("Frame {} of video {} has the shape {} / {}, the previous frames {} / {}".format(
+          key, video, image.shape, mask.shape, images.shape[1:], masks.shape[1:]))
+      images[row] = image
+      masks[row] = mask
+    images.flush()
+    masks.flush()
+    index['videos'][video] = {'frames': keys, 'images': files[0], 'masks': files[1]}
+    num_frames += len(keys)
+    print("{}: {} frames of {}".format(video, len(keys), images.shape[1:]), flush=True)
+    del images, masks
+
+  with open(os.path.join(store_dir, INDEX_FILE), 'w') as f:
+    json.dump(index, f, indent=2)
+  return num_frames
+
+
+def main():
+  from config import get_cfg
+  from utils.util import build_dataset, get_dataset_class
+
+  parser = argparse.ArgumentParser(description='Packs the decoded frames of a dataset into a frame store')
+  parser.add_argument('--config', '-c', required=True, type=str)
+  parser.add_argument('--split', default='test', choices=['train', 'test'])
+  parser.add_argument('--out', required=True, type=str, help='directory of the frame store')
+  args = parser.parse_args()
+
+  cfg = get_cfg()
+  cfg.merge_from_file(args.config)
+  # the frames have to be decoded from the original files
+  cfg.DATASETS.FRAME_CACHE_MB = 0
+  cfg.DATASETS.TRAIN_FRAME_STORE = ""
+  cfg.DATASETS.TEST_FRAME_STORE = ""
+  is_train = args.split == 'train'
+  dataset = build_dataset(get_dataset_class(cfg.DATASETS.TRAIN if is_train else cfg.DATASETS.TEST), is_train, cfg)
+  num_frames = write_frame_store(dataset, args.out)
+  print("Wrote {} frames to {}".format(num_frames, args.out))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,110 @@
+import copy
+from collections import OrderedDict
+
+import numpy as np
+
+
+def format_paths(paths, frames):
+  """
+  :param paths: paths of the frames of a video: a format string taking the frame id, a list indexed by the frame id,
+                or None if the frames are not read from files and the frame ids are used instead
+  :return: list of the paths of the given frames
+  """
+  if paths is None:
+    return [int(f) for f in frames]
+  if isinstance(paths, str):
+    return [paths.format(f) for f in frames]
+  return [paths[f] for f in frames]
+
+
+class SampleTable():
+  """
+  Columnar list of the samples of a video dataset. Instead of a dict per sample, it keeps the video id and the
+  anchor frame id of every sample in integer arrays, and the paths and info once per video. The samples of a video
+  are contiguous, and indexing returns the usual sample dict:
+
+    {'info': {'video', 'support_indices', <info of the video>}, 'images': [paths], 'targets': [paths]}
+
+  The support frames are sampled around the anchor frame on every access, and the paths are formatted for them.
+  filter returns the samples of a single video in O(1), without copying the arrays.
+  """
+
+  def __init__(self, videos, images, targets, infos, anchors, get_support_indices):
+    """
+    :param videos: names of the videos, in the order of their samples
+    :param images: per video, the paths of the frames, see format_paths
+    :param targets: per video, the paths of the masks, see format_paths
+    :param infos: per video, the info dict shared by its samples, e.g. num_frames and shape
+    :param anchors: per video, the anchor frame ids of its samples
+    :param get_support_indices: function (anchor frame id, video) -> frame ids of the sample, e.g. the
+                                get_support_indices of the dataset
+    """
+    self.videos = list(videos)
+    self.images = list(images)
+    self.targets = list(targets)
+    self.infos = list(infos)
+    self.get_support_indices = get_support_indices
+    lengths = [len(a) for a in anchors]
+    self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    self.video_ids = np.repeat(np.arange(len(self.videos), dtype=np.int32), lengths)
+    self.anchors = np.concatenate([np.asarray(a, dtype=np.int32) for a in anchors]) if sum(lengths) > 0 \
+      else np.zeros(0, dtype=np.int32)
+    self.video_index = dict([(video, i) for i, video in enumerate(self.videos)])
+    # range of the samples visible through this table, see filter
+    self.start = 0
+    self.end = int(self.offsets[-1])
+
+  def __len__(self):
+    return self.end - self.start
+
+  def get_position(self, idx):
+    if idx < 0:
+      idx += len(self)
+    if not 0 <= idx < len(self):
+      raise IndexError("Sample index {} out of range".format(idx))
+    return self.start + idx
+
+  def make_sample(self, i, frames):
+    v = self.video_ids[i]
+    info = dict(self.infos[v])
+    info['video'] = self.videos[v]
+    info['support_indices'] = frames
+    return {'info': info, 'images': format_paths(self.images[v], frames),
+            'targets': format_paths(self.targets[v], frames)}
+
+  def __getitem__(self, idx):
+    i = self.get_position(idx)
+    video = self.videos[self.video_ids[i]]
+    support_indices = np.sort(np.asarray(self.get_support_indices(int(self.anchors[i]), video), dtype=np.int64))
+    return self.make_sample(i, support_indices)
+
+  def get_anchor(self, idx):
+    """
+    :return: sample dict of only the anchor frame of the sample, without sampling its support frames
+    """
+    i = self.get_position(idx)
+    return self.make_sample(i, np.array([self.anchors[i]], dtype=np.int64))
+
+  def __iter__(self):
+    for idx in range(len(self)):
+      yield self[idx]
+
+  def filter(self, video):
+    """
+    :return: table of the samples of the given video, which shares the arrays of this table
+    """
+    v = self.video_index[video]
+    table = copy.copy(self)
+    table.start = int(max(self.offsets[v], self.start))
+    table.end = int(max(min(self.offsets[v + 1], self.end), table.start))
+    return table
+
+  def get_clips_per_video(self):
+    """
+    :return: OrderedDict of video -> indices of its samples in this table
+    """
+    clips = OrderedDict()
+    for v, video in enumerate(self.videos):
+      start, end = max(self.offsets[v], self.start), min(self.offsets[v + 1], self.end)
+      clips[video] = list(range(int(start) - self.start, int(end) - self.start)) if end > start else []
+    return clips
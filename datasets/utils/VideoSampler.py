@@ -0,0 +1,79 @@
+import math
+from collections import OrderedDict
+
+from torch.utils.data import Sampler
+
+
+class VideoClipSampler(Sampler):
+  """
+  Iterates over the clips of a video dataset one video after the other, so that a single DataLoader (and its
+  workers) can be used for the whole test set. Since the clips are yielded as one flat stream, the workers start
+  decoding the next video while the current one is still being processed.
+  """
+
+  def __init__(self, dataset, clip_step=1, videos=None, num_replicas=1, rank=0):
+    """
+    :param dataset: VideoDataset holding the samples of all the videos
+    :param clip_step: only every clip_step-th clip of a video is used
+    :param videos: videos to iterate over, in order. Defaults to dataset.get_video_ids()
+    :param num_replicas: number of processes taking part in a distributed run. The clips of every video are split
+                         between the processes, padded so that all of them get the same number of clips per video.
+    :param rank: rank of the current process
+    """
+    self.videos = dataset.get_video_ids() if videos is None else videos
+    self.num_replicas = num_replicas
+    self.rank = rank
+    self.sequential = getattr(dataset, 'SEQUENTIAL_ACCESS', False)
+    clips_per_video = dataset.get_clips_per_video()
+
+    self.clip_indices = OrderedDict()
+    for video in self.videos:
+      indices = clips_per_video[video][::clip_step]
+      if len(indices) == 0:
+        continue
+      if num_replicas > 1:
+        total_size = int(math.ceil(len(indices) / float(num_replicas))) * num_replicas
+        indices = (indices * int(math.ceil(total_size / float(len(indices)))))[:total_size]
+        indices = indices[rank:total_size:num_replicas]
+      self.clip_indices[video] = indices
+
+  def __iter__(self):
+    return iter([i for indices in self.clip_indices.values() for i in indices])
+
+  def __len__(self):
+    return sum([len(indices) for indices in self.clip_indices.values()])
+
+  def get_num_workers(self, num_workers):
+    """
+    :return: the number of DataLoader workers to use with this sampler, at most one for datasets that must be read
+             sequentially
+    """
+    return min(num_workers, 1) if self.sequential else num_workers
+
+  def video_markers(self):
+    """
+    Yields a (video, clip index within the video, number of clips of the video) marker for every clip in the order
+    of iteration. Zip it with the DataLoader to find the video boundaries.
+    """
+    for video, indices in self.clip_indices.items():
+      for i in range(len(indices)):
+        yield video, i, len(indices)
+
+
+def shard_videos(videos, num_frames, num_replicas=1, rank=0):
+  """
+  Splits whole videos between the processes of a distributed run, so that every video is processed (and its results
+  written) by exactly one process. The videos are assigned longest first, each to the process with the fewest frames
+  so far, which balances the number of frames per process.
+
+  :param videos: list of videos
+  :param num_frames: dict of video -> number of frames
+  :return: the videos assigned to the given rank, in the order of videos
+  """
+  loads = [0] * num_replicas
+  assigned = {}
+  for video in sorted(videos, key=lambda v: num_frames[v], reverse=True):
+    replica = loads.index(min(loads))
+    loads[replica] += num_frames[video]
+    assigned[video] = replica
+  return [video for video in videos if assigned[video] == rank]
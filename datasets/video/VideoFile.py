@@ -0,0 +1,117 @@
+import glob
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from datasets.BaseDataset import VideoDataset, INFO, IMAGES_, TARGETS
+from datasets.utils.SampleTable import SampleTable
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+
+class VideoFileDataset(VideoDataset):
+  """
+  Reads the clips directly from video files instead of pre-extracted frames. root is either a single video file or a
+  directory of video files, and every file is a video of the dataset.
+
+  The frames are decoded sequentially with cv2 and kept in a sliding window, so that the frames shared by overlapping
+  clips are decoded only once. This assumes that the clips of a video are requested in order, as VideoClipSampler
+  does; a clip that starts before the window reopens the video and decodes it again from the start. Since every
+  DataLoader worker would decode the video on its own, the dataset sets SEQUENTIAL_ACCESS and is read by a single
+  worker. There is no ground truth: the targets are empty and no frame is evaluated.
+  """
+  SEQUENTIAL_ACCESS = True
+
+  def __init__(self, root, mode='test', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2):
+    self.video_files = {}
+    # decoding state of the video that is currently read
+    self.capture = None
+    self.capture_video = None
+    self.next_frame = 0
+    self.window = OrderedDict()
+    super(VideoFileDataset, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes)
+
+  def __getstate__(self):
+    # cv2.VideoCapture cannot be pickled, the DataLoader workers open their own
+    state = self.__dict__.copy()
+    state['capture'] = None
+    state['capture_video'] = None
+    state['next_frame'] = 0
+    state['window'] = OrderedDict()
+    return state
+
+  def get_support_indices(self, index, sequence):
+    # index should be start index of the clip
+    index_range = np.arange(index, min(self.num_frames[sequence], (index + self.tw)))
+    support_indices = np.sort(np.append(index_range, np.repeat([index], self.tw - len(index_range))))
+    return support_indices
+
+  def create_sample_list(self):
+    if os.path.isfile(self.root):
+      video_files = [self.root]
+    else:
+      video_files = sorted([f for f in glob.glob(os.path.join(self.root, '*'))
+                            if os.path.splitext(f)[1].lower() in VIDEO_EXTENSIONS])
+    assert len(video_files) > 0, "No video files found at {}".format(self.root)
+
+    images, targets, infos, anchors = [], [], [], []
+    for video_file in video_files:
+      _video = os.path.splitext(os.path.basename(video_file))[0]
+      capture = cv2.VideoCapture(video_file)
+      if not capture.isOpened():
+        raise IOError("Video {} could not be opened".format(video_file))
+      num_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+      shape = (int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)))
+      capture.release()
+
+      self.videos += [_video]
+      self.video_files[_video] = video_file
+      self.num_frames[_video] = num_frames
+      self.num_objects[_video] = 1
+      self.shape[_video] = shape
+
+      # frame indices, the frames are read from the video file
+      images += [None]
+      targets += [None]
+      infos += [{'num_frames': num_frames, 'num_objects': 1, 'shape': shape, 'gt_frames': []}]
+      anchors += [np.arange(num_frames)]
+    self.samples = SampleTable(self.videos, images, targets, infos, anchors, self.get_support_indices)
+
+  def open_video(self, video):
+    if self.capture is not None:
+      self.capture.release()
+    self.capture = cv2.VideoCapture(self.video_files[video])
+    self.capture_video = video
+    self.next_frame = 0
+    self.window = OrderedDict()
+
+  def read_frames(self, video, frames):
+    """
+    Decodes the video up to the last of the given frames and drops the frames before the first one from the window.
+
+    :return: list of RGB images of the given frames
+    """
+    start, end = int(np.min(frames)), int(np.max(frames))
+    if self.capture_video != video or start < self.next_frame - len(self.window):
+      self.open_video(video)
+    while self.next_frame <= end:
+      success, image = self.capture.read()
+      if not success:
+        # the frame count reported by the container can be too large, repeat the last decoded frame
+        image = self.window[next(reversed(self.window))] if len(self.window) > 0 else \
+          np.zeros(self.shape[video] + (3,), dtype=np.uint8)
+      else:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+      self.window[self.next_frame] = image
+      self.next_frame += 1
+    for f in [f for f in self.window.keys() if f < start]:
+      del self.window[f]
+    return [self.window[int(f)] for f in frames]
+
+  def read_image(self, sample):
+    return self.read_frames(sample[INFO]['video'], sample[IMAGES_])
+
+  def read_target(self, sample):
+    return [np.zeros(sample[INFO]['shape'], dtype=np.uint8) for _ in sample[TARGETS]]
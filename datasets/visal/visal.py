@@ -1,6 +1,7 @@
 import glob
 import os
 import re
+from collections import OrderedDict
 
 import numpy as np
 from PIL import Image
@@ -8,6 +9,7 @@ from imageio import imread
 
 from datasets.BaseDataset import INFO, IMAGES_, TARGETS
 from datasets.davis.Davis import Davis
+from datasets.utils.SampleTable import SampleTable
 from utils.Resize import ResizeMode
 
 SEQ_NAMES = [
@@ -18,10 +20,11 @@ SEQ_NAMES = [
 
 class VisalDataset(Davis):
     def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2,
-                 imset=None):
+                 imset=None, index_cache_dir=None):
         self.gt_frames = {}
         self.video_frames = {}
-        super(VisalDataset, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes)
+        super(VisalDataset, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes,
+                                           index_cache_dir=index_cache_dir)
 
     def get_current_sequence(self, img_file):
         sequence = img_file.split("/")[-2]
@@ -36,7 +39,7 @@ class VisalDataset(Davis):
             index_range = np.arange(index,
                                     min(self.num_frames[sequence], (index + self.tw)))
 
-        support_indices = np.random.choice(index_range, min(self.tw, len(index_range)), replace=False)
+        support_indices = self.sample_frames(index_range, self.tw)
         support_indices = np.sort(np.append(support_indices, np.repeat([index],
                                                                        self.tw - len(support_indices))))
 
@@ -56,7 +59,10 @@ class VisalDataset(Davis):
             masks +=[raw_mask]
         return masks
 
-    def create_sample_list(self):
+    def index_paths(self):
+        return [os.path.join(self.root, "ViSal"), os.path.join(self.root, "GroundTruth")]
+
+    def scan_videos(self):
         image_dir = os.path.join(self.root, "ViSal")
         mask_dir = os.path.join(self.root, "GroundTruth")
 
@@ -68,9 +74,9 @@ class VisalDataset(Davis):
         mask_fnames = []
         for type in types:
             mask_fnames += sorted(glob.glob(mask_dir + type))
-        mask_fnames = [fname.split("/")[-1] for fname in mask_fnames]
+        mask_fnames = set([fname.split("/")[-1] for fname in mask_fnames])
+        index = OrderedDict()
         for _video in SEQ_NAMES:
-            self.videos.append(_video)
             seq_images_dir = os.path.join(image_dir, _video)
             assert os.path.exists(seq_images_dir), "Images directory not found at expected path: {}".format(
                 seq_images_dir)
@@ -83,36 +89,35 @@ class VisalDataset(Davis):
             vid_files = []
             for type in types:
                 vid_files += sorted(glob.glob(seq_images_dir + type))
-            seq_mask_fnames = sorted(filter(lambda f: re.match(regex_pattern, f), mask_fnames))
-            self.gt_frames[_video] = [int(i) for i, f in enumerate(vid_files) if f.split("/")[-1] in seq_mask_fnames]
-            assert len(self.gt_frames[_video]) == len(seq_mask_fnames)
-            self.num_frames[_video] = len(vid_files)
-            self.video_frames[_video] = vid_files
-            shape = imread(vid_files[0]).shape[:2]
-
-            for i, _f in enumerate(vid_files):
-                sample = {INFO: {}, IMAGES_: [], TARGETS: []}
-                sequence = self.get_current_sequence(_f)
-                index = self.video_frames[sequence].index(_f)
-                support_indices = self.get_support_indices(index, _video)
+            seq_mask_fnames = set(filter(lambda f: re.match(regex_pattern, f), mask_fnames))
+            gt_frames = [int(i) for i, f in enumerate(vid_files) if f.split("/")[-1] in seq_mask_fnames]
+            assert len(gt_frames) == len(seq_mask_fnames)
+            index[_video] = {'frames': [f.split("/")[-1] for f in vid_files], 'gt_frames': gt_frames,
+                             'shape': list(imread(vid_files[0]).shape[:2])}
+        return index
 
-                sample[INFO]['support_indices'] = support_indices
-                images = [self.video_frames[_video][s] for s in np.sort(support_indices)]
-                targets = [os.path.join(mask_dir, img_file.split("/")[-1]) for img_file in images]
+    def create_sample_list(self):
+        image_dir = os.path.join(self.root, "ViSal")
+        mask_dir = os.path.join(self.root, "GroundTruth")
 
-                sample[IMAGES_] = images
-                sample[TARGETS] = targets
-                sample[INFO]['video'] = _video
-                sample[INFO]['num_frames'] = len(vid_files)
-                sample[INFO]['num_objects'] = 1
-                sample[INFO]['shape'] = shape
-                sample[INFO]['gt_frames'] = self.gt_frames[_video]
+        targets, infos, anchors = [], [], []
+        for _video, entry in self.load_index().items():
+            self.videos.append(_video)
+            vid_files = [os.path.join(image_dir, _video, f) for f in entry['frames']]
+            self.gt_frames[_video] = entry['gt_frames']
+            self.num_frames[_video] = len(vid_files)
+            self.video_frames[_video] = vid_files
 
-                self.samples += [sample]
+            # the frames are indexed by their position in the video
+            targets += [[os.path.join(mask_dir, f) for f in entry['frames']]]
+            infos += [{'num_frames': len(vid_files), 'num_objects': 1, 'shape': tuple(entry['shape']),
+                       'gt_frames': self.gt_frames[_video]}]
+            anchors += [np.arange(len(vid_files))]
 
+        self.samples = SampleTable(self.videos, [self.video_frames[v] for v in self.videos], targets, infos,
+                                   anchors, self.get_support_indices)
         self.raw_samples = self.samples
 
-
 if __name__ == '__main__':
     davis = VisalDataset(root="/globalwork/mahadevan/mywork/data/ViSal/",
                   resize_shape=(480, 854), resize_mode=ResizeMode.FIXED_SIZE, mode="train", max_temporal_gap=8)
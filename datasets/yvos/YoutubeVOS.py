@@ -1,52 +1,60 @@
 import glob
 import os
+from collections import OrderedDict
 
 import numpy as np
 from PIL import Image
 
-from datasets.BaseDataset import VideoDataset, IMAGES_, TARGETS, INFO
+from datasets.BaseDataset import VideoDataset
+from datasets.utils.SampleTable import SampleTable
 from utils.Constants import YOUTUBEVOS_ROOT
 from utils.Resize import ResizeMode
 
 
 class YoutubeVOS(VideoDataset):
-  def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2):
+  def __init__(self, root, mode='train', resize_mode=None, resize_shape=None, tw=8, max_temporal_gap=8, num_classes=2,
+               index_cache_dir=None):
     self.videos = []
     self.num_frames = {}
     self.num_objects = {}
     self.shape = {}
     self.raw_samples = []
     self.video_frames = {}
-    super(YoutubeVOS, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes)
+    # video -> frame id -> position of the frame in video_frames
+    self.frame_positions = {}
+    super(YoutubeVOS, self).__init__(root, mode, resize_mode, resize_shape, tw, max_temporal_gap, num_classes,
+                                     index_cache_dir=index_cache_dir)
 
   def filter_samples(self, video):
-    filtered_samples = [s for s in self.raw_samples if s[INFO]['video'] == video]
-    self.samples = filtered_samples
+    self.samples = self.raw_samples.filter(video)
 
   def get_support_indices(self, index, sequence):
     # in youtube-vos index does not correspond to the file index
     # i = int(os.path.splitext(os.path.basename(self.img_list[file_index]))[0])
     # sample_list = [int(os.path.splitext(os.path.basename(f))[0]) for f in self.video_frames[sequence]]
     sample_list = self.video_frames[sequence]
-    sample_list.sort()
-    start_index = sample_list.index(index)
+    start_index = self.frame_positions[sequence][index]
     end_index = min(len(sample_list), start_index + self.max_temporal_gap)
     sample_list = sample_list[start_index: end_index]
-    support_indices = np.random.choice(sample_list, min(self.tw, len(sample_list)), replace=False)
+    support_indices = self.sample_frames(sample_list, self.tw)
     support_indices = np.sort(np.append(support_indices, np.repeat([index],
                                                                    self.tw - len(support_indices))))
     support_indices.sort()
     # print("support indices are {}".format(support_indices))
     return support_indices.astype(np.int)
 
-  def create_sample_list(self):
+  def index_paths(self):
+    imset = "train" if self.is_train() else "valid"
+    return [os.path.join(self.root, imset, d) for d in ['JPEGImages', 'CleanedAnnotations', 'Annotations']]
+
+  def scan_videos(self):
     imset = "train" if self.is_train() else "valid"
     image_dir = os.path.join(self.root, imset, 'JPEGImages')
     _videos = glob.glob(image_dir + "/*")
 
+    index = OrderedDict()
     for line in _videos:
       _video = line.split("/")[-1]
-      self.videos += [_video]
       img_list = list(glob.glob(os.path.join(image_dir, _video, '*.jpg')))
       mask_dir = os.path.join(self.root, imset, 'CleanedAnnotations')
       if os.path.exists(os.path.join(mask_dir, _video)):
@@ -57,34 +65,39 @@ class YoutubeVOS(VideoDataset):
                                                 _video, '*.png')))
       img_list.sort()
       mask_list.sort()
-      self.video_frames[_video] = [int(os.path.splitext(os.path.basename(f))[0]) for f in img_list]
 
-      num_frames = len(img_list)
+      _mask = np.shape(np.array(Image.open(mask_list[0]).convert("P")))
+      index[_video] = {'frames': sorted([int(os.path.splitext(os.path.basename(f))[0]) for f in img_list]),
+                       'mask_dir': os.path.basename(mask_dir), 'num_objects': int(np.max(_mask)),
+                       'shape': list(np.shape(_mask))}
+    return index
+
+  def create_sample_list(self):
+    imset = "train" if self.is_train() else "valid"
+    image_dir = os.path.join(self.root, imset, 'JPEGImages')
+
+    images, targets, infos, anchors = [], [], [], []
+    for _video, entry in self.load_index().items():
+      self.videos += [_video]
+      mask_dir = os.path.join(self.root, imset, entry['mask_dir'])
+      self.video_frames[_video] = entry['frames']
+      self.frame_positions[_video] = dict([(f, i) for i, f in enumerate(entry['frames'])])
+
+      num_frames = len(entry['frames'])
       self.num_frames[_video] = num_frames
 
-      _mask = np.shape(np.array(Image.open(mask_list[0]).convert("P")))
-      num_objects = np.max(_mask)
+      num_objects = entry['num_objects']
       self.num_objects[_video] = num_objects
-      self.shape[_video] = np.shape(_mask)
-
-      for f_index in self.video_frames[_video]:
-        sample = {INFO: {}, IMAGES_: [], TARGETS: []}
-        support_indices = self.get_support_indices(f_index, _video)
-        sample[INFO]['support_indices'] = support_indices
-        images = [os.path.join(image_dir, _video, '{:05d}.jpg'.format(s)) for s in np.sort(support_indices)]
-        targets = [os.path.join(mask_dir, _video, '{:05d}.png'.format(s)) for s in np.sort(support_indices)]
-        sample[IMAGES_] = images
-        sample[TARGETS] = targets
-
-        sample[INFO]['video'] = _video
-        sample[INFO]['num_frames'] = num_frames
-        sample[INFO]['num_objects'] = num_objects
-        sample[INFO]['shape'] = np.shape(_mask)
-
-        self.samples+=[sample]
+      shape = tuple(entry['shape'])
+      self.shape[_video] = shape
+
+      images += [os.path.join(image_dir, _video, '{:05d}.jpg')]
+      targets += [os.path.join(mask_dir, _video, '{:05d}.png')]
+      infos += [{'num_frames': num_frames, 'num_objects': num_objects, 'shape': shape}]
+      anchors += [self.video_frames[_video]]
+    self.samples = SampleTable(self.videos, images, targets, infos, anchors, self.get_support_indices)
     self.raw_samples = self.samples
 
-
 if __name__ == '__main__':
     yvos = YoutubeVOS(root=YOUTUBEVOS_ROOT,
                   resize_shape=(480, 854), resize_mode=ResizeMode.FIXED_SIZE, mode="train", max_temporal_gap=32)
@@ -1,140 +1,601 @@
+import contextlib
 import logging
 import os
-import pickle
-
-import numpy as np
+import time
 from abc import abstractmethod
+from collections import Counter
 
+import numpy as np
 import torch
-from PIL import Image
-from scipy.misc import imresize
-from sklearn.metrics import precision_recall_curve
 from torch.utils.data import DataLoader
+from torch.utils.data.dataloader import default_collate
 from torch.nn import functional as F
 
-from util import color_map
+from datasets.BaseDataset import INFO
+from datasets.utils.VideoSampler import VideoClipSampler, shard_videos
+from inference_handlers.infer_utils.accumulator import ClipAccumulator
+from inference_handlers.infer_utils.distributed import all_reduce_meter, all_reduce_evaluator, all_reduce_sum
+from inference_handlers.infer_utils.evaluator import HistogramEvaluator
+from inference_handlers.infer_utils.keyclip import KeyclipScheduler, propagate, mask_agreement
+from inference_handlers.infer_utils.profiler import ModuleProfiler
+from inference_handlers.infer_utils.tiling import get_tile_shape, tiled_forward
+from inference_handlers.infer_utils.writer import ResultWriter
+from network.early_exit import forward_early_exit, EXIT_LEVELS
 from utils.AverageMeter import AverageMeter
 from utils.Constants import PRED_LOGITS, PRED_SEM_SEG
-from utils.util import iou_fixed_torch
+from utils import tracing
+from utils.util import iou_fixed_torch, get_rank, get_world_size
+
+
+def collate_clips(batch):
+  with tracing.span('collate'):
+    return default_collate(batch)
 
 
 class BaseInferenceEngine():
-  def __init__(self, cfg):
+  # whether infer() needs the network built from the config and its weights loaded
+  REQUIRES_MODEL = True
+
+  def __init__(self, cfg, results_dir=None):
     self.cfg = cfg
-    self.results_dir = os.path.join('results', cfg.NAME)
+    self.device = torch.device(cfg.INFERENCE.DEVICE)
+    self.results_dir = os.path.join('results', cfg.NAME) if results_dir is None else results_dir
     if not os.path.exists(self.results_dir):
       os.makedirs(self.results_dir)
-    log_file = os.path.join(self.results_dir, 'output.log')
+    # every process of a distributed run logs its own shard
+    log_file = os.path.join(self.results_dir, 'output.log' if get_rank() == 0 else 'output_{}.log'.format(get_rank()))
     logging.basicConfig(filename=log_file, level=logging.INFO)
+    # the channels last layout of 5d tensors needs PyTorch 1.10 and torch.autocast 1.12, older versions fall back to the
+    # default layout and fp32
+    self.channels_last = cfg.INFERENCE.CHANNELS_LAST
+    if self.channels_last and not hasattr(torch, 'channels_last_3d'):
+      logging.warning('INFERENCE.CHANNELS_LAST needs PyTorch 1.10 or greater, using the default memory layout')
+      self.channels_last = False
+    self.precision = cfg.INFERENCE.PRECISION
+    if self.precision == 'bf16' and not hasattr(torch, 'autocast'):
+      logging.warning('INFERENCE.PRECISION bf16 needs PyTorch 1.12 or greater, running the inference in fp32')
+      self.precision = 'fp32'
 
   def infer(self, dataset, model):
     pass
+
+  def prepare_model(self, model):
+    model = model.to(self.device)
+    # switch to evaluate mode
+    model.eval()
+    if self.cfg.INFERENCE.OPTIMIZE.ENABLED:
+      model = self.optimize_model(model)
+    if self.channels_last:
+      model = model.to(memory_format=torch.channels_last_3d)
+    return model
+
+  def optimize_model(self, model):
+    """
+    :return: the network with the BatchNorm layers folded and the unused heads removed, checked against the original
+             network on a random clip of INFERENCE.OPTIMIZE.INPUT_SIZE
+    """
+    from network.optimization import optimize_and_verify
+    optimize_cfg = self.cfg.INFERENCE.OPTIMIZE
+    input = torch.rand((1, 3, self.cfg.INPUT.TW) + tuple(optimize_cfg.INPUT_SIZE), device=self.device)
+    return optimize_and_verify(model, input, optimize_cfg.TOLERANCE, optimize_cfg.NUM_RUNS)
+
+  def prepare_input(self, input):
+    with tracing.span('h2d'):
+      input = input.float().to(self.device)
+      if self.channels_last:
+        input = input.contiguous(memory_format=torch.channels_last_3d)
+    return input
+
+  def autocast(self):
+    """
+    :return: context manager for the forward pass, running it in bf16 if INFERENCE.PRECISION is bf16
+    """
+    if self.precision == 'bf16':
+      return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16)
+    elif self.precision == 'fp32':
+      return contextlib.nullcontext()
+    else:
+      raise ValueError("Unknown inference precision {}".format(self.precision))
   
   
 class SaliencyInferenceEngine(BaseInferenceEngine):
-  def __init__(self, cfg):
-    super(SaliencyInferenceEngine, self).__init__(cfg)
+  def __init__(self, cfg, results_dir=None):
+    super(SaliencyInferenceEngine, self).__init__(cfg, results_dir)
+    early_exit = cfg.INFERENCE.EARLY_EXIT
+    if early_exit.ENABLED and cfg.INFERENCE.OPTIMIZE.ENABLED:
+      raise ValueError("Early exits need the coarse prediction heads, which INFERENCE.OPTIMIZE removes")
+    # confidence above which a clip leaves the decoder at a coarse head, None to always run the full decoder
+    self.exit_threshold = early_exit.THRESHOLD if early_exit.ENABLED else None
+    # number of clips per exit level, 2 is the full decoder
+    self.exit_levels = Counter()
+    self.profiler = None
 
   def infer(self, dataset, model):
-    fs = AverageMeter()
-    maes = AverageMeter()
-    ious = AverageMeter()
-    # switch to evaluate mode
-    model.eval()
-    pred_for_eval = []
-    gt_for_eval = []
+    model = self.prepare_model(model)
+    self.start_inference()
+    if self.cfg.INFERENCE.TRACE:
+      tracing.enable(os.path.join(self.results_dir, 'trace'))
+    if self.cfg.INFERENCE.PROFILE.NUM_CLIPS > 0:
+      self.start_profiling(model)
 
-    with torch.no_grad():
-      for seq in dataset.get_video_ids():
-        ious_per_video = AverageMeter()
-        dataset.set_video_id(seq)
-        # test_sampler = torch.utils.data.distributed.DistributedSampler(dataset, shuffle=False) if distributed else None
-        test_sampler = None
-        dataloader = DataLoader(dataset, batch_size=1, num_workers=0, shuffle=False, sampler=test_sampler,
-                                pin_memory=True)
-
-        all_semantic_pred = {}
-        all_targets = {}
-        for iter, input_dict in enumerate(dataloader):
-          if not self.cfg.INFERENCE.EXHAUSTIVE and (iter % (self.cfg.INPUT.TW - self.cfg.INFERENCE.CLIP_OVERLAP)) != 0:
-            continue
-
-          info = input_dict['info'][0]
-          input = input_dict["images"]
-          batch_size = input.shape[0]
-          target_dict = dict([(k, t.float().cuda()) for k, t in input_dict['target'].items()])
-          input_var = input.float().cuda()
-
-          # compute output
-          pred = model(input_var)
-          # pred = format_pred(pred)
-
-          pred_mask = F.softmax(pred[0], dim=1)
-          clip_frames = info['support_indices'][0].data.cpu().numpy()
-
-          assert batch_size == 1
-          for i, f in enumerate(clip_frames):
-            if f in all_semantic_pred:
-              # all_semantic_pred[clip_frames] += [torch.argmax(pred_mask, dim=1).data.cpu().int()[0]]
-              all_semantic_pred[f] += [pred_mask[0, :, i].data.cpu().float()]
-            else:
-              all_semantic_pred[f] = [pred_mask[0, :, i].data.cpu().float()]
-              # Use binary masks
-              if 'gt_frames' not in info or f in info['gt_frames']:
-                all_targets[f] = (target_dict['mask'] != 0)[0, 0, i].data.cpu().float()
-
-        masks = [torch.stack(pred).mean(dim=0) for key, pred in all_semantic_pred.items() if key in all_targets]
-        iou = iou_fixed_torch(torch.stack(masks).cuda(), torch.stack(list(all_targets.values())).cuda())
-        ious_per_video.update(iou, 1)
-        ious.update(iou, 1)
-        f, mae, pred_flattened, gt_flattened = self.save_results(all_semantic_pred, all_targets, info)
-        fs.update(f)
-        maes.update(mae)
-        pred_for_eval += [pred_flattened]
-        gt_for_eval += [gt_flattened]
-        logging.info(
-          'Sequence {}: F_max {}  MAE {} IOU {}'.format(input_dict['info'][0]['video'], f, mae, ious_per_video.avg))
-
-    print("IOU: {}".format(iou))
-    gt = np.hstack(gt_for_eval).flatten()
-    p = np.hstack(pred_for_eval).flatten()
-    precision, recall, _ = precision_recall_curve(gt, p)
-    Fmax = 2 * (precision * recall) / (precision + recall)
-    mae = np.mean(np.abs(p - gt))
+    try:
+      with torch.no_grad():
+        clips = self.iterate_clips(dataset)
+        if self.scheduler is not None:
+          clips = self.schedule_clips(clips)
+        for batch in self.batch_clips(clips):
+          self.process_batch(model, batch)
+    finally:
+      self.writer.close()
+
+    # with DataLoader workers, every worker has its own cache whose statistics are only recorded in the trace
+    frame_cache = getattr(dataset, 'frame_cache', None)
+    if frame_cache is not None and frame_cache.misses > 0:
+      logging.info('Frame cache: {hits} hits, {misses} misses ({hit_rate:.1%} hit rate), {evictions} evictions, '
+                   '{mb:.0f}/{max_mb:.0f} MB'.format(**frame_cache.stats()))
+    if self.profiler is not None:
+      self.finish_profiling()
+    if tracing.is_enabled():
+      self.finish_tracing()
+    self.finish_inference()
+
+  def finish_tracing(self):
+    """
+    Merges the spans recorded by the inference process, its DataLoader workers and writer threads into trace.json.
+    """
+    tracing.disable()
+    path = os.path.join(self.results_dir, 'trace.json')
+    num_events = tracing.collect(os.path.join(self.results_dir, 'trace'), path)
+    print("Wrote {} trace events to {}".format(num_events, path))
+
+  def start_profiling(self, model):
+    """
+    Attaches a ModuleProfiler to the model for the first INFERENCE.PROFILE.NUM_CLIPS forwarded clips.
+    """
+    try:
+      self.profiler = ModuleProfiler(model, list(self.cfg.INFERENCE.PROFILE.MODULES))
+    except ValueError as e:
+      logging.warning('Profiling disabled: {}'.format(e))
+
+  def finish_profiling(self):
+    """
+    Detaches the profiler, prints the per module table and writes it to profile.json in the results directory.
+    """
+    self.profiler.remove()
+    report = self.profiler.report()
+    table = self.profiler.format_table(report)
+    print(table)
+    logging.info('Module profile over {} clips:\n{}'.format(report['num_clips'], table))
+    self.profiler.save(os.path.join(self.results_dir, 'profile.json'), report)
+    self.profiler = None
+
+  def start_inference(self):
+    self.fs = AverageMeter()
+    self.maes = AverageMeter()
+    self.ious = AverageMeter()
+    self.evaluator = HistogramEvaluator(self.cfg.INFERENCE.EVAL_BINS)
+    self.video_states = {}
+    self.num_clips = 0
+    self.writer = ResultWriter(self.cfg.INFERENCE.NUM_WRITERS, self.cfg.INFERENCE.WRITER_QUEUE_SIZE)
+    keyclip_cfg = self.cfg.INFERENCE.KEYCLIP
+    self.scheduler = KeyclipScheduler(keyclip_cfg.MOTION_THRESHOLD, keyclip_cfg.DOWNSAMPLE, keyclip_cfg.MAX_SKIPPED) \
+      if keyclip_cfg.ENABLED else None
+    # agreement between the propagated and the actual masks of the redundant clips, with KEYCLIP.VALIDATE
+    self.keyclip_agreement = AverageMeter()
+    self.exit_levels = Counter()
+
+  def finish_inference(self):
+    """
+    Logs the results over all the videos. The writer has to be closed before. In a distributed run, every process
+    has to call it, since the metrics of the shards are reduced across the processes.
+    """
+    if get_world_size() > 1:
+      logging.info('Shard {}/{} F measure: {:.5f} MAE: {: 5f} IOU: {:5f}'
+                   .format(get_rank(), get_world_size(), self.evaluator.f_max(), self.evaluator.mae(), self.ious.avg))
+      self.reduce_metrics()
+    print("IOU: {}".format(self.ious.avg))
     logging.info('Finished Inference F measure: {:.5f} MAE: {: 5f} IOU: {:5f}'
-                 .format(np.max(Fmax), mae, ious.avg))
+                 .format(self.evaluator.f_max(), self.evaluator.mae(), self.ious.avg))
+    if self.scheduler is not None:
+      logging.info('Keyclip scheduling: {}/{} forwards saved ({:.2%})'.format(
+        self.scheduler.num_skipped, self.scheduler.num_clips, self.scheduler.saved_fraction()))
+      if self.keyclip_agreement.count > 0:
+        logging.info('Keyclip scheduling: mask IoU of the propagated against the forwarded clips {:.5f} '
+                     '(delta {:.5f})'.format(self.keyclip_agreement.avg, 1 - self.keyclip_agreement.avg))
+    if self.exit_threshold is not None:
+      logging.info('Early exit: {}'.format(self.format_exit_levels()))
+
+  def format_exit_levels(self):
+    num_clips = float(max(sum(self.exit_levels.values()), 1))
+    return ' '.join(['1/{}: {:.2%}'.format(2 ** level, self.exit_levels[level] / num_clips)
+                     for level in EXIT_LEVELS])
+
+  def reduce_metrics(self):
+    """
+    Sums the metric states of all the processes, so that every process ends up with the results over all the videos.
+    """
+    for meter in [self.fs, self.maes, self.ious, self.keyclip_agreement]:
+      all_reduce_meter(meter)
+    all_reduce_evaluator(self.evaluator)
+    if self.scheduler is not None:
+      self.scheduler.num_skipped, self.scheduler.num_clips = \
+        [int(v) for v in all_reduce_sum([self.scheduler.num_skipped, self.scheduler.num_clips])]
+    exit_levels = all_reduce_sum([self.exit_levels[level] for level in EXIT_LEVELS])
+    self.exit_levels = Counter(dict([(level, int(n)) for level, n in zip(EXIT_LEVELS, exit_levels)]))
+
+  def iterate_clips(self, dataset):
+    """
+    Yields the clips of all the videos in order, from a single DataLoader over the whole dataset. Each video is
+    registered with its own ClipAccumulator before its first clip is yielded. In a distributed run, every process
+    only gets its shard of the videos.
+    """
+    clip_step = 1 if self.cfg.INFERENCE.EXHAUSTIVE else self.cfg.INPUT.TW - self.cfg.INFERENCE.CLIP_OVERLAP
+    videos = dataset.get_video_ids()
+    if get_world_size() > 1:
+      videos = shard_videos(videos, dataset.num_frames, get_world_size(), get_rank())
+      logging.info('Shard {}/{}: {} videos, {} frames'.format(get_rank(), get_world_size(), len(videos),
+                                                              sum([dataset.num_frames[v] for v in videos])))
+    test_sampler = VideoClipSampler(dataset, clip_step=clip_step, videos=videos)
+    self.num_clips = len(test_sampler)
+    num_workers = test_sampler.get_num_workers(self.cfg.DATALOADER.NUM_WORKERS)
+    dataloader = iter(DataLoader(dataset, batch_size=1, num_workers=num_workers, shuffle=False, sampler=test_sampler,
+                                 pin_memory=True, collate_fn=collate_clips))
+    for video, index, _ in test_sampler.video_markers():
+      # time the inference waits for the DataLoader
+      with tracing.span('data_wait', video=video, clip=index):
+        input_dict = next(dataloader)
+      if index == 0:
+        self.start_video(video, [dataset.samples[i][INFO]['support_indices']
+                                 for i in test_sampler.clip_indices[video]])
+      yield input_dict
+
+  def schedule_clips(self, clips):
+    """
+    Marks the clips that barely differ from the last forwarded clip of their video as redundant ('reuse'), so that
+    they are not forwarded and the predictions of that clip are propagated to them.
+    """
+    for input_dict in clips:
+      input_dict['reuse'] = self.scheduler.is_redundant(input_dict['info'][0]['video'][0], input_dict['images'])
+      yield input_dict
+
+  def batch_clips(self, clips):
+    """
+    Groups consecutive clips with the same padded shape into batches of at most INFERENCE.BATCH_SIZE clips. The clips
+    of a batch can belong to different videos.
+    """
+    batch = []
+    for input_dict in clips:
+      if len(batch) > 0 and (len(batch) == self.cfg.INFERENCE.BATCH_SIZE or
+                             batch[0]['images'].shape != input_dict['images'].shape):
+        yield batch
+        batch = []
+      batch += [input_dict]
+    if len(batch) > 0:
+      yield batch
+
+  def forward(self, model, batch):
+    """
+    :return: class probabilities for the clips of the batch: B x C x TW x H x W
+    """
+    input = torch.cat([input_dict["images"] for input_dict in batch])
+    tiling = self.cfg.INFERENCE.TILING
+    # compute output
+    with self.autocast(), tracing.span('forward', clips=len(batch)):
+      if tiling.ENABLED:
+        # the tiles are moved to the device one batch at a time, the full frames stay on the host
+        tile_shape = get_tile_shape(input.shape[-2], input.shape[-1], tiling.MAX_TILE_PIXELS)
+        pred = tiled_forward(lambda tiles: self.run_model(model, tiles), input, tile_shape,
+                             overlap=tiling.OVERLAP, batch_size=tiling.BATCH_SIZE,
+                             accumulate_device='cpu' if tiling.ACCUMULATE_ON_CPU else None)
+      else:
+        pred = self.run_model(model, input)
+      if tracing.is_enabled() and self.device.type == 'cuda':
+        torch.cuda.synchronize()
+    if self.profiler is not None:
+      self.profiler.add_clips(len(batch))
+      if self.profiler.num_clips >= self.cfg.INFERENCE.PROFILE.NUM_CLIPS:
+        self.finish_profiling()
+    # pred = format_pred(pred)
+    with tracing.span('softmax'):
+      return F.softmax(pred.float(), dim=1)
+
+  def run_model(self, model, input):
+    """
+    :param input: clips on the host: B x 3 x TW x H x W
+    :return: logits of the first decoder, with the early exits of INFERENCE.EARLY_EXIT if enabled
+    """
+    input = self.prepare_input(input)
+    if self.profiler is not None:
+      self.profiler.start('total')
+    if self.exit_threshold is None:
+      pred = model(input)
+    else:
+      pred, levels = forward_early_exit(model, input, self.exit_threshold, self.cfg.INFERENCE.EARLY_EXIT.HEADS)
+      self.exit_levels.update(levels.tolist())
+    if self.profiler is not None:
+      self.profiler.stop('total', pred[0])
+    return pred[0]
+
+  def process_batch(self, model, batch):
+    # redundant clips are only forwarded to validate the keyclip scheduling
+    forward = [not input_dict.get('reuse', False) or self.cfg.INFERENCE.KEYCLIP.VALIDATE for input_dict in batch]
+    if all(forward):
+      pred_mask = self.forward(model, batch).data.cpu().float()
+    else:
+      pred_mask = [None] * len(batch)
+      if any(forward):
+        pred = self.forward(model, [input_dict for input_dict, f in zip(batch, forward) if f]).data.cpu().float()
+        for b, p in zip([b for b, f in enumerate(forward) if f], pred):
+          pred_mask[b] = p
+    self.accumulate_batch(batch, pred_mask)
+
+  def accumulate_batch(self, batch, pred_mask):
+    """
+    Adds the predictions of a batch to the accumulators of their videos, and saves the frames that are finished.
+
+    :param pred_mask: class probabilities for the clips of the batch as returned by forward. Can be None for the
+                      clips marked as redundant by the keyclip scheduling.
+    """
+    for b, input_dict in enumerate(batch):
+      info = input_dict['info'][0]
+      state = self.video_states[info['video'][0]]
+      state['info'] = info
+      clip_frames = info['support_indices'][0].data.cpu().numpy()
+      pred = pred_mask[b]
+      if input_dict.get('reuse', False):
+        propagated = propagate(*state['keyclip'], clip_frames)
+        if pred is not None:
+          self.keyclip_agreement.update(mask_agreement(propagated, pred))
+        pred = propagated
+      else:
+        state['keyclip'] = (clip_frames, pred)
+      # Use binary masks
+      target = (input_dict['target']['mask'] != 0)[0, 0].float()
+      targets = dict([(f, target[i]) for i, f in enumerate(clip_frames)
+                      if 'gt_frames' not in info or f in info['gt_frames']])
+      with tracing.span('accumulate', video=info['video'][0], frame=int(clip_frames[0])):
+        state['accumulator'].add(clip_frames, pred, targets)
+      self.process_frames(state['accumulator'].pop_finished(), state)
+      if state['accumulator'].is_complete():
+        self.finish_video(info['video'][0])
+
+  def start_video(self, video, clips):
+    """
+    :param clips: support indices of all the clips of the video that are going to be forwarded
+    """
+    # the F measure of a video is computed on the argmax predictions and its MAE on the foreground probabilities
+    self.video_states[video] = {'accumulator': ClipAccumulator(clips), 'ious': AverageMeter(),
+                                'f_evaluator': HistogramEvaluator(self.cfg.INFERENCE.EVAL_BINS),
+                                'evaluator': HistogramEvaluator(self.cfg.INFERENCE.EVAL_BINS), 'info': None,
+                                'keyclip': None}
 
-  def save_results(self, pred, targets, info):
+  def finish_video(self, video):
+    state = self.video_states.pop(video)
+    if self.scheduler is not None:
+      self.scheduler.finish_video(video)
+    self.process_frames(state['accumulator'].flush(), state)
+    # videos without ground truth, e.g. video files, are not evaluated
+    if state['ious'].count == 0:
+      logging.info('Sequence {}: no ground truth'.format(state['info']['video']))
+      return
+    self.ious.update(state['ious'].avg, 1)
+    f, mae = state['f_evaluator'].f_max(), state['evaluator'].mae()
+    self.fs.update(f)
+    self.maes.update(mae)
+    self.evaluator.merge(state['evaluator'])
+    logging.info(
+      'Sequence {}: F_max {}  MAE {} IOU {}'.format(state['info']['video'], f, mae, state['ious'].avg))
+
+  def process_frames(self, frames, state):
+    """
+    Saves the finalised frames of a video and adds the annotated ones to the evaluators of the video.
+
+    :param frames: list of (frame index, mean probabilities, target) as returned by the ClipAccumulator
+    :param state: per video state created by start_video
+    """
+    info = state['info']
+    (lh, uh), (lw, uw) = info['pad']
+    for f, prob, target in frames:
+      h, w = prob.shape[-2:]
+      self.save_results(f, prob, info)
+      if target is not None:
+        with tracing.span('metrics', frame=int(f)):
+          state['ious'].update(iou_fixed_torch(prob[None].to(self.device), target[None].to(self.device)).item(), 1)
+          prob = prob[:, lh[0]:h - uh[0], lw[0]:w - uw[0]]
+          target = target[lh[0]:h - uh[0], lw[0]:w - uw[0]]
+          state['f_evaluator'].update(torch.argmax(prob, dim=0), target)
+          state['evaluator'].update(prob[-1], target)
+
+  def save_results(self, f, prob, info):
+    """
+    Queues the frame on the background writer, which removes the padding and writes the mask to disk.
+
+    :param f: frame index
+    :param prob: padded class probabilities of the frame: C x H x W
+    """
     results_path = os.path.join(self.results_dir, info['video'][0])
-    pred_for_eval = []
-    # pred = pred.data.cpu().numpy().astype(np.uint8)
     (lh, uh), (lw, uw) = info['pad']
-    for f in pred.keys():
-      M = torch.argmax(torch.stack(pred[f]).mean(dim=0), dim=0)
-      h, w = M.shape[-2:]
-      M = M[lh[0]:h - uh[0], lw[0]:w - uw[0]]
-
-      if f in targets:
-        pred_for_eval += [torch.stack(pred[f]).mean(dim=0)[:, lh[0]:h - uh[0], lw[0]:w - uw[0]]]
-
-      shape = info['shape']
-      img_M = Image.fromarray(imresize(M.byte(), shape, interp='nearest'))
-      img_M.putpalette(color_map().flatten().tolist())
-      if not os.path.exists(results_path):
-        os.makedirs(results_path)
-      img_M.save(os.path.join(results_path, '{:05d}.png'.format(f)))
-      if self.cfg.INFERENCE.SAVE_LOGITS:
-        prob = torch.stack(pred[f]).mean(dim=0)[-1]
-        pickle.dump(prob, open(os.path.join(results_path, '{:05d}.pkl'.format(f)), 'wb'))
-
-    assert len(targets.values()) == len(pred_for_eval)
-    pred_for_F = torch.argmax(torch.stack(pred_for_eval), dim=1)
-    pred_for_mae = torch.stack(pred_for_eval)[:, -1]
-    gt = torch.stack(list(targets.values()))[:, lh[0]:h - uh[0], lw[0]:w - uw[0]]
-    precision, recall, _ = precision_recall_curve(gt.data.cpu().numpy().flatten(),
-                                                  pred_for_F.data.cpu().numpy().flatten())
-    Fmax = 2 * (precision * recall) / (precision + recall)
-    mae = (pred_for_mae - gt).abs().mean()
-
-    return Fmax.max(), mae, pred_for_mae.data.cpu().numpy().flatten(), gt.data.cpu().numpy().flatten()
+    pad = ((int(lh[0]), int(uh[0])), (int(lw[0]), int(uw[0])))
+    self.writer.put(results_path, f, prob, pad, info['shape'], self.cfg.INFERENCE.SAVE_LOGITS)
+
+  def get_eval_clip(self, input_dict):
+    """
+    :param input_dict: sample of a VideoDataset
+    :return: (input, target, annotated) for evaluate_clips, where annotated marks the frames of the clip (TW) that have
+             ground truth
+    """
+    info = input_dict['info']
+    annotated = [bool('gt_frames' not in info or f in info['gt_frames']) for f in info['support_indices']]
+    return torch.from_numpy(input_dict['images'])[None], torch.from_numpy(input_dict['target']['mask'])[None], \
+           torch.tensor(annotated, dtype=torch.bool)
+
+  def evaluate_clips(self, model, clips):
+    """
+    :param clips: list of (input, target, annotated) as returned by get_eval_clip
+    :return: mean latency per clip, and mean IoU (J) and F-max of the model on the annotated frames of the given clips
+    """
+    ious = AverageMeter()
+    latency = AverageMeter()
+    evaluator = HistogramEvaluator(self.cfg.INFERENCE.EVAL_BINS)
+    with torch.no_grad():
+      for input, target, annotated in clips:
+        start = time.time()
+        prob = F.softmax(self.run_model(model, input).float(), dim=1)
+        if self.device.type == 'cuda':
+          torch.cuda.synchronize()
+        latency.update(time.time() - start)
+        # clips without ground truth only count towards the latency
+        if not annotated.any():
+          continue
+        annotated = annotated.to(prob.device)
+        target = (target[0, 0] != 0).float().to(prob.device)[annotated]
+        prob = prob[0].transpose(0, 1)[annotated]
+        ious.update(iou_fixed_torch(prob, target).item(), 1)
+        evaluator.update(prob[:, -1], target)
+    return latency.avg, float(ious.avg), evaluator.f_max()
+
+
+class QuantizedSaliencyInferenceEngine(SaliencyInferenceEngine):
+  """
+  Runs the saliency inference with a post-training int8 quantized model on CPU. The model is calibrated on a few clips
+  of the Davis dataset and saved to INFERENCE.QUANTIZATION.ARTIFACT; if the artifact already exists, it is loaded
+  instead and the weights passed to infer() are not used.
+  """
+
+  def __init__(self, cfg, results_dir=None):
+    super(QuantizedSaliencyInferenceEngine, self).__init__(cfg, results_dir)
+    assert self.device.type == 'cpu', "Quantized inference is only supported on CPU"
+    self.artifact = cfg.INFERENCE.QUANTIZATION.ARTIFACT if cfg.INFERENCE.QUANTIZATION.ARTIFACT else \
+      os.path.join(self.results_dir, 'quantized.pt')
+
+  def prepare_model(self, model):
+    from network.quantization import quantize_network, save_quantized, load_quantized
+    backend = self.cfg.INFERENCE.QUANTIZATION.BACKEND
+    if os.path.exists(self.artifact):
+      print("Loading the quantized model from {}".format(self.artifact))
+      model = load_quantized(self.artifact, backend)
+      model.eval()
+      return model
+
+    model = super(QuantizedSaliencyInferenceEngine, self).prepare_model(model)
+    calibration_clips, eval_clips = self.get_calibration_clips()
+    fp32_results = self.evaluate_clips(model, eval_clips)
+    model = quantize_network(model, [clip for clip, _, _ in calibration_clips], backend)
+    int8_results = self.evaluate_clips(model, eval_clips)
+    for precision, (latency, j, f) in [('fp32', fp32_results), ('int8', int8_results)]:
+      logging.info('Quantization {}: latency {:.3f}s/clip J {:.5f} F {:.5f}'.format(precision, latency, j, f))
+    logging.info('Quantization change: latency {:+.3f}s/clip J {:+.5f} F {:+.5f}'.format(
+      *[int8 - fp32 for fp32, int8 in zip(fp32_results, int8_results)]))
+
+    save_quantized(model, calibration_clips[0][0], self.artifact)
+    print("Saved the quantized model to {}".format(self.artifact))
+    return model
+
+  def get_calibration_clips(self):
+    """
+    :return: two disjoint lists of (input, target, annotated) clips, spread evenly over the Davis dataset, that are
+             used for the calibration and for the comparison against fp32
+    """
+    from datasets.davis.Davis import Davis
+    from utils.util import build_dataset
+    cfg = self.cfg.clone()
+    cfg.defrost()
+    if self.cfg.INFERENCE.QUANTIZATION.CALIBRATION_ROOT:
+      cfg.DATASETS.TEST_ROOT = self.cfg.INFERENCE.QUANTIZATION.CALIBRATION_ROOT
+    dataset = build_dataset(Davis, False, cfg)
+
+    num_calibration = self.cfg.INFERENCE.QUANTIZATION.NUM_CALIBRATION_CLIPS
+    num_eval = self.cfg.INFERENCE.QUANTIZATION.NUM_EVAL_CLIPS
+    indices = np.linspace(0, len(dataset) - 1, num_calibration + num_eval).astype(np.int64)
+    # interleave the two sets so that both cover the whole dataset: the eval clips are spread evenly over the indices
+    # and the calibration clips are the others
+    eval_positions = set(np.round(np.linspace(0, len(indices) - 1, num_eval)).astype(np.int64).tolist())
+    calibration_clips, eval_clips = [], []
+    for position, i in enumerate(indices):
+      clip = self.get_eval_clip(dataset[i])
+      if position in eval_positions:
+        eval_clips += [clip]
+      else:
+        calibration_clips += [clip]
+    return calibration_clips, eval_clips
+
+
+class ScriptedSaliencyInferenceEngine(SaliencyInferenceEngine):
+  """
+  Runs the saliency inference with a network exported by --task export. The network is loaded from
+  INFERENCE.EXPORT.ARTIFACT, so it is neither constructed nor are any weights loaded.
+  """
+  REQUIRES_MODEL = False
+
+  def prepare_model(self, model):
+    from network.export import get_export_path, load_exported
+    path = get_export_path(self.cfg)
+    model, self.export_info = load_exported(path, self.device)
+    if self.export_info['tw'] != self.cfg.INPUT.TW:
+      raise ValueError("The model in {} was exported for TW {}, but INPUT.TW is {}".format(
+        path, self.export_info['tw'], self.cfg.INPUT.TW))
+    print("Loaded the exported model from {}".format(path))
+    model.eval()
+    return model
+
+  def prepare_input(self, input):
+    if list(input.shape[-2:]) != self.export_info['input_size']:
+      logging.warning('Input size {} differs from the size {} the model was exported for'.format(
+        list(input.shape[-2:]), self.export_info['input_size']))
+    return super(ScriptedSaliencyInferenceEngine, self).prepare_input(input)
+
+
+class OnnxSaliencyInferenceEngine(SaliencyInferenceEngine):
+  """
+  Runs the saliency inference with a network exported to ONNX (--task export with INFERENCE.EXPORT.FORMAT onnx)
+  through the CPU provider of onnxruntime. Neither apex nor a CUDA build of PyTorch is needed.
+  """
+  REQUIRES_MODEL = False
+
+  def __init__(self, cfg, results_dir=None):
+    super(OnnxSaliencyInferenceEngine, self).__init__(cfg, results_dir)
+    assert self.device.type == 'cpu', "The onnxruntime engine only supports the CPU provider"
+
+  def prepare_model(self, model):
+    from network.export import get_export_path, OnnxModel
+    path = get_export_path(self.cfg)
+    model = OnnxModel(path, self.cfg.INFERENCE.NUM_THREADS, self.cfg.INFERENCE.ONNX.GRAPH_OPTIMIZATION,
+                      self.cfg.INFERENCE.ONNX.OPTIMIZED_MODEL)
+    print("Loaded the ONNX model from {}".format(path))
+    return model
+
+  def prepare_input(self, input):
+    return input.float()
+
+
+class EarlyExitBenchmarkEngine(SaliencyInferenceEngine):
+  """
+  Benchmarks the early exits of INFERENCE.EARLY_EXIT instead of running the inference: INFERENCE.EARLY_EXIT.NUM_CLIPS
+  clips spread evenly over the test dataset are forwarded without early exits and then with every threshold of
+  INFERENCE.EARLY_EXIT.BENCHMARK_THRESHOLDS, and the latency, J, F and the fraction of clips per exit level are logged.
+  """
+
+  def infer(self, dataset, model):
+    model = self.prepare_model(model)
+    indices = np.linspace(0, len(dataset) - 1, self.cfg.INFERENCE.EARLY_EXIT.NUM_CLIPS).astype(np.int64)
+    clips = []
+    for i in np.unique(indices):
+      clips += [self.get_eval_clip(dataset[i])]
+
+    results = []
+    for threshold in [None] + list(self.cfg.INFERENCE.EARLY_EXIT.BENCHMARK_THRESHOLDS):
+      self.exit_threshold = threshold
+      self.exit_levels = Counter()
+      # warm up, so that the first setting is not slowed down by the allocations
+      self.evaluate_clips(model, clips[:1])
+      self.exit_levels = Counter()
+      latency, j, f = self.evaluate_clips(model, clips)
+      results += [(threshold, latency, j, f, self.format_exit_levels() if threshold is not None else '-')]
 
+    header = '{:>10} {:>12} {:>8} {:>8}   {}'.format('threshold', 'latency [s]', 'J', 'F', 'exits')
+    lines = [header] + ['{:>10} {:>12.4f} {:>8.5f} {:>8.5f}   {}'.format(
+      'off' if threshold is None else threshold, latency, j, f, exits)
+      for threshold, latency, j, f, exits in results]
+    print('\n'.join(lines))
+    for line in lines:
+      logging.info('Early exit benchmark: {}'.format(line))
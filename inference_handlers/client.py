@@ -0,0 +1,50 @@
+"""
+Minimal client for the inference server started with --task serve. Submits a job and prints its progress until it
+is finished:
+
+  python -m inference_handlers.client --input <video file or directory> --output <results directory>
+"""
+import argparse
+import json
+import os
+import time
+from urllib import request
+
+
+def post_json(url, body):
+  req = request.Request(url, data=json.dumps(body).encode('utf-8'), headers={'Content-Type': 'application/json'})
+  with request.urlopen(req) as response:
+    return json.loads(response.read().decode('utf-8'))
+
+
+def get_json(url):
+  with request.urlopen(url) as response:
+    return json.loads(response.read().decode('utf-8'))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Inference server client')
+  parser.add_argument('--input', required=True, type=str, help='video file or directory of video files')
+  parser.add_argument('--output', required=True, type=str, help='directory the masks are written to')
+  parser.add_argument('--port', default=8090, type=int)
+  parser.add_argument('--poll_interval', default=1.0, type=float)
+  args = parser.parse_args()
+
+  url = 'http://127.0.0.1:{}/jobs'.format(args.port)
+  job_id = post_json(url, {'input': os.path.abspath(args.input), 'output': os.path.abspath(args.output)})['job_id']
+  print("Submitted job {}".format(job_id))
+  while True:
+    job = get_json('{}/{}'.format(url, job_id))
+    print("Job {}: {} {}/{} clips ({:.1f}%) latency {:.2f}s".format(
+      job_id, job['status'], job['clips_done'], job['num_clips'], 100 * job['progress'], job['latency']), flush=True)
+    if job['status'] in ['done', 'failed']:
+      break
+    time.sleep(args.poll_interval)
+  if job['error'] is not None:
+    print("Job {} failed: {}".format(job_id, job['error']))
+  else:
+    print("Job {} finished in {:.2f}s (queued {:.2f}s)".format(job_id, job['latency'], job['queue_time']))
+
+
+if __name__ == '__main__':
+  main()
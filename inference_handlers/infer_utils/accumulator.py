@@ -0,0 +1,74 @@
+import bisect
+
+import numpy as np
+
+
+class ClipAccumulator():
+  """
+  Averages the per-frame class probabilities predicted by the overlapping clips of a video.
+
+  Only a running sum and a count are kept per frame. A frame is finalised as soon as none of the clips that
+  are still pending can cover it, so that the memory held stays at roughly one temporal window irrespective
+  of the length of the video.
+  """
+
+  def __init__(self, pending_clips=()):
+    """
+    :param pending_clips: support indices of every clip of the video that is going to be added
+    """
+    # the smallest frame index of each pending clip, kept sorted
+    self.pending_starts = sorted([int(np.min(clip)) for clip in pending_clips])
+    self.sums = {}
+    self.counts = {}
+    self.targets = {}
+
+  def __len__(self):
+    return len(self.sums)
+
+  def add(self, clip_frames, probs, targets=None):
+    """
+    :param clip_frames: frame indices of the clip (TW)
+    :param probs: class probabilities of the clip: C x TW x H x W
+    :param targets: dict of frame index -> target mask for the frames that have a ground truth
+    """
+    for i, f in enumerate(clip_frames):
+      f = int(f)
+      if f in self.sums:
+        self.sums[f] += probs[:, i]
+        self.counts[f] += 1
+      else:
+        self.sums[f] = probs[:, i].clone()
+        self.counts[f] = 1
+        if targets is not None and f in targets:
+          self.targets[f] = targets[f]
+
+    start = int(np.min(clip_frames))
+    pos = bisect.bisect_left(self.pending_starts, start)
+    if pos < len(self.pending_starts) and self.pending_starts[pos] == start:
+      del self.pending_starts[pos]
+
+  def is_complete(self):
+    """
+    :return: True once all the pending clips have been added
+    """
+    return len(self.pending_starts) == 0
+
+  def pop_finished(self):
+    """
+    :return: list of (frame index, mean probabilities, target or None) for the frames that no pending clip can
+             cover any more, in frame order
+    """
+    watermark = self.pending_starts[0] if len(self.pending_starts) > 0 else None
+    finished = [f for f in sorted(self.sums.keys()) if watermark is None or f < watermark]
+    return [self._pop(f) for f in finished]
+
+  def flush(self):
+    """
+    :return: all the remaining frames, irrespective of the pending clips
+    """
+    self.pending_starts = []
+    return self.pop_finished()
+
+  def _pop(self, f):
+    prob = self.sums.pop(f) / self.counts.pop(f)
+    return f, prob, self.targets.pop(f, None)
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+from utils.util import get_rank, get_world_size
+
+
+def init_inference_distributed(backend='gloo'):
+  """
+  Initialises the default process group from the environment set by torch.distributed.launch, if the inference was
+  launched with more than one process and the group does not exist yet.
+  """
+  if int(os.environ.get('WORLD_SIZE', 1)) > 1 and dist.is_available() and not dist.is_initialized():
+    dist.init_process_group(backend, init_method='env://')
+
+
+def all_reduce_sum(values):
+  """
+  :param values: list of numbers
+  :return: the element-wise sums of values over all the processes, as float64 numpy array
+  """
+  values = np.asarray(values, dtype=np.float64)
+  if get_world_size() == 1:
+    return values
+  device = torch.device('cuda') if dist.get_backend() == 'nccl' else torch.device('cpu')
+  tensor = torch.from_numpy(values).to(device)
+  dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+  return tensor.cpu().numpy()
+
+
+def all_reduce_meter(meter):
+  """
+  Sums the sum and count of an AverageMeter over all the processes, in place. A sum that is a tensor, e.g. on the GPU,
+  is converted to a float first.
+  """
+  meter.sum, meter.count = all_reduce_sum([float(meter.sum), meter.count])
+  meter.count = int(meter.count)
+  meter.avg = meter.sum / meter.count if meter.count > 0 else 0
+  return meter
+
+
+def all_reduce_evaluator(evaluator):
+  """
+  Sums the histograms and the errors of a HistogramEvaluator over all the processes, in place.
+  """
+  num_bins = evaluator.num_bins + 1
+  reduced = all_reduce_sum(np.concatenate([evaluator.pos, evaluator.neg, [evaluator.abs_error, evaluator.count]]))
+  evaluator.pos = reduced[:num_bins].astype(np.int64)
+  evaluator.neg = reduced[num_bins:2 * num_bins].astype(np.int64)
+  evaluator.abs_error = float(reduced[-2])
+  evaluator.count = int(reduced[-1])
+  return evaluator
@@ -0,0 +1,85 @@
+import numpy as np
+import torch
+
+
+class HistogramEvaluator():
+  """
+  Computes F-max and MAE of foreground scores against binary targets from running counts instead of keeping
+  every pixel around. The scores in [0, 1] are binned into num_bins + 1 bins, so that thresholds are the bin edges
+  k / num_bins and the memory held is O(num_bins) irrespective of the number of frames.
+
+  Evaluators of different videos or of different processes can be combined with merge().
+
+  Tolerance with respect to sklearn's precision_recall_curve on the raw scores, which the evaluation used before:
+
+  - MAE is exact up to float accumulation.
+  - F-max is exact for scores that lie on the bin edges, e.g. the binary argmax predictions of the per video F.
+  - Otherwise F-max is only evaluated on the thresholds k / num_bins. Every threshold k / num_bins is also a threshold
+    on the raw scores, so the binned F-max is never above the exact one. It is below by at most
+    2 * (pixels in the fullest bin) / (foreground pixels), see f_max_error_bound. An optimal raw threshold splits a
+    single bin, and moving m pixels across the threshold changes F = 2 TP / (TP + FP + P) by at most 2 m / P.
+
+  The IoU is not computed from the counts, the engine averages the per frame IoU of iou_fixed_torch instead.
+  benchmarks/checks.py compares F-max and MAE with precision_recall_curve on synthetic predictions.
+  """
+
+  def __init__(self, num_bins=1000):
+    self.num_bins = num_bins
+    self.pos = np.zeros(num_bins + 1, dtype=np.int64)
+    self.neg = np.zeros(num_bins + 1, dtype=np.int64)
+    self.abs_error = 0.0
+    self.count = 0
+
+  def update(self, scores, targets):
+    """
+    :param scores: foreground scores in [0, 1], any shape
+    :param targets: binary targets of the same shape
+    """
+    if isinstance(scores, torch.Tensor):
+      scores = scores.data.cpu().numpy()
+    if isinstance(targets, torch.Tensor):
+      targets = targets.data.cpu().numpy()
+    scores = scores.astype(np.float64).flatten()
+    targets = targets.flatten() != 0
+
+    bins = np.clip(np.floor(scores * self.num_bins), 0, self.num_bins).astype(np.int64)
+    self.pos += np.bincount(bins[targets], minlength=self.num_bins + 1)
+    self.neg += np.bincount(bins[~targets], minlength=self.num_bins + 1)
+    self.abs_error += np.abs(scores - targets).sum()
+    self.count += len(scores)
+
+  def merge(self, other):
+    assert self.num_bins == other.num_bins
+    self.pos += other.pos
+    self.neg += other.neg
+    self.abs_error += other.abs_error
+    self.count += other.count
+    return self
+
+  def precision_recall(self):
+    """
+    :return: precision and recall for the thresholds k / num_bins, k = 0..num_bins
+    """
+    # pixels with a score >= threshold k are predicted as foreground
+    tp = np.cumsum(self.pos[::-1])[::-1].astype(np.float64)
+    fp = np.cumsum(self.neg[::-1])[::-1].astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      precision = tp / (tp + fp)
+      recall = tp / tp[0]
+    return precision, recall
+
+  def f_max(self):
+    precision, recall = self.precision_recall()
+    with np.errstate(divide='ignore', invalid='ignore'):
+      f = 2 * (precision * recall) / (precision + recall)
+    return np.nanmax(f) if np.any(~np.isnan(f)) else 0.0
+
+  def mae(self):
+    return self.abs_error / max(self.count, 1)
+
+  def f_max_error_bound(self):
+    """
+    :return: upper bound of the difference between the F-max on the raw scores and f_max()
+    """
+    positives = self.pos.sum()
+    return 2.0 * (self.pos + self.neg).max() / positives if positives > 0 else 0.0
@@ -0,0 +1,74 @@
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+
+class KeyclipScheduler():
+  """
+  Decides which clips of a video have to be forwarded through the network. A clip whose frames barely differ from
+  the last forwarded clip (the keyclip) of its video is marked as redundant, and the predictions of the keyclip are
+  propagated to it instead. The motion of a clip is the largest mean absolute difference between a downsampled
+  grayscale version of its frames and of the last frame of the keyclip.
+  """
+
+  def __init__(self, motion_threshold=0.01, downsample=8, max_skipped=4):
+    """
+    :param motion_threshold: clips with a motion below this value, in [0, 1] intensity units, are redundant
+    :param downsample: downsampling factor of the frames used to compute the motion
+    :param max_skipped: maximum number of consecutive redundant clips, which bounds the drift of the propagated masks
+    """
+    self.motion_threshold = motion_threshold
+    self.downsample = downsample
+    self.max_skipped = max_skipped
+    self.keyclips = {}
+    self.num_clips = 0
+    self.num_skipped = 0
+
+  def thumbnails(self, images):
+    """
+    :param images: input clip: 1 x 3 x TW x H x W
+    :return: downsampled grayscale frames: TW x h x w
+    """
+    gray = images[0].float().mean(dim=0, keepdim=True).transpose(0, 1)
+    return F.avg_pool2d(gray, self.downsample, ceil_mode=True)[:, 0]
+
+  def is_redundant(self, video, images):
+    thumbnails = self.thumbnails(images)
+    self.num_clips += 1
+    if video in self.keyclips:
+      key_thumbnail, num_skipped = self.keyclips[video]
+      motion = (thumbnails - key_thumbnail[None]).abs().mean(dim=(1, 2)).max().item()
+      if motion < self.motion_threshold and num_skipped < self.max_skipped:
+        self.keyclips[video] = (key_thumbnail, num_skipped + 1)
+        self.num_skipped += 1
+        return True
+    self.keyclips[video] = (thumbnails[-1], 0)
+    return False
+
+  def finish_video(self, video):
+    self.keyclips.pop(video, None)
+
+  def saved_fraction(self):
+    return self.num_skipped / float(max(self.num_clips, 1))
+
+
+def propagate(key_frames, key_prob, clip_frames):
+  """
+  :param key_frames: frame indices of the keyclip (TW)
+  :param key_prob: class probabilities of the keyclip: C x TW x H x W
+  :param clip_frames: frame indices of the redundant clip
+  :return: probabilities for the redundant clip, taken from the closest frame of the keyclip: C x TW x H x W
+  """
+  key_frames = np.asarray(key_frames)
+  nearest = [int(np.argmin(np.abs(key_frames - f))) for f in clip_frames]
+  return key_prob[:, nearest]
+
+
+def mask_agreement(prob_a, prob_b):
+  """
+  :return: IoU between the foreground masks of two class probability maps of the same shape
+  """
+  a = torch.argmax(prob_a, dim=0) > 0
+  b = torch.argmax(prob_b, dim=0) > 0
+  union = (a | b).sum().item()
+  return (a & b).sum().item() / float(union) if union > 0 else 1.0
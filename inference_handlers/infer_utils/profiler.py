@@ -0,0 +1,153 @@
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from torch import nn
+
+
+def default_module_names(model):
+  """
+  :return: names of the direct children of the encoder and of every decoder, e.g. encoder.layer1 or decoders.0.RF4
+  """
+  model = getattr(model, 'module', model)
+  names = []
+  for name, child in model.named_children():
+    parents = [('{}.{}'.format(name, i), m) for i, m in enumerate(child)] if isinstance(child, nn.ModuleList) \
+      else [(name, child)]
+    for parent_name, parent in parents:
+      names += ['{}.{}'.format(parent_name, n) for n, _ in parent.named_children()]
+  return names
+
+
+def estimate_flops(module, input, output):
+  """
+  :return: estimated floating point operations of a leaf module: a multiply-add of a convolution or linear layer counts
+           as 2 FLOPs and a normalisation as 2 FLOPs per element. Other modules are not counted.
+  """
+  if not isinstance(output, torch.Tensor):
+    return 0
+  if isinstance(module, nn.modules.conv._ConvTransposeNd):
+    return 2 * input[0].numel() * module.out_channels // module.groups * int(np.prod(module.kernel_size))
+  if isinstance(module, nn.modules.conv._ConvNd):
+    return 2 * output.numel() * module.in_channels // module.groups * int(np.prod(module.kernel_size))
+  if isinstance(module, nn.Linear):
+    return 2 * output.numel() * module.in_features
+  if isinstance(module, (nn.modules.batchnorm._BatchNorm, nn.GroupNorm, nn.LayerNorm)):
+    return 2 * output.numel()
+  return 0
+
+
+def get_tensors(output):
+  if isinstance(output, torch.Tensor):
+    return [output]
+  if isinstance(output, (list, tuple)):
+    return [t for o in output for t in get_tensors(o)]
+  if isinstance(output, dict):
+    return [t for o in output.values() for t in get_tensors(o)]
+  return []
+
+
+class ModuleProfiler():
+  """
+  Records the wall time, the estimated FLOPs, the size of the output activations and the output shapes of named sub
+  modules of a network with forward hooks. The time of a module includes the time of its children. On CUDA the device
+  is synchronised around every profiled module, which slows down the forward pass while the profiler is attached.
+
+  The forward pass of the whole network is recorded as 'total' by the caller with start('total') and
+  stop('total', output), since a forward pass such as the early exits can call the sub modules without the root.
+  """
+
+  def __init__(self, model, module_names=None):
+    """
+    :param model: network to profile
+    :param module_names: names of the sub modules to profile as in model.named_modules(). Defaults to the children of
+                         the encoder and of the decoders, see default_module_names.
+    """
+    root = getattr(model, 'module', model)
+    if not isinstance(root, nn.Module):
+      raise ValueError("Only PyTorch modules can be profiled, not {}".format(root.__class__.__name__))
+    if isinstance(root, torch.jit.ScriptModule):
+      raise ValueError("Forward hooks are not supported on TorchScript modules")
+    module_names = default_module_names(root) if not module_names else module_names
+    modules = dict(root.named_modules())
+    modules['total'] = root
+    missing = [name for name in module_names if name not in modules]
+    if len(missing) > 0:
+      raise ValueError("Unknown modules {}".format(missing))
+
+    self.num_clips = 0
+    self.flops = 0
+    self.stats = OrderedDict([(name, {'type': modules[name].__class__.__name__, 'calls': 0, 'time': 0.0,
+                                      'flops': 0, 'activation_bytes': 0, 'output_shapes': []})
+                              for name in ['total'] + list(module_names)])
+    self.starts = {}
+    # the FLOPs of the leaf modules are accumulated first, the profiled modules take the difference
+    self.hooks = [m.register_forward_hook(self.count_flops) for m in root.modules() if len(list(m.children())) == 0]
+    for name in module_names:
+      module = modules[name]
+      self.hooks += [module.register_forward_pre_hook(lambda m, input, name=name: self.start(name)),
+                     module.register_forward_hook(lambda m, input, output, name=name: self.stop(name, output))]
+
+  def count_flops(self, module, input, output):
+    self.flops += estimate_flops(module, input, output)
+
+  def synchronize(self):
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+      torch.cuda.synchronize()
+
+  def start(self, name):
+    self.synchronize()
+    self.starts[name] = (time.time(), self.flops)
+
+  def stop(self, name, output):
+    self.synchronize()
+    start, flops = self.starts.pop(name)
+    tensors = get_tensors(output)
+    stats = self.stats[name]
+    stats['calls'] += 1
+    stats['time'] += time.time() - start
+    stats['flops'] += self.flops - flops
+    stats['activation_bytes'] += sum([t.numel() * t.element_size() for t in tensors])
+    stats['output_shapes'] = [list(t.shape) for t in tensors]
+
+  def add_clips(self, num_clips):
+    self.num_clips += num_clips
+
+  def remove(self):
+    for hook in self.hooks:
+      hook.remove()
+    self.hooks = []
+
+  def report(self):
+    """
+    :return: per module statistics sorted by total time, with the time, GFLOPs and activation size per call
+    """
+    total_time = max(self.stats['total']['time'], 1e-12)
+    modules = []
+    for name, stats in self.stats.items():
+      # e.g. the modules of the backbone that are not used by the encoder
+      if stats['calls'] == 0:
+        continue
+      calls = stats['calls']
+      modules += [{'name': name, 'type': stats['type'], 'calls': stats['calls'], 'time': stats['time'],
+                   'time_per_call': stats['time'] / calls, 'time_fraction': stats['time'] / total_time,
+                   'gflops_per_call': stats['flops'] / calls / 1e9,
+                   'activation_mb_per_call': stats['activation_bytes'] / calls / 2 ** 20,
+                   'output_shapes': stats['output_shapes']}]
+    return {'num_clips': self.num_clips, 'modules': sorted(modules, key=lambda m: m['time'], reverse=True)}
+
+  def format_table(self, report=None):
+    report = self.report() if report is None else report
+    lines = ['{:<24} {:<18} {:>6} {:>10} {:>7} {:>10} {:>12}  {}'.format(
+      'module', 'type', 'calls', 'ms/call', 'time', 'GFLOPs', 'act. MB', 'output shapes')]
+    for m in report['modules']:
+      lines += ['{:<24} {:<18} {:>6} {:>10.2f} {:>6.1%} {:>10.2f} {:>12.1f}  {}'.format(
+        m['name'], m['type'][:18], m['calls'], 1000 * m['time_per_call'], m['time_fraction'], m['gflops_per_call'],
+        m['activation_mb_per_call'], ' '.join(['x'.join(map(str, s)) for s in m['output_shapes']]))]
+    return '\n'.join(lines)
+
+  def save(self, path, report=None):
+    with open(path, 'w') as f:
+      json.dump(self.report() if report is None else report, f, indent=2)
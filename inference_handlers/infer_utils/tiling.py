@@ -0,0 +1,77 @@
+import math
+
+import torch
+
+
+def get_tile_shape(height, width, max_tile_pixels):
+  """
+  :return: (tile height, tile width), multiples of 32 with at most max_tile_pixels pixels, or the frame size if the
+           whole frame fits
+  """
+  if height * width <= max_tile_pixels:
+    return height, width
+  tile_h = min(height, max(32, int(math.sqrt(max_tile_pixels)) // 32 * 32))
+  tile_w = min(width, max(32, max_tile_pixels // tile_h // 32 * 32))
+  return tile_h, tile_w
+
+
+def tile_starts(size, tile, overlap):
+  """
+  :return: start offsets of the tiles along one axis. Consecutive tiles overlap by at least overlap pixels and the
+           last tile ends at the border.
+  """
+  if tile >= size:
+    return [0]
+  assert overlap < tile, "The tile overlap ({}) has to be smaller than the tile ({})".format(overlap, tile)
+  starts = list(range(0, size - tile, tile - overlap))
+  return starts + [size - tile]
+
+
+def feather(size, overlap, ramp_start, ramp_end, device=None):
+  """
+  :return: 1d blending weights of a tile, ramping up linearly over the overlap on the sides that have a neighbour
+  """
+  weights = torch.ones(size, device=device)
+  overlap = min(overlap, size)
+  if overlap > 0:
+    ramp = torch.arange(1, overlap + 1, dtype=torch.float32, device=device) / (overlap + 1)
+    if ramp_start:
+      weights[:overlap] = torch.min(weights[:overlap], ramp)
+    if ramp_end:
+      weights[-overlap:] = torch.min(weights[-overlap:], ramp.flip(0))
+  return weights
+
+
+def tiled_forward(forward, input, tile_shape, overlap=64, batch_size=1, accumulate_device=None):
+  """
+  Runs forward on overlapping spatial tiles of the input and blends the predicted logits with feathered weights, so
+  that the memory used by the network only depends on the tile size.
+
+  :param forward: function returning the logits for a batch of clips: N x C x TW x h x w
+  :param input: B x 3 x TW x H x W
+  :param tile_shape: (h, w) of the tiles, see get_tile_shape
+  :param overlap: minimum overlap in pixels between neighbouring tiles
+  :param batch_size: number of tiles forwarded at once
+  :param accumulate_device: device of the full resolution logits and weights that the tiles are blended into, e.g.
+                            'cpu' to keep only the tiles on the device. Defaults to the device of the logits.
+  :return: blended logits on accumulate_device: B x C x TW x H x W
+  """
+  B, H, W = input.shape[0], input.shape[-2], input.shape[-1]
+  tile_h, tile_w = min(tile_shape[0], H), min(tile_shape[1], W)
+  tiles = [(y, x) for y in tile_starts(H, tile_h, overlap) for x in tile_starts(W, tile_w, overlap)]
+
+  output, weight_sum = None, None
+  for i in range(0, len(tiles), batch_size):
+    chunk = tiles[i:i + batch_size]
+    pred = forward(torch.cat([input[..., y:y + tile_h, x:x + tile_w] for y, x in chunk])).float()
+    device = pred.device if accumulate_device is None else torch.device(accumulate_device)
+    pred = pred.to(device)
+    if output is None:
+      output = torch.zeros((B,) + tuple(pred.shape[1:3]) + (H, W), device=device)
+      weight_sum = torch.zeros(H, W, device=device)
+    for j, (y, x) in enumerate(chunk):
+      weights = feather(tile_h, overlap, y > 0, y + tile_h < H, device)[:, None] * \
+                feather(tile_w, overlap, x > 0, x + tile_w < W, device)[None, :]
+      output[..., y:y + tile_h, x:x + tile_w] += pred[j * B:(j + 1) * B] * weights
+      weight_sum[y:y + tile_h, x:x + tile_w] += weights
+  return output / weight_sum
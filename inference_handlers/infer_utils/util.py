@@ -2,12 +2,16 @@ from inference_handlers import BaseInferenceEngine
 from utils.util import all_subclasses
 
 
-def get_inference_engine(cfg):
+def get_inference_engine_class(cfg):
   engines = all_subclasses(BaseInferenceEngine)
   try:
     class_index = [cls.__name__ for cls in engines].index(cfg.INFERENCE.ENGINE)
   except:
     raise ValueError("Inference engine {} not found.".format(cfg.INFERENCE.ENGINE))
 
-  engine = list(engines)[class_index]
-  return engine(cfg)
\ No newline at end of file
+  return list(engines)[class_index]
+
+
+def get_inference_engine(cfg):
+  engine = get_inference_engine_class(cfg)
+  return engine(cfg)
@@ -0,0 +1,104 @@
+import os
+import pickle
+import queue
+import threading
+
+import torch
+from PIL import Image
+from scipy.misc import imresize
+
+from util import color_map
+from utils import tracing
+
+
+class ResultWriter():
+  """
+  Writes the predicted masks (and optionally the logits) of finished frames to disk from a pool of background threads,
+  so that the forward passes of the next clips do not wait for the encoding and the disk writes.
+
+  The queue is bounded: put() blocks once max_queue_size frames are waiting, which keeps the memory held by frames
+  that are not written yet bounded as well. flush() waits until every queued frame is on disk and close() stops the
+  threads. An exception raised in a writer thread is re-raised in the inference thread on the next call.
+  """
+
+  def __init__(self, num_workers=2, max_queue_size=32):
+    """
+    :param num_workers: number of writer threads. With 0 the frames are written synchronously in put()
+    :param max_queue_size: maximum number of frames waiting to be written
+    """
+    self.queue = queue.Queue(maxsize=max_queue_size)
+    self.error = None
+    self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_workers)]
+    for t in self.threads:
+      t.start()
+
+  def put(self, results_path, f, prob, pad, shape, save_logits=False):
+    """
+    :param results_path: directory of the video the frame belongs to
+    :param f: frame index
+    :param prob: padded class probabilities of the frame: C x H x W
+    :param pad: ((lh, uh), (lw, uw)) padding to remove from prob
+    :param shape: original shape of the frame the mask is resized to
+    :param save_logits: also pickle the foreground probabilities of the frame
+    """
+    self._check_error()
+    item = (results_path, f, prob, pad, shape, save_logits)
+    if len(self.threads) == 0:
+      self.write(*item)
+    else:
+      # blocks while the writers are behind
+      with tracing.span('writer_wait'):
+        self.queue.put(item)
+
+  def flush(self):
+    """
+    Blocks until all the queued frames have been written.
+    """
+    self.queue.join()
+    self._check_error()
+
+  def close(self):
+    """
+    Writes the remaining frames and stops the writer threads.
+    """
+    self.queue.join()
+    for _ in self.threads:
+      self.queue.put(None)
+    for t in self.threads:
+      t.join()
+    self.threads = []
+    self._check_error()
+
+  def write(self, results_path, f, prob, pad, shape, save_logits=False):
+    with tracing.span('save', video=os.path.basename(results_path), frame=int(f)):
+      (lh, uh), (lw, uw) = pad
+      h, w = prob.shape[-2:]
+      prob = prob[:, lh:h - uh, lw:w - uw]
+      M = torch.argmax(prob, dim=0)
+
+      img_M = Image.fromarray(imresize(M.byte(), shape, interp='nearest'))
+      img_M.putpalette(color_map().flatten().tolist())
+      os.makedirs(results_path, exist_ok=True)
+      img_M.save(os.path.join(results_path, '{:05d}.png'.format(f)))
+      if save_logits:
+        with open(os.path.join(results_path, '{:05d}.pkl'.format(f)), 'wb') as logits_file:
+          pickle.dump(prob[-1], logits_file)
+
+  def _run(self):
+    while True:
+      item = self.queue.get()
+      try:
+        if item is None:
+          return
+        # keep draining the queue after a failure so that flush() and close() do not block
+        if self.error is None:
+          self.write(*item)
+      except Exception as e:
+        self.error = e
+      finally:
+        self.queue.task_done()
+
+  def _check_error(self):
+    if self.error is not None:
+      error, self.error = self.error, None
+      raise error
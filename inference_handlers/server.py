@@ -0,0 +1,306 @@
+import contextlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+from datasets.video.VideoFile import VideoFileDataset
+from inference_handlers.infer_utils.util import get_inference_engine_class
+from utils.util import build_dataset
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class InferenceJob():
+  """
+  Inference of one video file or directory of video files, with its own engine state and result directory.
+  """
+
+  def __init__(self, job_id, input, output):
+    self.job_id = job_id
+    self.input = input
+    self.output = output
+    self.status = QUEUED
+    self.error = None
+    self.engine = None
+    # handler writing the log records of the job to output.log in its output directory
+    self.log_handler = None
+    self.clips = None
+    # next clip of the job, taken from the iterator but not forwarded yet
+    self.pending = None
+    self.num_clips = 0
+    self.clips_done = 0
+    self.submitted_at = time.time()
+    self.started_at = None
+    self.finished_at = None
+
+  def to_dict(self):
+    now = time.time()
+    return {'job_id': self.job_id, 'input': self.input, 'output': self.output, 'status': self.status,
+            'error': self.error, 'num_clips': self.num_clips, 'clips_done': self.clips_done,
+            'progress': self.clips_done / float(self.num_clips) if self.num_clips > 0 else 0.0,
+            'queue_time': (self.started_at or now) - self.submitted_at,
+            'run_time': (self.finished_at or now) - self.started_at if self.started_at is not None else 0.0,
+            'latency': (self.finished_at or now) - self.submitted_at}
+
+
+class InferenceServer():
+  """
+  Resident inference service: the model is loaded once and jobs (a video file or a directory of video files and an
+  output directory) are submitted over a local HTTP API. A scheduler thread runs up to INFERENCE.SERVER.MAX_ACTIVE_JOBS
+  jobs at a time and batches the clips of the running jobs into shared forward passes of at most INFERENCE.BATCH_SIZE
+  clips, taking the clips round-robin from the jobs. Each job logs to output.log in its output directory.
+
+  API:
+    POST /jobs {"input": <path>, "output": <directory>} -> {"job_id": <id>}
+    GET /jobs -> list of jobs
+    GET /jobs/<id> -> status, progress and latency of the job
+  """
+
+  def __init__(self, cfg, model):
+    self.cfg = cfg
+    self.engine_class = get_inference_engine_class(cfg)
+    # engine used for the shared forward passes, the jobs get their own engines for the accumulation and the results
+    self.engine = self.engine_class(cfg)
+    self.model = self.engine.prepare_model(model)
+    self.jobs = OrderedDict()
+    self.queue = []
+    # running jobs, rotated after every batch so that the batches start at a different job
+    self.active = deque()
+    # job the scheduler is working on, the log records emitted meanwhile go to the log of the job
+    self.current_job = None
+    self.job_ids = itertools.count()
+    self.lock = threading.Condition()
+    self.stopped = False
+
+  def submit(self, input, output):
+    with self.lock:
+      job = InferenceJob(str(next(self.job_ids)), input, output)
+      self.jobs[job.job_id] = job
+      self.queue += [job]
+      self.lock.notify()
+    logging.info('Job {}: queued {} -> {}'.format(job.job_id, input, output))
+    return job
+
+  def get_job(self, job_id):
+    with self.lock:
+      return self.jobs[job_id].to_dict() if job_id in self.jobs else None
+
+  def list_jobs(self):
+    with self.lock:
+      return [job.to_dict() for job in self.jobs.values()]
+
+  @contextlib.contextmanager
+  def working_on(self, job):
+    previous, self.current_job = self.current_job, job
+    try:
+      yield
+    finally:
+      self.current_job = previous
+
+  def attach_log(self, job):
+    """
+    Adds a handler to the root logger that writes the records emitted while the scheduler works on the job to
+    output.log in its output directory. The logging.basicConfig of the engines only configures the first log file.
+    """
+    if not os.path.exists(job.output):
+      os.makedirs(job.output)
+    job.log_handler = logging.FileHandler(os.path.join(job.output, 'output.log'))
+    job.log_handler.setLevel(logging.INFO)
+    job.log_handler.addFilter(lambda record: self.current_job is job)
+    logging.getLogger().addHandler(job.log_handler)
+
+  def detach_log(self, job):
+    if job.log_handler is not None:
+      logging.getLogger().removeHandler(job.log_handler)
+      job.log_handler.close()
+      job.log_handler = None
+
+  def start_job(self, job):
+    job.started_at = time.time()
+    job.status = RUNNING
+    self.attach_log(job)
+    with self.working_on(job):
+      cfg = self.cfg.clone()
+      cfg.defrost()
+      cfg.DATASETS.TEST_ROOT = job.input
+      dataset = build_dataset(VideoFileDataset, False, cfg)
+      job.engine = self.engine_class(self.cfg, results_dir=job.output)
+      job.engine.start_inference()
+      job.clips = job.engine.iterate_clips(dataset)
+
+  def finish_job(self, job, error=None):
+    with self.working_on(job):
+      if job.engine is not None:
+        try:
+          # saves the remaining frames of the job
+          job.engine.writer.close()
+          if error is None:
+            job.engine.finish_inference()
+        except Exception as e:
+          error = error or e
+      job.finished_at = time.time()
+      job.status = DONE if error is None else FAILED
+      job.error = None if error is None else repr(error)
+      logging.info('Job {}: {} after {:.2f}s'.format(job.job_id, job.status, job.finished_at - job.submitted_at))
+    self.detach_log(job)
+
+  def fail_job(self, job, error):
+    if job in self.active:
+      self.active.remove(job)
+    if job.status == RUNNING:
+      self.finish_job(job, error)
+
+  def next_clip(self, job):
+    if job.pending is None:
+      with self.working_on(job):
+        job.pending = next(job.clips, None)
+      job.num_clips = job.engine.num_clips
+    return job.pending
+
+  def collect_batch(self):
+    """
+    :return: list of (job, clip) with at most INFERENCE.BATCH_SIZE clips of the same shape, taken round-robin from the
+             active jobs. Jobs without clips left are finished and removed from the active jobs.
+
+    The batch takes the shape of the clip of the first active job. A clip of another shape stays pending and its job
+    starts the next batch, so it waits for at most one batch. Otherwise the active jobs are rotated by one.
+    """
+    batch = []
+    # first job whose clip did not match the shape of the batch
+    skipped = None
+    progress = True
+    while progress and len(batch) < self.cfg.INFERENCE.BATCH_SIZE and len(self.active) > 0:
+      progress = False
+      for job in list(self.active):
+        if len(batch) == self.cfg.INFERENCE.BATCH_SIZE:
+          break
+        try:
+          clip = self.next_clip(job)
+        except Exception as e:
+          self.fail_job(job, e)
+          continue
+        if clip is None:
+          self.active.remove(job)
+          self.finish_job(job)
+          continue
+        if len(batch) > 0 and batch[0][1]['images'].shape != clip['images'].shape:
+          skipped = skipped or job
+          continue
+        batch += [(job, clip)]
+        job.pending = None
+        progress = True
+    if skipped is not None and skipped in self.active:
+      self.active.rotate(-self.active.index(skipped))
+    else:
+      self.active.rotate(-1)
+    return batch
+
+  def run(self):
+    """
+    Scheduler loop, forwards the batches of the active jobs until stop() is called.
+    """
+    with torch.no_grad():
+      while True:
+        with self.lock:
+          while not self.stopped and len(self.queue) == 0 and len(self.active) == 0:
+            self.lock.wait()
+          if self.stopped:
+            return
+          new_jobs = self.queue[:max(self.cfg.INFERENCE.SERVER.MAX_ACTIVE_JOBS - len(self.active), 0)]
+          self.queue = self.queue[len(new_jobs):]
+        for job in new_jobs:
+          try:
+            self.start_job(job)
+            self.active += [job]
+          except Exception as e:
+            self.finish_job(job, e)
+
+        batch = self.collect_batch()
+        if len(batch) == 0:
+          continue
+        try:
+          pred_mask = self.engine.forward(self.model, [clip for _, clip in batch]).data.cpu().float()
+        except Exception as e:
+          for job in set([job for job, _ in batch]):
+            self.fail_job(job, e)
+          continue
+        for job, indices in itertools.groupby(range(len(batch)), key=lambda b: batch[b][0]):
+          indices = list(indices)
+          if job.status != RUNNING:
+            continue
+          try:
+            with self.working_on(job):
+              job.engine.accumulate_batch([batch[b][1] for b in indices], pred_mask[indices])
+            job.clips_done += len(indices)
+          except Exception as e:
+            self.fail_job(job, e)
+
+  def stop(self):
+    with self.lock:
+      self.stopped = True
+      self.lock.notify()
+
+  def serve(self):
+    host, port = '127.0.0.1', self.cfg.INFERENCE.SERVER.PORT
+    http_server = ThreadingHTTPServer((host, port), make_handler(self))
+    scheduler = threading.Thread(target=self.run, daemon=True)
+    scheduler.start()
+    print("Inference server listening on http://{}:{}".format(host, port), flush=True)
+    try:
+      http_server.serve_forever()
+    finally:
+      http_server.server_close()
+      self.stop()
+      scheduler.join()
+
+
+def make_handler(server):
+  class InferenceRequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, code, body):
+      data = json.dumps(body).encode('utf-8')
+      self.send_response(code)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(data)))
+      self.end_headers()
+      self.wfile.write(data)
+
+    def do_GET(self):
+      parts = [p for p in self.path.split('/') if p]
+      if parts == ['jobs']:
+        self.send_json(200, server.list_jobs())
+      elif len(parts) == 2 and parts[0] == 'jobs':
+        job = server.get_job(parts[1])
+        if job is None:
+          self.send_json(404, {'error': 'Unknown job {}'.format(parts[1])})
+        else:
+          self.send_json(200, job)
+      else:
+        self.send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+
+    def do_POST(self):
+      if [p for p in self.path.split('/') if p] != ['jobs']:
+        self.send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+        return
+      try:
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+        input, output = request['input'], request['output']
+      except (ValueError, KeyError) as e:
+        self.send_json(400, {'error': 'Invalid request: {}'.format(e)})
+        return
+      job = server.submit(input, output)
+      self.send_json(202, {'job_id': job.job_id})
+
+    def log_message(self, format, *args):
+      logging.info(format % args)
+
+  return InferenceRequestHandler
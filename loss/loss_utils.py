@@ -8,7 +8,8 @@ from utils.util import iou_fixed_torch
 
 def bootstrapped_ce_loss(raw_ce, n_valid_pixels_per_im=None, fraction=0.25):
   n_valid_pixels_per_im = raw_ce.shape[-1]*raw_ce.shape[-2] if n_valid_pixels_per_im is None else n_valid_pixels_per_im
-  ks = torch.max(torch.tensor(n_valid_pixels_per_im * fraction).cuda().int(), torch.tensor(1).cuda().int())
+  ks = torch.max(torch.tensor(n_valid_pixels_per_im * fraction, device=raw_ce.device).int(),
+                 torch.tensor(1, device=raw_ce.device).int())
   if len(raw_ce.shape) > 3:
     bootstrapped_loss = raw_ce.reshape(raw_ce.shape[0], raw_ce.shape[1], -1).topk(ks, dim=-1)[0].mean(dim=-1).mean()
   else:
@@ -24,7 +25,7 @@ def compute_loss(input_dict, pred_dict, target_dict, cfg):
   :param pred_dict: dictionary of predictions
   """
 
-  result = {'total_loss': torch.tensor(0).float().cuda()}
+  result = {'total_loss': torch.tensor(0).float().to(input_dict['input'].device)}
   if 'ce' in cfg.TRAINING.LOSSES.NAME:
     assert pred_dict[PRED_LOGITS] is not None
     assert target_dict['mask'] is not None
@@ -58,7 +59,7 @@ def compute_loss(input_dict, pred_dict, target_dict, cfg):
       loss = loss_image.mean()
 
     iou = calc_iou(F.softmax(raw_pred, dim=1), target)
-    iou = iou_fixed_torch(F.softmax(raw_pred, dim=1), target.float().cuda())
+    iou = iou_fixed_torch(F.softmax(raw_pred, dim=1), target.float().to(raw_pred.device))
 
     result['loss_mask'] = loss
     result['total_loss'] += loss
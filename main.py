@@ -3,16 +3,16 @@ import os
 import signal
 import time
 
-import apex
 import torch
-from apex import amp
 # from inference_handlers.inference import infer
 from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
 from torchsummary import summary
 
 from config import get_cfg
-from inference_handlers.infer_utils.util import get_inference_engine
+from datasets.utils.VideoSampler import VideoClipSampler
+from inference_handlers.infer_utils.distributed import init_inference_distributed
+from inference_handlers.infer_utils.util import get_inference_engine, get_inference_engine_class
 from loss.loss_utils import compute_loss
 # Constants
 from utils.Argparser import parse_argsV2
@@ -20,7 +20,7 @@ from utils.AverageMeter import AverageMeter, AverageMeterDict
 from utils.Saver import save_checkpointV2, load_weightsV2
 from utils.util import get_lr_schedulers, show_image_summary, get_model, cleanup_env, \
   reduce_tensor, is_main_process, synchronize, get_datasets, get_optimiser, init_torch_distributed, _find_free_port, \
-  format_pred
+  format_pred, get_test_dataset, get_world_size
 
 NUM_EPOCHS = 400
 TRAIN_KITTI = False
@@ -31,10 +31,21 @@ BEST_IOU = 0
 torch.backends.cudnn.benchmark = True
 
 
+def load_cfg(args):
+  cfg = get_cfg()
+  cfg.merge_from_file(args.config)
+  if args.device is not None:
+    cfg.INFERENCE.DEVICE = args.device
+  if args.profile is not None:
+    cfg.INFERENCE.PROFILE.NUM_CLIPS = args.profile
+  if args.trace:
+    cfg.INFERENCE.TRACE = True
+  return cfg
+
+
 class Trainer:
   def __init__(self, args, port):
-    cfg = get_cfg()
-    cfg.merge_from_file(args.config)
+    cfg = load_cfg(args)
     self.cfg = cfg
     self.port = port
     assert os.path.exists('saved_models'), "Create a path to save the trained models: <default: ./saved_models> "
@@ -47,7 +58,10 @@ class Trainer:
     self.model = get_model(cfg)
     print("Using model: {}".format(self.model.__class__), flush=True)
 
-    if torch.cuda.is_available() and torch.cuda.device_count() > 1:
+    if torch.device(cfg.INFERENCE.DEVICE).type == 'cpu':
+      assert args.task in ['infer', 'export', 'serve'], "Only the infer, export and serve tasks can be run on CPU"
+      self.model, self.optimiser = self.init_cpu(cfg)
+    elif torch.cuda.is_available() and torch.cuda.device_count() > 1:
       self.model, self.optimiser = self.init_distributed(cfg)
     # TODO: do not use distributed package in this case
     elif torch.cuda.is_available():
@@ -81,13 +95,31 @@ class Trainer:
     self.trainloader = DataLoader(self.trainset, batch_size=self.batch_size, num_workers=cfg.DATALOADER.NUM_WORKERS,
                                   shuffle=shuffle, sampler=self.train_sampler)
 
-    print(summary(self.model, tuple((3, cfg.INPUT.TW, 256, 256)), batch_size=1))
+    print(summary(self.model, tuple((3, cfg.INPUT.TW, 256, 256)), batch_size=1,
+                  device=torch.device(cfg.INFERENCE.DEVICE).type))
     # params = []
     # for key, value in dict(self.model.named_parameters()).items():
     #   if value.requires_grad:
     #     params += [{'params': [value], 'lr': args.lr, 'weight_decay': 4e-5}]
 
+  def init_cpu(self, cfg):
+    """
+    Loads the model for inference on CPU, without apex and torch distributed.
+    """
+    set_cpu_threads(cfg)
+    # videos are sharded between the processes when launched with torch.distributed.launch
+    init_inference_distributed(cfg.INFERENCE.DIST_BACKEND)
+    model = self.model
+    optimiser = get_optimiser(model, cfg)
+    model, optimiser, self.start_epoch, self.iteration = \
+      load_weightsV2(model, optimiser, args.wts, self.model_dir, map_location='cpu')
+    self.world_size = get_world_size()
+    print("Running on CPU with {} threads".format(torch.get_num_threads()))
+    return model, optimiser
+
   def init_distributed(self, cfg):
+    import apex
+    from apex import amp
     torch.cuda.set_device(args.local_rank)
     init_torch_distributed(self.port)
     model = apex.parallel.convert_syncbn_model(self.model)
@@ -113,6 +145,7 @@ class Trainer:
     return model, optimiser
 
   def train(self):
+    from apex import amp
     batch_time = AverageMeter()
     data_time = AverageMeter()
     # switch to train mode
@@ -200,68 +233,68 @@ class Trainer:
 
     end = time.time()
     print("Starting validation for epoch {}".format(self.epoch), flush=True)
-    for seq in self.testset.get_video_ids():
-      self.testset.set_video_id(seq)
-      if torch.cuda.device_count() > 1:
-        test_sampler = torch.utils.data.distributed.DistributedSampler(self.testset, shuffle=False)
-      else:
-        test_sampler = None
-      # test_sampler.set_epoch(epoch)
-      testloader = DataLoader(self.testset, batch_size=1, num_workers=1, shuffle=False, sampler=test_sampler,
-                              pin_memory=True)
-      losses_video = AverageMeterDict()
-      for i, input_dict in enumerate(testloader):
-        with torch.no_grad():
-          input = input_dict["images"]
-          target_dict = dict([(k, t.float().cuda()) for k, t in input_dict['target'].items()])
-          if 'masks_guidance' in input_dict:
-            masks_guidance = input_dict["masks_guidance"]
-            masks_guidance = masks_guidance.float().cuda()
-          else:
-            masks_guidance = None
-          info = input_dict["info"]
-          input_var = input.float().cuda()
-          # compute output
-          pred = self.model(input_var, masks_guidance)
-          pred = format_pred(pred)
-          in_dict = {"input": input_var, "guidance": masks_guidance}
-          loss_dict = compute_loss(in_dict, pred, target_dict, self.cfg)
-          total_loss = loss_dict['total_loss']
-
-          self.iteration += 1
-
-          # Average loss and accuracy across processes for logging
-          if torch.cuda.device_count() > 1:
-            reduced_loss = dict(
-              [(key, reduce_tensor(val, self.world_size).data.item()) for key, val in loss_dict.items()])
-          else:
-            reduced_loss = dict([(key, val.data.item()) for key, val in loss_dict.items()])
-
-          count = count + 1
-
-          losses_video.update(reduced_loss, args.world_size)
-          losses.update(reduced_loss, args.world_size)
-          for k, v in losses.val.items():
-            self.writer.add_scalar("loss_{}".format(k), v, self.iteration)
-
-          # if args.show_image_summary:
-          #   masks_guidance = input_dict['masks_guidance'] if 'masks_guidance' in input_dict else None
-          #   show_image_summary(count, self.writer, input_dict['images'], masks_guidance, input_dict['target'],
-          #                      pred_mask)
-
-          torch.cuda.synchronize()
-          batch_time.update((time.time() - end) / args.print_freq)
-          end = time.time()
-
-          if args.local_rank == 0:
-            loss_str = ' '.join(["{}:{:4f}({:4f})".format(k, losses_video.val[k], losses_video.avg[k])
-                                 for k, v in losses_video.val.items()])
-            print('{0}: [{1}/{2}]\t'
-                  'Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t'
-                  'LOSSES - {loss})\t'.format(
-              info[0]['video'], i * args.world_size, len(testloader) * args.world_size,
-              batch_time=batch_time, loss=loss_str),
-              flush=True)
+    if torch.cuda.device_count() > 1:
+      test_sampler = VideoClipSampler(self.testset, num_replicas=self.world_size, rank=args.local_rank)
+    else:
+      test_sampler = VideoClipSampler(self.testset)
+    # a single loader for all the videos, so that the workers prefetch across video boundaries
+    num_workers = test_sampler.get_num_workers(self.cfg.DATALOADER.NUM_WORKERS)
+    testloader = DataLoader(self.testset, batch_size=1, num_workers=num_workers, shuffle=False, sampler=test_sampler,
+                            pin_memory=True)
+    for (video, i, num_clips), input_dict in zip(test_sampler.video_markers(), testloader):
+      if i == 0:
+        losses_video = AverageMeterDict()
+      with torch.no_grad():
+        input = input_dict["images"]
+        target_dict = dict([(k, t.float().cuda()) for k, t in input_dict['target'].items()])
+        if 'masks_guidance' in input_dict:
+          masks_guidance = input_dict["masks_guidance"]
+          masks_guidance = masks_guidance.float().cuda()
+        else:
+          masks_guidance = None
+        info = input_dict["info"]
+        input_var = input.float().cuda()
+        # compute output
+        pred = self.model(input_var, masks_guidance)
+        pred = format_pred(pred)
+        in_dict = {"input": input_var, "guidance": masks_guidance}
+        loss_dict = compute_loss(in_dict, pred, target_dict, self.cfg)
+        total_loss = loss_dict['total_loss']
+
+        self.iteration += 1
+
+        # Average loss and accuracy across processes for logging
+        if torch.cuda.device_count() > 1:
+          reduced_loss = dict(
+            [(key, reduce_tensor(val, self.world_size).data.item()) for key, val in loss_dict.items()])
+        else:
+          reduced_loss = dict([(key, val.data.item()) for key, val in loss_dict.items()])
+
+        count = count + 1
+
+        losses_video.update(reduced_loss, args.world_size)
+        losses.update(reduced_loss, args.world_size)
+        for k, v in losses.val.items():
+          self.writer.add_scalar("loss_{}".format(k), v, self.iteration)
+
+        # if args.show_image_summary:
+        #   masks_guidance = input_dict['masks_guidance'] if 'masks_guidance' in input_dict else None
+        #   show_image_summary(count, self.writer, input_dict['images'], masks_guidance, input_dict['target'],
+        #                      pred_mask)
+
+        torch.cuda.synchronize()
+        batch_time.update((time.time() - end) / args.print_freq)
+        end = time.time()
+
+        if args.local_rank == 0:
+          loss_str = ' '.join(["{}:{:4f}({:4f})".format(k, losses_video.val[k], losses_video.avg[k])
+                               for k, v in losses_video.val.items()])
+          print('{0}: [{1}/{2}]\t'
+                'Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t'
+                'LOSSES - {loss})\t'.format(
+            video, i * args.world_size, num_clips * args.world_size,
+            batch_time=batch_time, loss=loss_str),
+            flush=True)
     if args.local_rank == 0:
       loss_str = ' '.join(["{}:{:4f}({:4f})".format(k, losses.val[k], losses.avg[k])
                            for k, v in losses.val.items()])
@@ -303,9 +336,36 @@ class Trainer:
     elif args.task == 'infer':
       inference_engine = get_inference_engine(self.cfg)
       inference_engine.infer(self.testset, self.model)
+    elif args.task == 'export':
+      self.export()
+    elif args.task == 'serve':
+      from inference_handlers.server import InferenceServer
+      InferenceServer(self.cfg, self.model).serve()
     else:
       raise ValueError("Unknown task {}".format(args.task))
 
+  def export(self):
+    from network.export import get_export_path, export_model, export_onnx
+    path = get_export_path(self.cfg)
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    self.model.eval()
+    model = self.model
+    optimize_cfg = self.cfg.INFERENCE.OPTIMIZE
+    if optimize_cfg.ENABLED:
+      from network.optimization import optimize_and_verify
+      input = torch.rand((1, 3, self.cfg.INPUT.TW) + tuple(optimize_cfg.INPUT_SIZE),
+                         device=next(model.parameters()).device)
+      model = optimize_and_verify(model, input, optimize_cfg.TOLERANCE, optimize_cfg.NUM_RUNS)
+    if self.cfg.INFERENCE.EXPORT.FORMAT == 'torchscript':
+      export_model(model, self.cfg.INPUT.TW, self.cfg.INFERENCE.EXPORT.INPUT_SIZE, path)
+    elif self.cfg.INFERENCE.EXPORT.FORMAT == 'onnx':
+      export_onnx(model, self.cfg.INPUT.TW, self.cfg.INFERENCE.EXPORT.INPUT_SIZE, path,
+                  self.cfg.INFERENCE.EXPORT.OPSET)
+    else:
+      raise ValueError("Unknown export format {}".format(self.cfg.INFERENCE.EXPORT.FORMAT))
+    print("Exported the model to {}".format(path))
+
   def backup_session(self, signalNumber, _):
     if is_main_process() and self.args.task == 'train':
       save_name = '{}/{}_{}.pth'.format(self.model_dir, "checkpoint", self.iteration)
@@ -328,13 +388,46 @@ def register_interrupt_signals(trainer):
   signal.signal(signal.SIGTERM, trainer.backup_session)
 
 
+def set_cpu_threads(cfg):
+  """
+  Sets the number of intra-op and inter-op threads of INFERENCE.NUM_THREADS and INFERENCE.NUM_INTEROP_THREADS for the
+  inference on CPU.
+  """
+  if cfg.INFERENCE.NUM_THREADS > 0:
+    torch.set_num_threads(cfg.INFERENCE.NUM_THREADS)
+  if cfg.INFERENCE.NUM_INTEROP_THREADS > 0:
+    torch.set_num_interop_threads(cfg.INFERENCE.NUM_INTEROP_THREADS)
+
+
+def infer_exported(cfg):
+  """
+  Runs an inference engine that loads an exported model, without building the network or initialising
+  torch distributed.
+  """
+  if torch.device(cfg.INFERENCE.DEVICE).type == 'cpu':
+    set_cpu_threads(cfg)
+  init_inference_distributed(cfg.INFERENCE.DIST_BACKEND)
+  inference_engine = get_inference_engine(cfg)
+  inference_engine.infer(get_test_dataset(cfg), None)
+  cleanup_env()
+
+
 if __name__ == '__main__':
   args = parse_argsV2()
-  port = _find_free_port()
-  trainer = Trainer(args, port)
-  register_interrupt_signals(trainer)
-  trainer.start()
-  if args.local_rank == 0:
-    trainer.backup_session(signal.SIGQUIT, None)
-  synchronize()
-  cleanup_env()
+  cfg = load_cfg(args)
+  if args.task == 'infer' and not get_inference_engine_class(cfg).REQUIRES_MODEL:
+    infer_exported(cfg)
+  elif args.task == 'serve' and not get_inference_engine_class(cfg).REQUIRES_MODEL:
+    from inference_handlers.server import InferenceServer
+    if torch.device(cfg.INFERENCE.DEVICE).type == 'cpu':
+      set_cpu_threads(cfg)
+    InferenceServer(cfg, None).serve()
+  else:
+    port = _find_free_port()
+    trainer = Trainer(args, port)
+    register_interrupt_signals(trainer)
+    trainer.start()
+    if args.local_rank == 0:
+      trainer.backup_session(signal.SIGQUIT, None)
+    synchronize()
+    cleanup_env()
@@ -8,10 +8,10 @@ from functools import partial
 __all__ = ['ResNet', 'resnet10', 'resnet18', 'resnet34', 'resnet50', 'resnet101', 'resnet152', 'resnet200']
 
 
-def conv3x3x3(in_planes, out_planes, stride=1):
+def conv3x3x3(in_planes, out_planes, stride=1, dilation=1):
     # 3x3x3 convolution with padding
     return nn.Conv3d(in_planes, out_planes, kernel_size=3,
-                     stride=stride, padding=1, bias=False)
+                     stride=stride, padding=dilation, dilation=dilation, bias=False)
 
 
 def downsample_basic_block(x, planes, stride):
@@ -19,8 +19,7 @@ def downsample_basic_block(x, planes, stride):
     zero_pads = torch.Tensor(out.size(0), planes - out.size(1),
                              out.size(2), out.size(3),
                              out.size(4)).zero_()
-    if isinstance(out.data, torch.cuda.FloatTensor):
-        zero_pads = zero_pads.cuda()
+    zero_pads = zero_pads.to(out.device)
 
     out = Variable(torch.cat([out.data, zero_pads], dim=1))
 
@@ -30,9 +29,10 @@ def downsample_basic_block(x, planes, stride):
 class BasicBlock(nn.Module):
     expansion = 1
 
-    def __init__(self, inplanes, planes, stride=1, downsample=None):
+    def __init__(self, inplanes, planes, stride=1, downsample=None, dilation=1):
         super(BasicBlock, self).__init__()
-        self.conv1 = conv3x3x3(inplanes, planes, stride)
+        # dilated like the strided convolution of Bottleneck
+        self.conv1 = conv3x3x3(inplanes, planes, stride, dilation)
         self.bn1 = nn.BatchNorm3d(planes)
         self.relu = nn.ReLU(inplace=True)
         self.conv2 = conv3x3x3(planes, planes)
@@ -242,7 +242,13 @@ def main(args):
     # Export to pytorch .pth and self-contained onnx .pb files
 
     torch.save(model.state_dict(), args.out.with_suffix(".pth"))
-    #torch.onnx.export(model, batch, args.out.with_suffix(".pb"))
+    if args.onnx:
+      # the average pooling of the classifier fixes the input to 32 x 224 x 224, only the batch size is dynamic
+      batch = torch.zeros(1, 3, 32, 224, 224)
+      model.eval()
+      torch.onnx.export(model, batch, str(args.out.with_suffix(".onnx")), input_names=['images'],
+                        output_names=['logits'], dynamic_axes={'images': {0: 'batch'}, 'logits': {0: 'batch'}},
+                        opset_version=11)
 
     # Check pth roundtrip into fresh model
 
@@ -260,5 +266,6 @@ if __name__ == "__main__":
     arg("pkl", type=Path, help=".pkl file to read the weights from")
     arg("out", type=Path, help="prefix to save converted layer weights to")
     arg("model", choices=("csn_ip", "csn_ir"), help="model type the weights belong to")
+    arg("--onnx", action="store_true", help="also export the converted network to a self-contained .onnx file")
 
     main(parser.parse_args())
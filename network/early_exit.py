@@ -0,0 +1,86 @@
+import torch
+from torch.nn import functional as F
+
+# levels of the prediction heads, the feature stride is 2 ** level. Level 2 is the full decoder.
+EXIT_LEVELS = (5, 4, 3, 2)
+
+
+def is_uniform(logits, threshold):
+  """
+  :param logits: B x C x T x h x w
+  :return: boolean tensor (B) that is True for the clips whose pixels all predict the same class with a probability of
+           at least threshold
+  """
+  confidence, label = F.softmax(logits.float(), dim=1).max(dim=1)
+  confident = confidence.flatten(1).min(dim=1)[0] >= threshold
+  label = label.flatten(1)
+  return confident & (label == label[:, :1]).all(dim=1)
+
+
+def is_graph_module(module):
+  """
+  :return: True if the module is a torch.fx GraphModule, e.g. a network optimized by network.optimization
+  """
+  try:
+    from torch.fx import GraphModule
+  except ImportError:
+    # torch.fx needs torch >= 1.8, older versions cannot have traced the module
+    return False
+  return isinstance(module, GraphModule)
+
+
+def decode_early_exit(decoder, r5, r4, r3, r2, threshold, heads=(5,)):
+  """
+  Runs Decoder3d with early exits: after each of the given coarse heads (5: 1/32, 4: 1/16, 3: 1/8), the clips whose
+  coarse prediction is confidently uniform (e.g. empty frames) leave the refinement cascade RF4 -> RF3 -> RF2 and get
+  the coarse logits upsampled to the output size instead.
+
+  :return: float32 logits of the clips: B x C x T x H x W, and the level each clip exited at (B), 2 for the full
+           decoder. The logits are float32 since under autocast the heads of different levels can return different
+           dtypes.
+  """
+  if is_graph_module(decoder) or not all([hasattr(decoder, 'pred{}'.format(level)) for level in heads]):
+    raise ValueError("Decoder {} does not support early exits".format(decoder.__class__.__name__))
+  output_size = [s * f for s, f in zip(r2.shape[2:], decoder.pred_scale_factor)]
+  x = decoder.GC(r5)
+  r = decoder.convG1(F.relu(x))
+  r = decoder.convG2(F.relu(r))
+  m = x + r  # out: 1/32, 64
+
+  output = None
+  active = torch.arange(r5.shape[0], device=r5.device)
+  levels = torch.full((r5.shape[0],), 2, dtype=torch.int64, device=r5.device)
+  for level, refine, skip in [(5, None, None), (4, decoder.RF4, r4), (3, decoder.RF3, r3), (2, decoder.RF2, r2)]:
+    if refine is not None:
+      m = refine(skip[active], m)
+    if level != 2 and level not in heads:
+      continue
+    p = getattr(decoder, 'pred{}'.format(level))(F.relu(m))
+    if level == 2:
+      done = torch.ones(len(active), dtype=torch.bool, device=p.device)
+      p = F.interpolate(p, scale_factor=decoder.pred_scale_factor, mode='trilinear')
+    else:
+      done = is_uniform(p, threshold)
+      if not done.any():
+        continue
+      p = F.interpolate(p[done], size=output_size, mode='trilinear')
+    if output is None:
+      output = torch.zeros((r5.shape[0], p.shape[1]) + tuple(output_size), dtype=torch.float32, device=p.device)
+    output[active[done]] = p.float()
+    levels[active[done]] = level
+    active, m = active[~done], m[~done]
+    if len(active) == 0:
+      break
+  return output, levels
+
+
+def forward_early_exit(model, x, threshold, heads=(5,)):
+  """
+  Forward pass of a network with an Encoder3d and a list of decoders with early exits, see decode_early_exit.
+
+  :return: list of logits of the decoders, and the exit levels of the clips for the first decoder
+  """
+  model = getattr(model, 'module', model)
+  r5, r4, r3, r2 = model.encoder(x, None)
+  outputs = [decode_early_exit(decoder, r5, r4, r3, r2, threshold, heads) for decoder in model.decoders]
+  return [p for p, _ in outputs], outputs[0][1]
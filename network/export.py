@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+
+import torch
+
+EXPORT_INFO = 'export_info.json'
+
+
+def get_export_path(cfg):
+  """
+  :return: INFERENCE.EXPORT.ARTIFACT, defaulting to saved_models/<NAME>/exported.pt (or .onnx)
+  """
+  if cfg.INFERENCE.EXPORT.ARTIFACT:
+    return cfg.INFERENCE.EXPORT.ARTIFACT
+  extension = 'onnx' if cfg.INFERENCE.EXPORT.FORMAT == 'onnx' else 'pt'
+  return os.path.join('saved_models', cfg.NAME, 'exported.{}'.format(extension))
+
+
+def export_model(model, tw, input_size, path):
+  """
+  Traces the network for a fixed temporal window and input size, freezes it and saves it as a self-contained
+  TorchScript file that can be loaded without constructing the network or loading any weights. torch.jit.freeze needs
+  PyTorch 1.8, older versions save the traced network unfrozen.
+
+  :param model: network in eval mode
+  :param tw: temporal window of the input clips
+  :param input_size: (H, W) of the padded input clips
+  :param path: output file
+  """
+  device = next(model.parameters()).device
+  example_input = torch.zeros(1, 3, tw, input_size[0], input_size[1], device=device)
+  with torch.no_grad():
+    traced = torch.jit.trace(model, example_input, strict=False)
+  if hasattr(torch.jit, 'freeze'):
+    traced = torch.jit.freeze(traced)
+  else:
+    logging.warning('torch.jit.freeze needs PyTorch 1.8 or greater, saving the traced network without freezing it')
+  info = {'tw': tw, 'input_size': list(input_size)}
+  torch.jit.save(traced, path, _extra_files={EXPORT_INFO: json.dumps(info)})
+  return traced
+
+
+def export_onnx(model, tw, input_size, path, opset_version=11):
+  """
+  Exports the network to ONNX. The batch size, height and width of the input are dynamic axes, input_size is only
+  used for the example input.
+  """
+  device = next(model.parameters()).device
+  example_input = torch.zeros(1, 3, tw, input_size[0], input_size[1], device=device)
+  with torch.no_grad():
+    torch.onnx.export(model, example_input, path, input_names=['images'], output_names=['logits'],
+                      dynamic_axes={'images': {0: 'batch', 3: 'height', 4: 'width'},
+                                    'logits': {0: 'batch', 3: 'height', 4: 'width'}},
+                      opset_version=opset_version)
+
+
+def load_exported(path, device='cpu'):
+  """
+  :return: the exported network and a dict with the temporal window and the input size it was exported for
+  """
+  extra_files = {EXPORT_INFO: ''}
+  model = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+  return model, json.loads(extra_files[EXPORT_INFO])
+
+
+class OnnxModel():
+  """
+  Runs an ONNX network with the CPU provider of onnxruntime and mimics the interface of the PyTorch network: it is
+  called with an input tensor and returns the list of predicted logits.
+  """
+  GRAPH_OPTIMIZATION_LEVELS = ['disable', 'basic', 'extended', 'all']
+
+  def __init__(self, path, num_threads=0, graph_optimization='all', optimized_model_path=''):
+    """
+    :param num_threads: number of intra-op threads, 0 keeps the onnxruntime default
+    :param graph_optimization: one of GRAPH_OPTIMIZATION_LEVELS
+    :param optimized_model_path: if set, the graph optimized by onnxruntime is saved there
+    """
+    try:
+      import onnxruntime as ort
+    except ImportError:
+      raise ImportError("OnnxSaliencyInferenceEngine needs onnxruntime, which is an optional dependency: "
+                        "pip install onnxruntime")
+    if graph_optimization not in self.GRAPH_OPTIMIZATION_LEVELS:
+      raise ValueError("Unknown graph optimization level {}".format(graph_optimization))
+    options = ort.SessionOptions()
+    options.graph_optimization_level = {'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+                                        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                                        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                                        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL}[graph_optimization]
+    if num_threads > 0:
+      options.intra_op_num_threads = num_threads
+    if optimized_model_path:
+      options.optimized_model_filepath = optimized_model_path
+    self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+    self.input_name = self.session.get_inputs()[0].name
+
+  def __call__(self, input):
+    outputs = self.session.run(None, {self.input_name: input.data.cpu().numpy().astype('float32')})
+    return [torch.from_numpy(output) for output in outputs]
+
+  def eval(self):
+    return self
@@ -24,7 +24,7 @@ class Encoder3d(nn.Module):
     if backbone.PRETRAINED_WTS:
       print('Loading pretrained weights for the backbone from {} {}{}...'.format(Constants.font.BOLD,
                                                                                  backbone.PRETRAINED_WTS, Constants.font.END))
-      chkpt = torch.load(backbone.PRETRAINED_WTS)
+      chkpt = torch.load(backbone.PRETRAINED_WTS, map_location='cpu')
       resnet.load_state_dict(chkpt)
 
     self.resnet = resnet
@@ -85,17 +85,21 @@ class Encoder3d(nn.Module):
 
 
 class Decoder3d(nn.Module):
-  def __init__(self, n_classes, inter_block, refine_block, pred_scale_factor=(1,4,4)):
+  def __init__(self, n_classes, inter_block, refine_block, pred_scale_factor=(1,4,4),
+               in_channels=(2048, 1024, 512, 256), mdim=256):
+    """
+    :param in_channels: channels of the encoder features r5, r4, r3 and r2
+    :param mdim: channels of the decoder
+    """
     super(Decoder3d, self).__init__()
-    mdim = 256
     self.pred_scale_factor = pred_scale_factor
-    self.GC = get_module(inter_block)(2048, mdim)
+    self.GC = get_module(inter_block)(in_channels[0], mdim)
     self.convG1 = nn.Conv3d(mdim, mdim, kernel_size=3, padding=1)
     self.convG2 = nn.Conv3d(mdim, mdim, kernel_size=3, padding=1)
     refine_cls = get_module(refine_block)
-    self.RF4 = refine_cls(1024, mdim)  # 1/16 -> 1/8
-    self.RF3 = refine_cls(512, mdim)  # 1/8 -> 1/4
-    self.RF2 = refine_cls(256, mdim)  # 1/4 -> 1
+    self.RF4 = refine_cls(in_channels[1], mdim)  # 1/16 -> 1/8
+    self.RF3 = refine_cls(in_channels[2], mdim)  # 1/8 -> 1/4
+    self.RF2 = refine_cls(in_channels[3], mdim)  # 1/4 -> 1
 
     self.pred5 = nn.Conv3d(mdim, n_classes, kernel_size=3, padding=1, stride=1)
     self.pred4 = nn.Conv3d(mdim, n_classes, kernel_size=3, padding=1, stride=1)
@@ -127,8 +131,12 @@ class SaliencyNetwork(BaseNetwork):
   def __init__(self, cfg):
     super(SaliencyNetwork, self).__init__()
     self.encoder = Encoder3d(cfg.MODEL.BACKBONE, cfg.INPUT.TW, cfg.MODEL.PIXEL_MEAN, cfg.MODEL.PIXEL_STD)
+    # 2048, 1024, 512, 256 for the bottleneck backbones, 512, 256, 128, 64 for resnet10 - resnet34
+    expansion = self.encoder.layer1[0].expansion
+    in_channels = [planes * expansion for planes in [512, 256, 128, 64]]
     decoders = [Decoder3d(cfg.MODEL.N_CLASSES, inter_block=cfg.MODEL.DECODER.INTER_BLOCK,
-                             refine_block=cfg.MODEL.DECODER.REFINE_BLOCK)]
+                             refine_block=cfg.MODEL.DECODER.REFINE_BLOCK, in_channels=in_channels,
+                             mdim=cfg.MODEL.DECODER.MDIM)]
     self.decoders = nn.ModuleList()
     for decoder in decoders:
       self.decoders.append(decoder)
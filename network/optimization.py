@@ -0,0 +1,120 @@
+import copy
+import logging
+import time
+
+import torch
+from torch import nn
+
+
+def prune_graph(module):
+  """
+  Traces the module with Conv3d + BatchNorm3d folded and removes the nodes whose result is not used, together with
+  the sub modules that are no longer called, e.g. the pred5, pred4 and pred3 heads of the decoders.
+  """
+  try:
+    from torch.fx.experimental.optimization import fuse
+  except ImportError:
+    raise ImportError("INFERENCE.OPTIMIZE traces the network with torch.fx, which needs PyTorch 1.8 or greater, but "
+                      "PyTorch {} is installed".format(torch.__version__))
+  module = fuse(module)
+  module.graph.eliminate_dead_code()
+  module.delete_all_unused_submodules()
+  module.recompile()
+  return module
+
+
+class OptimizedEncoder3d(nn.Module):
+  """
+  Inference version of Encoder3d without the guidance input. The input normalisation is a single multiply-add and
+  every BatchNorm3d of the backbone is folded into the preceding Conv3d.
+  """
+
+  def __init__(self, encoder):
+    super(OptimizedEncoder3d, self).__init__()
+    # ((x * 255 - mean) / std) / 255 == x * scale + shift
+    self.register_buffer('scale', 1.0 / encoder.std)
+    self.register_buffer('shift', -encoder.mean / (255.0 * encoder.std))
+    self.stem = prune_graph(nn.Sequential(encoder.conv1, encoder.bn1, encoder.relu, encoder.maxpool))
+    self.layer1 = prune_graph(encoder.layer1)
+    self.layer2 = prune_graph(encoder.layer2)
+    self.layer3 = prune_graph(encoder.layer3)
+    self.layer4 = prune_graph(encoder.layer4)
+
+  def forward(self, in_f):
+    x = self.stem(torch.addcmul(self.shift, in_f, self.scale))  # 1/4, 64
+    r2 = self.layer1(x)  # 1/4, 64
+    r3 = self.layer2(r2)  # 1/8, 128
+    r4 = self.layer3(r3)  # 1/16, 256
+    r5 = self.layer4(r4)  # 1/32, 512
+    return r5, r4, r3, r2
+
+
+class OptimizedNetwork(nn.Module):
+  """
+  Inference version of a network with an Encoder3d and a list of decoders (SaliencyNetwork, Resnet3d101 and its
+  subclasses), created by optimize_network. It returns the same predictions, but does not take a guidance input.
+  """
+
+  def __init__(self, model):
+    super(OptimizedNetwork, self).__init__()
+    self.encoder = OptimizedEncoder3d(model.encoder)
+    self.decoders = nn.ModuleList([prune_graph(decoder) for decoder in model.decoders])
+
+  def forward(self, x, ref=None):
+    assert ref is None, "The optimized network does not support a guidance input"
+    r5, r4, r3, r2 = self.encoder(x)
+    return [decoder(r5, r4, r3, r2, None) for decoder in self.decoders]
+
+
+def optimize_network(model):
+  """
+  Folds the BatchNorm3d layers into the preceding convolutions, drops the unused prediction heads of the decoders and
+  merges the input normalisation into a single op.
+
+  :param model: network in eval mode, it is not modified
+  :return: OptimizedNetwork on the device of the model
+  """
+  model = getattr(model, 'module', model)
+  assert not model.training, "BatchNorm can only be folded in eval mode"
+  encoder_attrs = ['conv1', 'bn1', 'relu', 'maxpool', 'layer1', 'layer2', 'layer3', 'layer4', 'mean', 'std']
+  if not hasattr(model, 'decoders') or not all([hasattr(model.encoder, attr) for attr in encoder_attrs]):
+    raise ValueError("Network {} cannot be optimized".format(model.__class__.__name__))
+  optimized = OptimizedNetwork(copy.deepcopy(model))
+  optimized.eval()
+  return optimized
+
+
+def time_network(model, input, num_runs):
+  with torch.no_grad():
+    model(input)
+    if input.is_cuda:
+      torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(num_runs):
+      model(input)
+    if input.is_cuda:
+      torch.cuda.synchronize()
+  return (time.time() - start) / num_runs
+
+
+def optimize_and_verify(model, input, tolerance=1e-3, num_runs=3):
+  """
+  Optimizes the network with optimize_network, checks that the optimized network predicts the same logits as the
+  original one on the given input, and logs the speedup.
+
+  :param input: example clip on the device of the model: B x 3 x TW x H x W
+  :param tolerance: maximum absolute difference allowed between the logits of the two networks
+  :return: the optimized network
+  """
+  optimized = optimize_network(model)
+  with torch.no_grad():
+    max_diff = max([(p - p_opt).abs().max().item() for p, p_opt in zip(model(input), optimized(input))])
+  if max_diff > tolerance:
+    raise RuntimeError("The optimized network differs from the original one by {} (tolerance {})"
+                       .format(max_diff, tolerance))
+  latency, optimized_latency = time_network(model, input, num_runs), time_network(optimized, input, num_runs)
+  message = 'Network optimization: max logit difference {:.2e}, latency {:.3f}s -> {:.3f}s/clip ({:.2f}x)'.format(
+    max_diff, latency, optimized_latency, latency / optimized_latency)
+  print(message)
+  logging.info(message)
+  return optimized
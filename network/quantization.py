@@ -0,0 +1,80 @@
+import torch
+from torch.nn import functional as F
+
+try:
+  from torch.ao.quantization import get_default_qconfig_mapping
+  from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+except ImportError:
+  raise ImportError("The post-training quantization needs torch.ao.quantization of PyTorch 1.13 or greater, but "
+                    "PyTorch {} is installed".format(torch.__version__))
+
+
+def get_quantizable_modules(model):
+  """
+  :param model: SaliencyNetwork
+  :return: list of (parent module, attribute name) of the sub modules that are quantized. The residual stages of the
+           backbone and the decoders are traced separately, since Encoder3d.forward branches on its optional guidance
+           input and cannot be traced as a whole. The stem convolution and the input normalisation stay in fp32.
+  """
+  encoder = model.encoder
+  modules = [(encoder, name) for name in ['layer1', 'layer2', 'layer3', 'layer4']]
+  modules += [(model.decoders, str(i)) for i in range(len(model.decoders))]
+  return modules
+
+
+def quantize_network(model, calibration_inputs, backend='fbgemm'):
+  """
+  Post-training static int8 quantization of a SaliencyNetwork for CPU inference. Conv3d + BatchNorm3d (+ ReLU) are
+  fused and the activation ranges are calibrated by forwarding calibration_inputs through the model.
+
+  :param model: SaliencyNetwork in eval mode on CPU. It is modified in place.
+  :param calibration_inputs: list of input clips: B x 3 x TW x H x W
+  :param backend: quantized engine, fbgemm (x86) or qnnpack (ARM)
+  :return: the quantized model
+  """
+  assert len(calibration_inputs) > 0, "At least one calibration clip is needed"
+  torch.backends.quantized.engine = backend
+  # trilinear upsampling has no quantized kernel, keep it in fp32
+  qconfig_mapping = get_default_qconfig_mapping(backend).set_object_type(F.interpolate, None)
+  modules = get_quantizable_modules(model)
+
+  # record the inputs of every sub module, which are needed as example inputs for tracing. The stages of the backbone
+  # are called as modules and recorded with hooks, but the networks call decoder.forward directly, which bypasses the
+  # hooks, so the decoders get the encoder features instead
+  example_inputs = {}
+  hooks = [getattr(parent, name).register_forward_pre_hook(
+    lambda module, args, key=(id(parent), name): example_inputs.setdefault(key, args))
+    for parent, name in modules if parent is model.encoder]
+  with torch.no_grad():
+    r5, r4, r3, r2 = model.encoder(calibration_inputs[0])
+  for hook in hooks:
+    hook.remove()
+  for i in range(len(model.decoders)):
+    example_inputs[(id(model.decoders), str(i))] = (r5, r4, r3, r2, None)
+
+  for parent, name in modules:
+    prepared = prepare_fx(getattr(parent, name), qconfig_mapping, example_inputs[(id(parent), name)])
+    setattr(parent, name, prepared)
+
+  with torch.no_grad():
+    for input in calibration_inputs:
+      model(input)
+
+  for parent, name in modules:
+    setattr(parent, name, convert_fx(getattr(parent, name)))
+  return model
+
+
+def save_quantized(model, example_input, path):
+  """
+  Traces the quantized model and saves it as a self-contained TorchScript file.
+  """
+  with torch.no_grad():
+    traced = torch.jit.trace(model, example_input, strict=False)
+  torch.jit.save(traced, path)
+  return traced
+
+
+def load_quantized(path, backend='fbgemm'):
+  torch.backends.quantized.engine = backend
+  return torch.jit.load(path, map_location='cpu')
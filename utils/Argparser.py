@@ -19,6 +19,16 @@ def parse_argsV2():
                       help='num_workers',
                       default=4, type=int)
   parser.add_argument('--local_rank', type=int, default=0)
+  parser.add_argument('--device', dest='device',
+                      help='device used for inference, overrides INFERENCE.DEVICE',
+                      default=None, type=str)
+  parser.add_argument('--profile', dest='profile',
+                      help='profile the modules of the network on the first <profile> clips of the inference, '
+                           'overrides INFERENCE.PROFILE.NUM_CLIPS',
+                      default=None, type=int)
+  parser.add_argument('--trace', dest='trace',
+                      help='record the stages of the inference pipeline to a Chrome trace, sets INFERENCE.TRACE',
+                      action='store_true')
   parser.add_argument('--print_freq', dest='print_freq',
                       help='Frequency of statistics printing',
                       default=1, type=int)
@@ -28,7 +38,7 @@ def parse_argsV2():
                       default=None, type=str)
 
   parser.add_argument('--task', dest='task',
-                      help='task in <train, eval>',
+                      help='task in <train, eval, infer, export, serve>',
                       default='train', type=str)
   parser.add_argument('--pretrained', dest='pretrained',
                       help='load pretrained weights for PWCNet',
@@ -22,6 +22,10 @@ class ResizeMode(Enum):
   RESIZE_SHORT_EDGE_AND_CROP = "resize_short_edge_and_crop"
 
 
+# modes whose output only depends on the input, i.e. without random scales or crops
+DETERMINISTIC_RESIZE_MODES = (ResizeMode.UNCHANGED, ResizeMode.FIXED_SIZE, ResizeMode.RESIZE_SHORT_EDGE)
+
+
 def resize(tensors, resize_mode, size):
   if resize_mode == ResizeMode.UNCHANGED:
     if tensors['image'].max() <= 1:
@@ -10,7 +10,7 @@ import utils.Constants as Constants
 from utils.util import ToLabel
 
 
-def load_weightsV2(model, optimiser, wts_file, model_dir):
+def load_weightsV2(model, optimiser, wts_file, model_dir, map_location=None):
   start_epoch = 0
   start_iter = 0
   state = model.state_dict()
@@ -24,11 +24,11 @@ def load_weightsV2(model, optimiser, wts_file, model_dir):
       chkpts.sort()
       load_name = chkpts[-1]
       print('Loading checkpoint {}@Epoch {}{}...'.format(Constants.font.BOLD, load_name, Constants.font.END))
-      checkpoint = torch.load(load_name)
+      checkpoint = torch.load(load_name, map_location=map_location)
       start_epoch = checkpoint['epoch'] + 1
       start_iter = checkpoint['iter'] + 1
   else:
-    checkpoint = torch.load(wts_file)
+    checkpoint = torch.load(wts_file, map_location=map_location)
     start_epoch = checkpoint['epoch'] + 1 if 'epoch' in checkpoint else 0
     start_iter = checkpoint['iter'] + 1 if 'iter' in checkpoint else 0
     load_name = wts_file
@@ -0,0 +1,100 @@
+"""
+Stage level tracing of the inference pipeline in the Chrome trace event format, which can be opened in
+chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is enabled for the current process and the processes started from it (e.g. the DataLoader workers) by
+enable(), which sets the TRACE_DIR environment variable. Every process appends its spans to its own file in that
+directory as they finish, so that no events are lost when a worker exits, and collect() merges the files into a
+single trace.
+"""
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+TRACE_DIR = 'TRACE_DIR'
+
+_files = {}
+_lock = threading.Lock()
+
+
+def enable(trace_dir):
+  if not os.path.exists(trace_dir):
+    os.makedirs(trace_dir)
+  for f in glob.glob(os.path.join(trace_dir, '*.jsonl')):
+    os.remove(f)
+  os.environ[TRACE_DIR] = trace_dir
+
+
+def disable():
+  os.environ.pop(TRACE_DIR, None)
+
+
+def is_enabled():
+  return TRACE_DIR in os.environ
+
+
+def _write(event):
+  pid = os.getpid()
+  with _lock:
+    # a forked worker inherits the file of its parent, every process opens its own
+    if pid not in _files:
+      _files[pid] = open(os.path.join(os.environ[TRACE_DIR], '{}.jsonl'.format(pid)), 'a')
+      _files[pid].write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                                    'args': {'name': multiprocessing.current_process().name}}) + '\n')
+    _files[pid].write(json.dumps(event) + '\n')
+    _files[pid].flush()
+
+
+@contextlib.contextmanager
+def span(name, **args):
+  """
+  Records the time spent in the with block as a complete event of the current process and thread.
+
+  :param args: shown with the event in the trace viewer, e.g. the video and the frame of a clip
+  """
+  if not is_enabled():
+    yield
+    return
+  start = time.time()
+  try:
+    yield
+  finally:
+    _write({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': (time.time() - start) * 1e6, 'pid': os.getpid(),
+            'tid': threading.get_ident(), 'args': args})
+
+
+def counter(name, **values):
+  """
+  Records the current values of a counter of the current process, shown as a graph over time in the trace viewer.
+  """
+  if not is_enabled():
+    return
+  _write({'name': name, 'ph': 'C', 'ts': time.time() * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident(),
+          'args': values})
+
+
+def close():
+  with _lock:
+    for f in _files.values():
+      f.close()
+    _files.clear()
+
+
+def collect(trace_dir, path):
+  """
+  Merges the events written by all the processes to trace_dir into a Chrome trace file and removes the per process
+  files.
+  """
+  close()
+  events = []
+  for f in sorted(glob.glob(os.path.join(trace_dir, '*.jsonl'))):
+    with open(f) as lines:
+      events += [json.loads(line) for line in lines if line.strip()]
+    os.remove(f)
+  with open(path, 'w') as f:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+  return len(events)
@@ -65,7 +65,7 @@ def iou_fixed_torch(pred, gt, exclude_last=False):
     i = ((pred[t] > 0) * (gt[t] > 0)).float().sum()
     u = ((pred[t] + gt[t]) > 0).float().sum()
     if u == 0:
-      iou = torch.cuda.FloatTensor([1.0]).sum()
+      iou = torch.ones(1, device=pred.device).sum()
     else:
       iou = i.float() / u.float()
     ious.append(iou.float())
@@ -162,26 +162,27 @@ def get_model_from_args(args, network_models):
   return model
 
 
-def get_datasets(cfg):
+def get_dataset_class(name):
   dataset_classes = all_subclasses(BaseDataset)
   try:
-    class_index = [cls.__name__ for cls in dataset_classes].index(cfg.DATASETS.TRAIN)
+    class_index = [cls.__name__ for cls in dataset_classes].index(name)
   except:
-    raise ValueError("Dataset {} not found.".format(cfg.DATASETS.TRAIN))
+    raise ValueError("Dataset {} not found.".format(name))
 
-  train_dataset_class = list(dataset_classes)[class_index]
-  train_dataset = build_dataset(train_dataset_class, True, cfg)
+  return list(dataset_classes)[class_index]
 
-  try:
-    class_index = [cls.__name__ for cls in dataset_classes].index(cfg.DATASETS.TEST)
-  except:
-    raise ValueError("Dataset {} not found.".format(cfg.DATASETS.TEST))
-  test_dataset_class = list(dataset_classes)[class_index]
-  test_dataset = build_dataset(test_dataset_class, False, cfg)
+
+def get_datasets(cfg):
+  train_dataset = build_dataset(get_dataset_class(cfg.DATASETS.TRAIN), True, cfg)
+  test_dataset = get_test_dataset(cfg)
 
   return train_dataset, test_dataset
 
 
+def get_test_dataset(cfg):
+  return build_dataset(get_dataset_class(cfg.DATASETS.TEST), False, cfg)
+
+
 def build_dataset(_class, is_train, cfg):
   spec = inspect.signature(_class.__init__)
   fn_args = spec._parameters
@@ -206,6 +207,11 @@ def build_dataset(_class, is_train, cfg):
   print("Dataset parameters {} are missing in the config file.".format(missing_params))
   # params['random_instance'] = cfg.DATASETS.RANDOM_INSTANCE
   dataset = _class(**params)
+  frame_store = cfg.DATASETS.TRAIN_FRAME_STORE if is_train else cfg.DATASETS.TEST_FRAME_STORE
+  if frame_store:
+    dataset.enable_frame_store(frame_store)
+  if cfg.DATASETS.FRAME_CACHE_MB > 0:
+    dataset.enable_frame_cache(cfg.DATASETS.FRAME_CACHE_MB * 2 ** 20)
 
   return dataset
 
@@ -240,8 +246,9 @@ def init_torch_distributed(port):
   #port = _find_free_port()
   print("Using port {} for torch distributed.".format(port))
   if torch.cuda.is_available() and torch.cuda.device_count() > 1:
-    os.environ['MASTER_ADDR'] = 'localhost'
-    os.environ['MASTER_PORT'] = str(port)
+    # keep the address set by torch.distributed.launch, every process would pick a different free port otherwise
+    os.environ.setdefault('MASTER_ADDR', 'localhost')
+    os.environ.setdefault('MASTER_PORT', str(port))
     torch.distributed.init_process_group(
       'nccl',
       init_method='env://',
@@ -266,6 +273,14 @@ def get_rank():
   return dist.get_rank()
 
 
+def get_world_size():
+  if not dist.is_available():
+    return 1
+  if not dist.is_initialized():
+    return 1
+  return dist.get_world_size()
+
+
 def is_main_process():
   return get_rank() == 0
 
@@ -291,6 +306,10 @@ def cleanup_env():
 
   :return:
   """
+  if not dist.is_available():
+    return
+  if not dist.is_initialized():
+    return
   print("Destroying distributed processes.")
   torch.distributed.destroy_process_group()
 